@@ -0,0 +1,251 @@
+"""
+图片转换模块
+把 custom 布局中的图片元素（logo、危险品标志等）转换为打印机的 1 位点阵
+
+- 按图片自带的 DPI 换算为打印机分辨率（DPI_RATIO），也可以指定目标尺寸（dots）
+- 黑白化：阈值、有序抖动（Bayer 8×8）使用 NumPy 向量化计算，
+  误差扩散（Floyd–Steinberg）使用 Pillow 内置的 C 实现
+- 每行打包为 TSPL BITMAP 数据（位为 0 的点打印为黑色）
+- 转换结果按 (内容哈希, 尺寸, 黑白化方式) 缓存，重复的 logo 只转换一次；
+  需要时可以下载到打印机内存（DOWNLOAD），之后每张标签只发送 PUTBMP
+"""
+import base64
+import binascii
+import hashlib
+import io
+import os
+import struct
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+
+from config import DPI_RATIO, IMAGE_CACHE_SIZE, IMAGE_DIR, IMAGE_MAX_BYTES, IMAGE_MAX_DOTS, IMAGE_MAX_PIXELS
+
+# Bayer 8×8 有序抖动矩阵，归一化到 (0, 255)
+_BAYER = np.array([
+    [0, 32, 8, 40, 2, 34, 10, 42],
+    [48, 16, 56, 24, 50, 18, 58, 26],
+    [12, 44, 4, 36, 14, 46, 6, 38],
+    [60, 28, 52, 20, 62, 30, 54, 22],
+    [3, 35, 11, 43, 1, 33, 9, 41],
+    [51, 19, 59, 27, 49, 17, 57, 25],
+    [15, 47, 7, 39, 13, 45, 5, 37],
+    [63, 31, 55, 23, 61, 29, 53, 21],
+], dtype=np.float32) * 4 + 2
+
+
+class ImageError(ValueError):
+    """图片无法读取或转换"""
+
+
+class Bitmap:
+    """
+    转换后的 1 位点阵
+
+    - width / height: 尺寸（dots）
+    - data: 按行打包的点阵（每行 width_bytes 字节，位为 0 的点打印为黑色）
+    - name: 下载到打印机内存时使用的文件名（由内容哈希生成）
+    """
+
+    def __init__(self, width: int, height: int, data: bytes, digest: str):
+        self.width = width
+        self.height = height
+        self.width_bytes = (width + 7) // 8
+        self.data = data
+        self.name = f"{digest[:8].upper()}.BMP"
+
+    def bitmap_command(self, x: int, y: int) -> bytes:
+        """直接打印的 BITMAP 命令（二进制）"""
+        return f"BITMAP {x},{y},{self.width_bytes},{self.height},0,".encode("ascii") + self.data
+
+    def download_command(self) -> bytes:
+        """把点阵作为 BMP 文件下载到打印机内存的 DOWNLOAD 命令（二进制）"""
+        bmp = self.to_bmp()
+        return f'DOWNLOAD "{self.name}",{len(bmp)},'.encode("ascii") + bmp
+
+    def putbmp_command(self, x: int, y: int) -> str:
+        """打印已下载到打印机内存的点阵"""
+        return f'PUTBMP {x},{y},"{self.name}"'
+
+    def to_bmp(self) -> bytes:
+        """转换为 1 位 BMP 文件（调色板 0 为黑、1 为白，与 BITMAP 数据的位含义一致）"""
+        stride = (self.width_bytes + 3) // 4 * 4
+        rows = np.frombuffer(self.data, dtype=np.uint8).reshape(self.height, self.width_bytes)
+        padded = np.full((self.height, stride), 0xFF, dtype=np.uint8)
+        padded[:, :self.width_bytes] = rows
+        pixels = padded[::-1].tobytes()  # BMP 按从下到上的顺序存储
+
+        header_size = 14 + 40 + 8
+        return (
+            struct.pack("<2sIHHI", b"BM", header_size + len(pixels), 0, 0, header_size)
+            + struct.pack("<IiiHHIIiiII", 40, self.width, self.height, 1, 1, 0, len(pixels),
+                          int(DPI_RATIO * 1000), int(DPI_RATIO * 1000), 2, 2)
+            + b"\x00\x00\x00\x00\xff\xff\xff\x00"
+            + pixels
+        )
+
+
+_lock = threading.Lock()
+_cache: "OrderedDict[tuple, Bitmap]" = OrderedDict()
+_hits = 0
+_misses = 0
+
+
+def read_source(path: Optional[str] = None, data: Optional[str] = None) -> bytes:
+    """
+    读取图片内容
+
+    Args:
+        path: IMAGE_DIR 下的图片文件路径（相对路径）
+        data: base64 编码的图片内容（可以带 data:image/...;base64, 前缀）
+
+    Returns:
+        图片文件内容
+
+    Raises:
+        ImageError: 未提供来源、文件不存在或不在 IMAGE_DIR 下、base64 格式错误、超过 IMAGE_MAX_BYTES
+    """
+    if data is not None:
+        if data.startswith("data:"):
+            data = data.partition(",")[2]
+        try:
+            content = base64.b64decode(data, validate=True)
+        except (binascii.Error, ValueError):
+            raise ImageError("图片 data 不是有效的 base64")
+    elif path is not None:
+        root = os.path.realpath(IMAGE_DIR)
+        full_path = os.path.realpath(os.path.join(root, path))
+        if os.path.commonpath([root, full_path]) != root:
+            raise ImageError(f"图片路径必须位于图片目录 {IMAGE_DIR} 下: {path}")
+        if not os.path.isfile(full_path):
+            raise ImageError(f"图片文件不存在: {path}")
+        if os.path.getsize(full_path) > IMAGE_MAX_BYTES:
+            raise ImageError(f"图片文件超过 {IMAGE_MAX_BYTES} 字节: {path}")
+        with open(full_path, "rb") as f:
+            content = f.read()
+    else:
+        raise ImageError("图片元素需要提供 path 或 data")
+
+    if len(content) > IMAGE_MAX_BYTES:
+        raise ImageError(f"图片超过 {IMAGE_MAX_BYTES} 字节")
+    return content
+
+
+def convert(
+    content: bytes,
+    width: int = None,
+    height: int = None,
+    dither: str = "threshold",
+    threshold: int = 128
+) -> Bitmap:
+    """
+    把图片转换为 1 位点阵（按内容哈希缓存）
+
+    Args:
+        content: 图片文件内容
+        width: 目标宽度（dots），只提供宽高之一时按比例缩放；都不提供时按图片 DPI 换算
+        height: 目标高度（dots）
+        dither: threshold（阈值）/ ordered（有序抖动）/ diffusion（误差扩散）
+        threshold: 阈值（0-255，仅 threshold），灰度低于该值的点打印为黑色
+
+    Returns:
+        点阵
+
+    Raises:
+        ImageError: 图片无法解码或尺寸超过 IMAGE_MAX_DOTS
+    """
+    global _hits, _misses
+    digest = hashlib.sha256(content).hexdigest()
+    key = (digest, width, height, dither, threshold if dither == "threshold" else None)
+    with _lock:
+        bitmap = _cache.get(key)
+        if bitmap is not None:
+            _cache.move_to_end(key)
+            _hits += 1
+            return bitmap
+        _misses += 1
+
+    gray = _load_gray(content, width, height)
+    black = _to_black(gray, dither, threshold)
+    name_digest = hashlib.sha256(repr(key).encode("ascii")).hexdigest()
+    bitmap = Bitmap(black.shape[1], black.shape[0], _pack_rows(black), name_digest)
+
+    with _lock:
+        _cache[key] = bitmap
+        while len(_cache) > IMAGE_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return bitmap
+
+
+def _load_gray(content: bytes, width: Optional[int], height: Optional[int]) -> np.ndarray:
+    """解码图片，透明部分按白色处理，缩放到目标尺寸，返回灰度数组（0 黑 - 255 白）"""
+    try:
+        # open 只读取文件头，解码前先按声明的尺寸检查像素数
+        image = Image.open(io.BytesIO(content))
+        if image.size[0] * image.size[1] > IMAGE_MAX_PIXELS:
+            raise ImageError(f"图片像素数 {image.size[0]}×{image.size[1]} 超过 {IMAGE_MAX_PIXELS}")
+        image.load()
+    except (Image.DecompressionBombError, Image.DecompressionBombWarning) as e:
+        raise ImageError(f"图片像素数过大: {e}")
+    except (UnidentifiedImageError, OSError) as e:
+        raise ImageError(f"图片无法解码: {e}")
+
+    source_width, source_height = image.size
+    if width is None and height is None:
+        # 按图片自带的 DPI 换算为打印机点数（没有 DPI 信息时一个像素对应一个点）
+        dpi = image.info.get("dpi")
+        scale = DPI_RATIO * 25.4 / float(dpi[0]) if dpi and dpi[0] else 1.0
+        width, height = round(source_width * scale), round(source_height * scale)
+    elif width is None:
+        width = round(source_width * height / source_height)
+    elif height is None:
+        height = round(source_height * width / source_width)
+    width, height = max(width, 1), max(height, 1)
+    if width > IMAGE_MAX_DOTS or height > IMAGE_MAX_DOTS:
+        raise ImageError(f"图片尺寸 {width}×{height} 超过 {IMAGE_MAX_DOTS} dots")
+
+    image = image.convert("RGBA")
+    background = Image.new("RGBA", image.size, (255, 255, 255, 255))
+    image = Image.alpha_composite(background, image).convert("L")
+    if image.size != (width, height):
+        image = image.resize((width, height), Image.Resampling.LANCZOS)
+    return np.asarray(image, dtype=np.float32)
+
+
+def _to_black(gray: np.ndarray, dither: str, threshold: int) -> np.ndarray:
+    """黑白化：返回布尔数组，True 为打印（黑）"""
+    if dither == "ordered":
+        rows, columns = gray.shape
+        matrix = np.tile(_BAYER, ((rows + 7) // 8, (columns + 7) // 8))[:rows, :columns]
+        return gray < matrix
+    if dither == "diffusion":
+        return _floyd_steinberg(gray)
+    return gray < threshold
+
+
+def _floyd_steinberg(gray: np.ndarray) -> np.ndarray:
+    """
+    Floyd–Steinberg 误差扩散
+
+    误差沿行内逐点传递，无法按整行向量化；使用 Pillow 内置的 C 实现（convert("1")），
+    IMAGE_MAX_DOTS 尺寸（2400×2400）的图片约 0.2 秒。
+    """
+    image = Image.fromarray(np.clip(gray, 0, 255).astype(np.uint8), "L")
+    return ~np.asarray(image.convert("1", dither=Image.Dither.FLOYDSTEINBERG), dtype=bool)
+
+
+def _pack_rows(black: np.ndarray) -> bytes:
+    """按行打包为 BITMAP 数据：每行补齐到整字节（补白），位为 0 的点打印为黑色"""
+    padding = -black.shape[1] % 8
+    if padding:
+        black = np.pad(black, ((0, 0), (0, padding)), constant_values=False)
+    return np.packbits(~black, axis=1).tobytes()
+
+
+def cache_info() -> dict:
+    """点阵缓存命中统计"""
+    with _lock:
+        return {"hits": _hits, "misses": _misses, "size": len(_cache), "maxsize": IMAGE_CACHE_SIZE}
@@ -0,0 +1,379 @@
+"""
+命令行批量打印与性能测试工具（替代 test_print.py）
+
+从 JSON / NDJSON / CSV 文件或标准输入读取标签数据，分块渲染后经过预渲染流水线直接发送到打印机，
+用于批量补打和新打印机、新纸张的验证。
+
+用法示例：
+    python cli.py print single-text labels.csv
+    python cli.py print qrcode-with-text orders.ndjson --printer 1
+    cat rows.ndjson | python cli.py print custom --layout layout.json
+    python cli.py print barcode-with-text orders.csv --dry-run out.tspl --bench
+    python cli.py calibrate border
+    python cli.py calibrate paper
+
+输入格式（按扩展名识别，标准输入默认为 NDJSON，第一行以 [ 开头时为 JSON）：
+- JSON：条目数组，或含 print_list / rows 的对象
+- NDJSON：每行一个条目
+- CSV：第一行为字段名（如 text、qrcode、barcode、text1、text2）
+
+custom 模板需要 --layout 指定布局文件（layout 对象的 JSON），每个条目是一行邮件合并数据。
+
+注意：直接访问 USB 打印机，不经过服务的打印队列，运行前请停止打印服务，或使用 --dry-run。
+"""
+import argparse
+import csv
+import io
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+from typing import IO, Iterable, Iterator, List, Optional
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+
+import main
+from config import MAIL_MERGE_MAX_ROWS
+from pipeline import PipelineStats, run_pipeline
+from printer import Label, PrinterSession, calibrate_paper, print_calibration_border, tsc_printer
+from program import ProgramRecorder
+
+# 每块渲染的条目数（每块对应一次请求的校验和布局计算）
+DEFAULT_CHUNK = 500
+
+_FORMATS = {".json": "json", ".ndjson": "ndjson", ".jsonl": "ndjson", ".csv": "csv"}
+
+# 预设模板的条目模型（逐条校验，错误信息指出具体条目；double-text 兼容 text 条目，由 PrintJob 校验）
+_ITEM_MODELS = {
+    "single-text": main.SingleTextData,
+    "qrcode-with-text": main.QRCodeWithTextData,
+    "barcode-with-text": main.BarcodeWithTextData,
+}
+
+
+class CliError(Exception):
+    """输入数据或参数错误"""
+
+
+class _CountingPrinter:
+    """
+    统计写入字节数的打印机包装（接口同 TSCPrinter）
+
+    Windows 字体文本由 tsclib 在本机光栅化后写入，字节数无法得知，只统计次数。
+    """
+
+    def __init__(self, printer):
+        self.printer = printer
+        self.bytes = 0
+        self.writes = 0
+        self.font_texts = 0
+        self.open_time = 0.0
+
+    def open_port(self, port=0):
+        t0 = time.perf_counter()
+        self.printer.open_port(port)
+        self.open_time += time.perf_counter() - t0
+
+    def close_port(self):
+        self.printer.close_port()
+
+    def send_command(self, command: str):
+        self.bytes += len(command.encode("utf-8")) + 2
+        self.writes += 1
+        self.printer.send_command(command)
+
+    def send_command_binary(self, command: bytes):
+        self.bytes += len(command) + 2
+        self.writes += 1
+        self.printer.send_command_binary(command)
+
+    def print_text_windows_font(self, **kwargs):
+        self.font_texts += 1
+        self.printer.print_text_windows_font(**kwargs)
+
+
+class _Timed:
+    """读取条目的迭代器包装，累计读取和解析耗时"""
+
+    def __init__(self, items: Iterable[dict]):
+        self._items = iter(items)
+        self.count = 0
+        self.elapsed = 0.0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> dict:
+        t0 = time.perf_counter()
+        try:
+            item = next(self._items)
+        finally:
+            self.elapsed += time.perf_counter() - t0
+        self.count += 1
+        return item
+
+
+def read_items(paths: List[str], fmt: Optional[str] = None) -> Iterator[dict]:
+    """
+    按顺序读取所有输入的条目（NDJSON、CSV 逐行读取，不会一次载入整个文件）
+
+    Args:
+        paths: 文件路径列表，"-" 表示标准输入
+        fmt: 输入格式（json / ndjson / csv），默认按扩展名识别
+
+    Returns:
+        条目迭代器（迭代时遇到格式错误的数据抛出 CliError）
+
+    Raises:
+        CliError: 无法识别输入格式
+    """
+    formats = [fmt or (None if path == "-" else _FORMATS.get(os.path.splitext(path)[1].lower())) for path in paths]
+    for path, file_fmt in zip(paths, formats):
+        if path != "-" and file_fmt is None:
+            raise CliError(f"无法识别输入格式（请使用 --format）: {path}")
+    return _read_all(paths, formats)
+
+
+def _read_all(paths: List[str], formats: List[Optional[str]]) -> Iterator[dict]:
+    for path, file_fmt in zip(paths, formats):
+        if path == "-":
+            yield from _read_stream(io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8-sig"), "<stdin>", file_fmt)
+            continue
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            yield from _read_stream(f, path, file_fmt)
+
+
+def _read_stream(f: IO[str], name: str, fmt: Optional[str]) -> Iterator[dict]:
+    """读取一个输入流"""
+    if fmt is None:
+        # 标准输入：第一行以 [ 开头为 JSON 数组，否则为 NDJSON
+        first = f.readline()
+        fmt = "json" if first.lstrip().startswith("[") else "ndjson"
+        lines = itertools.chain([first], f)
+    else:
+        lines = f
+
+    if fmt == "csv":
+        yield from csv.DictReader(lines)
+    elif fmt == "ndjson":
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                raise CliError(f"{name} 第{number}行不是有效的 JSON: {e}")
+    else:
+        try:
+            data = json.loads("".join(lines))
+        except json.JSONDecodeError as e:
+            raise CliError(f"{name} 不是有效的 JSON: {e}")
+        if isinstance(data, dict):
+            data = data.get("print_list", data.get("rows"))
+        if not isinstance(data, list):
+            raise CliError(f"{name} 应为条目数组，或含 print_list / rows 的对象")
+        yield from data
+
+
+def render_items(
+    template: str,
+    items: Iterable[dict],
+    chunk: int = DEFAULT_CHUNK,
+    layout: dict = None,
+    qty: int = 1,
+    profile: str = None
+) -> Iterator[Label]:
+    """
+    把条目分块转换为打印任务（与 /print 相同的校验和渲染），逐张产出标签
+
+    Args:
+        template: 模板名称
+        items: 条目（预设模板为 print_list 的一项，custom 为一行邮件合并数据）
+        chunk: 每块的条目数
+        layout: custom 模板的布局
+        qty: 每行的打印数量（仅 custom）
+        profile: 打印配置名称（PRINT_PROFILES），默认使用模板的默认配置
+
+    Yields:
+        Label: 渲染完成的标签
+
+    Raises:
+        CliError: 条目校验失败（信息中包含条目序号范围）
+    """
+    if template == "custom":
+        chunk = min(chunk, MAIL_MERGE_MAX_ROWS)
+    elif template == "double-text":
+        chunk += chunk % 2  # 每两条数据一张纸，分块不能拆开同一张纸
+
+    model = _ITEM_MODELS.get(template)
+    items = iter(items)
+    start = 0
+    while True:
+        rows = list(itertools.islice(items, chunk))
+        if not rows:
+            return
+        if model is not None:
+            rows = [_validate_item(model, row, start + i) for i, row in enumerate(rows)]
+        try:
+            if template == "custom":
+                job = main.PrintJob(template=template, layout={**layout, "rows": rows}, qty=qty, profile=profile)
+            else:
+                job = main.PrintJob(template=template, print_list=rows, profile=profile)
+            main._validate_job(job)
+        except ValidationError as e:
+            raise CliError(f"第{start + 1}-{start + len(rows)}条数据格式错误: {_describe(e)}")
+        except HTTPException as e:
+            raise CliError(f"第{start + 1}-{start + len(rows)}条: {e.detail}")
+        yield from main._task_part(job).render()
+        start += len(rows)
+
+
+def _validate_item(model, row: dict, index: int):
+    """校验一个条目，返回模型实例（PrintJob 不再重复校验）"""
+    try:
+        return model.model_validate(row)
+    except ValidationError as e:
+        raise CliError(f"第{index + 1}条数据格式错误: {_describe(e)}")
+
+
+def _describe(error: ValidationError) -> str:
+    """简短的校验错误信息"""
+    return "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in error.errors())
+
+
+def _port(value: str):
+    """--printer 参数：端口序号或驱动名称（如 "TSC TTP-247"）"""
+    return int(value) if value.isdigit() else value
+
+
+def run_print(args) -> int:
+    """print 子命令"""
+    layout = None
+    if args.template == "custom":
+        if not args.layout:
+            raise CliError("custom 模板需要提供 --layout")
+        with open(args.layout, encoding="utf-8-sig") as f:
+            layout = json.load(f)
+        layout.pop("rows", None)
+
+    items = _Timed(read_items(args.files or ["-"], args.format))
+    labels = render_items(args.template, items, args.chunk, layout, args.qty, args.profile)
+
+    out = None
+    if args.dry_run:
+        out = sys.stdout if args.dry_run == "-" else open(args.dry_run, "w", encoding="utf-8", newline="\n")
+        target = _CountingPrinter(ProgramRecorder(out))
+    else:
+        target = _CountingPrinter(tsc_printer())
+
+    try:
+        with PrinterSession(port=args.printer, printer=target) as session:
+            stats = run_pipeline(session, labels)
+    finally:
+        if out is not None and out is not sys.stdout:
+            out.close()
+
+    done = "已写入 TSPL 程序" if args.dry_run else "已发送"
+    print(f"✅ {done}: {items.count}个条目，{stats.labels}张标签", file=sys.stderr)
+    if args.bench:
+        print(_bench_report(stats, target, items), file=sys.stderr)
+    return 0
+
+
+def _bench_report(stats: PipelineStats, target: _CountingPrinter, items: _Timed) -> str:
+    """性能测试报告：吞吐量、每张标签字节数和各阶段耗时"""
+    labels = max(stats.labels, 1)
+    elapsed = max(stats.elapsed, 1e-9)
+    layout = max(stats.render_time - items.elapsed, 0.0)
+    lines = [
+        "",
+        "=" * 50,
+        "性能测试",
+        "=" * 50,
+        f"标签数:          {stats.labels}（{items.count}个条目）",
+        f"吞吐量:          {stats.labels / elapsed:.1f} 张/秒",
+        f"每张字节数:      {target.bytes / labels:.0f} 字节（共 {target.bytes} 字节，{target.writes} 次写入）",
+        f"每张字体文本:    {target.font_texts / labels:.1f} 个（tsclib 光栅化，不计入字节数）",
+        "-" * 50,
+        f"打开端口:        {target.open_time * 1000:.1f} ms",
+        f"读取解析:        {items.elapsed * 1000:.1f} ms",
+        f"布局渲染:        {layout * 1000:.1f} ms（每张 {layout * 1000 / labels:.3f} ms）",
+        f"发送:            {stats.send_time * 1000:.1f} ms（每张 {stats.send_time * 1000 / labels:.3f} ms）",
+        f"发送等待渲染:    {stats.consumer_stall * 1000:.1f} ms",
+        f"渲染等待队列:    {stats.producer_stall * 1000:.1f} ms",
+        f"总耗时:          {stats.elapsed * 1000:.1f} ms",
+    ]
+    return "\n".join(lines)
+
+
+def run_calibrate(args) -> int:
+    """calibrate 子命令"""
+    if args.kind == "border":
+        print_calibration_border(qty=args.qty, width=args.width, height=args.height)
+        print("✅ 校准边框已发送：检查边框、START(0,0) 和四角标记是否与纸张对齐")
+        return 0
+
+    if not args.yes:
+        confirm = input("纸张校准（EOP 间隙检测，适用于有间隙的标签纸），是否继续? (y/n): ")
+        if confirm.lower() != "y":
+            print("⚠️  已取消校准")
+            return 1
+    if not calibrate_paper():
+        print("❌ 纸张校准失败", file=sys.stderr)
+        return 1
+    print("✅ 纸张校准完成，可以运行 calibrate border 检查打印位置")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="TSC 打印中间件命令行工具")
+    parser.add_argument("-v", "--verbose", action="store_true", help="输出详细日志")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("print", help="批量打印（从文件或标准输入读取条目）")
+    p.add_argument("template", choices=["single-text", "double-text", "qrcode-with-text", "barcode-with-text", "custom"])
+    p.add_argument("files", nargs="*", help="输入文件（JSON / NDJSON / CSV），省略或 - 表示标准输入")
+    p.add_argument("--format", choices=["json", "ndjson", "csv"], help="输入格式（默认按扩展名识别）")
+    p.add_argument("--layout", help="custom 模板的布局文件（JSON）")
+    p.add_argument("--qty", type=int, default=1, help="每行的打印数量（仅 custom）")
+    p.add_argument("--profile", help="打印配置（config.py 中 PRINT_PROFILES 的名称，如 fast / quality）")
+    p.add_argument("--chunk", type=int, default=DEFAULT_CHUNK, help=f"每块渲染的条目数（默认 {DEFAULT_CHUNK}）")
+    p.add_argument("--printer", type=_port, default=0, help="打印机端口序号或驱动名称（默认 0）")
+    p.add_argument("--dry-run", metavar="FILE", help="不访问打印机，把 TSPL 程序写入文件（- 为标准输出）")
+    p.add_argument("--bench", action="store_true", help="输出吞吐量、每张字节数和各阶段耗时")
+    p.set_defaults(handler=run_print)
+
+    c = commands.add_parser("calibrate", help="打印区域校准（border）或纸张间隙校准（paper）")
+    c.add_argument("kind", choices=["border", "paper"])
+    c.add_argument("--qty", type=int, default=1, help="打印数量（仅 border）")
+    c.add_argument("--width", help="标签宽度(mm)（仅 border）")
+    c.add_argument("--height", help="标签高度(mm)（仅 border）")
+    c.add_argument("-y", "--yes", action="store_true", help="不询问确认（仅 paper）")
+    c.set_defaults(handler=run_calibrate)
+    return parser
+
+
+def cli(argv: List[str] = None) -> int:
+    args = build_parser().parse_args(argv)
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    # Windows 控制台输出中文
+    for stream in (sys.stdout, sys.stderr):
+        if hasattr(stream, "reconfigure"):
+            stream.reconfigure(encoding="utf-8")
+
+    try:
+        return args.handler(args)
+    except (CliError, OSError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+    except KeyboardInterrupt:
+        print("\n👋 已中断", file=sys.stderr)
+        return 130
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
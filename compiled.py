@@ -0,0 +1,104 @@
+"""
+预编译程序缓存
+/compile 把任务编译为 TSPL 程序（见 program）后按内容哈希缓存，返回句柄；
+/print-compiled 按句柄直接打印，跳过校验和布局计算。
+
+- 相同的程序得到相同的句柄，重复编译不会重复占用缓存
+- 缓存有数量、总大小上限，最后一次使用超过 COMPILED_TTL 秒的程序被清除
+- 缓存只在内存中，服务重启后句柄失效（已提交的打印任务不受影响：任务日志中保存程序本身）
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import metrics
+from config import COMPILED_CACHE_BYTES, COMPILED_CACHE_SIZE, COMPILED_TTL
+
+
+class _Entry:
+    """一个预编译程序"""
+
+    def __init__(self, text: str, info: dict):
+        self.text = text
+        self.info = info
+        self.size = len(text.encode("utf-8"))
+        self.created = time.time()
+        self.used = time.monotonic()
+        self.prints = 0
+
+
+_lock = threading.Lock()
+_entries: "OrderedDict[str, _Entry]" = OrderedDict()
+_bytes = 0
+
+
+def handle_of(text: str) -> str:
+    """程序的句柄（内容哈希）"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:24]
+
+
+def put(text: str, info: dict) -> str:
+    """
+    缓存程序
+
+    Args:
+        text: 程序文本
+        info: 程序统计（program.measure 的结果）
+
+    Returns:
+        句柄
+    """
+    global _bytes
+    handle = handle_of(text)
+    with _lock:
+        entry = _entries.get(handle)
+        if entry is None:
+            entry = _Entry(text, info)
+            _entries[handle] = entry
+            _bytes += entry.size
+        entry.used = time.monotonic()
+        _entries.move_to_end(handle)
+        _evict()
+    metrics.inc("compiled.stored")
+    return handle
+
+
+def get(handle: str) -> Optional[tuple]:
+    """
+    按句柄取出程序（记为一次使用）
+
+    Returns:
+        (程序文本, 程序统计)，句柄不存在或已过期时返回 None
+    """
+    with _lock:
+        _evict()
+        entry = _entries.get(handle)
+        if entry is None:
+            metrics.inc("compiled.misses")
+            return None
+        entry.used = time.monotonic()
+        entry.prints += 1
+        _entries.move_to_end(handle)
+    metrics.inc("compiled.hits")
+    return entry.text, entry.info
+
+
+def stats() -> dict:
+    """缓存统计（GET /metrics）"""
+    with _lock:
+        return {"programs": len(_entries), "bytes": _bytes}
+
+
+def _evict():
+    """清除过期的程序，并按最近使用顺序清除超出数量、大小上限的程序（调用方持有 _lock）"""
+    global _bytes
+    now = time.monotonic()
+    while _entries:
+        handle, entry = next(iter(_entries.items()))
+        if (now - entry.used <= COMPILED_TTL and len(_entries) <= COMPILED_CACHE_SIZE
+                and _bytes <= COMPILED_CACHE_BYTES):
+            break
+        del _entries[handle]
+        _bytes -= entry.size
@@ -23,6 +23,27 @@ DPI_RATIO = 11.81  # dots per mm (TTE-344 = 300 DPI)
 # ============================================================
 PRINT_MARGIN = 10  # 打印边距 (dots)
 
+# ============================================================
+# 打印机参数（每次初始化打印机时下发）
+# ============================================================
+PRINT_GAP = "3"  # 标签间隙(mm)，连续纸改为 "0"
+PRINT_SPEED = 4  # 打印速度（英寸/秒，1-14，数字越小越慢但质量越好）
+PRINT_DENSITY = 12  # 打印浓度（0-15）
+
+# 打印配置（profile）：按任务的 profile 参数或模板选择，未列出的参数使用 default 的值
+# - speed: 打印速度（英寸/秒）；density: 打印浓度（0-15）
+# - gap: 标签间隙(mm)，"0" 为连续纸
+# - mode: 出纸方式 off（打印后不移动）/ tear（撕离）/ peel（剥离）/ cutter（每张切纸）/ batch（整批打印完切一次）
+# - shift: 打印停止位置偏移 (dots)
+PRINT_PROFILES = {
+    "default": {"speed": PRINT_SPEED, "density": PRINT_DENSITY, "gap": PRINT_GAP, "mode": "off", "shift": 0},
+    "fast": {"speed": 8, "density": 10},  # 内部流转标签：速度优先
+    "quality": {"speed": 3, "density": 14},  # 面向客户的二维码标签：慢速、深色，保证扫码
+    "continuous": {"gap": "0"},  # 连续纸
+}
+# 各模板未指定 profile 时使用的打印配置（未列出的模板使用 default）
+TEMPLATE_PROFILES: dict[str, str] = {}
+
 # ============================================================
 # 预设模板参数
 # ============================================================
@@ -36,4 +57,152 @@ TYPE2_FONT_HEIGHT = 48  # 字体高度 (dots)
 TYPE2_FONT_NAME = "宋体"  # 字体名称
 TYPE2_QR_SIZE = 12  # 二维码单元宽度 (1-10)
 TYPE2_QR_SPACING = 24  # 二维码与文本间距 (dots)，约2mm
+TYPE2_BARCODE_HEIGHT = 80  # 条形码高度 (dots)
+TYPE2_BARCODE_NARROW = 2  # 条形码窄条（模块）宽度 (dots)
+
+
+# custom 模板（邮件合并）
+MAIL_MERGE_MAX_ROWS = 1000  # 单次请求最多的数据行数
+
+# 混合模板批量打印（/print/batch）
+BATCH_MAX_JOBS = 100  # 单次请求最多的子任务数
+
+# N-up 排版（一张纸排多个标签）
+NUP_GUTTER = 16  # 默认标签间距 (dots)
+
+# ============================================================
+# 预渲染流水线
+# ============================================================
+# 渲染线程提前准备好的标签数量上限；0 表示不使用后台线程（逐张渲染、逐张发送）
+PIPELINE_QUEUE_DEPTH = 32
+
+# ============================================================
+# 字体度量（文本居中计算）
+# ============================================================
+# 字体名称 -> 字体文件候选路径（按顺序查找第一个存在的文件）
+# 找不到字体文件时回退为估算（中文 = 字体高度，其他 = 0.6 倍字体高度）
+FONT_FILES = {
+    "宋体": ["C:/Windows/Fonts/simsun.ttc"],
+    "SimSun": ["C:/Windows/Fonts/simsun.ttc"],
+    "Arial": ["C:/Windows/Fonts/arial.ttf"],
+}
+FONT_WIDTH_CACHE_SIZE = 8192  # 文本宽度 LRU 缓存条目数
+
+# ============================================================
+# 条码几何计算（二维码版本、Code 128 模块数）
+# ============================================================
+GEOMETRY_CACHE_SIZE = 4096  # 按内容缓存的计算结果条目数
+
+# ============================================================
+# 幂等请求（Idempotency-Key）
+# ============================================================
+IDEMPOTENCY_TTL = 600  # 请求完成后结果保留时间（秒），期间同一个键的重试直接返回该结果
+IDEMPOTENCY_MAX_ENTRIES = 1000  # 最多保留的请求数
+# 未提供 Idempotency-Key 时是否按请求内容计算哈希作为键：
+# 开启后 IDEMPOTENCY_TTL 内内容完全相同的请求只打印一次（需要重复打印时请改用 qty）
+IDEMPOTENCY_AUTO_HASH = False
+
+# ============================================================
+# 打印任务调度与任务日志
+# ============================================================
+JOURNAL_PATH = "print_journal.db"  # 任务日志（SQLite）文件路径
+JOURNAL_COMMIT_LABELS = 50  # 发送进度每累积多少张标签提交一次
+JOURNAL_COMMIT_INTERVAL = 0.5  # 发送进度最长提交间隔（秒）
+JOURNAL_RETENTION = 7 * 24 * 3600  # 已结束任务在任务日志中的保留时间（秒）
+JOB_RETRY_INTERVAL = 5  # 打印中断后重试连接的间隔（秒）
+JOB_HISTORY = 1000  # 内存中保留的最近任务数（GET /jobs/{job_id}）
+
+# ============================================================
+# 打印机状态轮询
+# ============================================================
+STATUS_POLL_INTERVAL = 2.0  # 状态查询间隔（秒）
+STATUS_QUERY_DELAY_MS = 100  # 每次查询等待打印机回复的时间（毫秒）
 
+# ============================================================
+# 离线队列（打印机未连接时暂存已编译的标签）
+# ============================================================
+SPOOL_DIR = "print_spool"  # 离线队列目录
+SPOOL_MAX_BYTES = 64 * 1024 * 1024  # 离线队列总大小上限（字节），超过时拒绝新的离线打印
+SPOOL_MAX_AGE = 24 * 3600  # 离线标签最长保留时间（秒），超时未打印的丢弃
+SPOOL_WRITE_BYTES = 64 * 1024  # 恢复连接后回放时单次写入的目标大小（字节）
+
+# ============================================================
+# 任务优先级与取消、暂停
+# ============================================================
+JOB_LANES = ("urgent", "normal", "bulk")  # 优先级从高到低，高优先级任务在标签边界插队
+JOB_LANE_SLO = {"urgent": 10, "normal": 120, "bulk": 3600}  # 各优先级任务从提交到完成的目标时延（秒）
+JOB_CONTROL_TIMEOUT = 10  # 取消、暂停任务时等待打印线程在标签边界执行的最长时间（秒）
+
+# ============================================================
+# 客户端公平调度
+# ============================================================
+# 客户端权重（客户端标识见 GET /metrics 的 clients：请求头 X-API-Key 的摘要 "key:xxxxxxxx"，或来源 IP），
+# 未配置的客户端权重为 1；权重为 2 的客户端每轮可以发送两倍的标签
+CLIENT_WEIGHTS: dict[str, int] = {}
+FAIR_QUANTUM = 1  # 每轮每单位权重发送的标签数（调大可以减少客户端之间的切换）
+CLIENT_STATS_MAX = 256  # 最多统计的客户端数
+CLIENT_RATE_WINDOW = 60  # 吞吐量统计窗口（秒）
+
+# ============================================================
+# 图片元素（logo、危险品标志）
+# ============================================================
+IMAGE_DIR = "images"  # 图片元素 path 的根目录（只能读取该目录下的文件）
+IMAGE_MAX_BYTES = 4 * 1024 * 1024  # 单个图片文件的大小上限（字节）
+IMAGE_MAX_DOTS = 2400  # 转换后的点阵宽度、高度上限（dots）
+IMAGE_MAX_PIXELS = 16_000_000  # 解码前检查的源图片像素数上限（宽 × 高），防止小文件解码出超大图片
+IMAGE_CACHE_SIZE = 64  # 按内容哈希缓存的点阵数
+
+# ============================================================
+# 预编译程序（/compile、/print-compiled）
+# ============================================================
+COMPILED_CACHE_SIZE = 256  # 最多缓存的预编译程序数
+COMPILED_CACHE_BYTES = 64 * 1024 * 1024  # 预编译程序缓存的总大小上限（字节）
+COMPILED_TTL = 24 * 3600  # 预编译程序最后一次使用后的保留时间（秒）
+COMPILED_MAX_BYTES = 8 * 1024 * 1024  # 单个程序（编译结果或上传的程序）的大小上限（字节）
+COMPILED_MAX_COPIES = 1000  # /print-compiled 单次请求的最大份数
+
+# ============================================================
+# 打印时间估算（任务 ETA）
+# ============================================================
+THROUGHPUT_ALPHA = 0.1  # 实测耗时的指数加权平均系数（越大越快跟随最近的标签）
+THROUGHPUT_MIN_SAMPLES = 5  # 同一种标签实测多少张后改用实测耗时（之前使用校准后的物理模型）
+THROUGHPUT_BANDWIDTH = 100_000  # USB 有效带宽的初始值（字节/秒），之后按实测值更新
+THROUGHPUT_OUTLIER = 5  # 超过当前估算该倍数的标签间隔不参与校准（打印机暂停、换纸等）
+THROUGHPUT_PROFILES = 64  # 最多记录的标签种类数（模板 × 走纸长度 × 浓度）
+
+# ============================================================
+# 启动预热与就绪状态
+# ============================================================
+# True：打印机驱动库（tsclib）由后台预热线程加载，服务立即开始响应（/health 可用，/ready 在预热完成后返回 200）；
+# False：启动时同步加载驱动库，加载完成后才开始响应
+TSCLIB_LAZY_LOAD = True
+# 打印机空闲时发送一段 Windows 字体文本并立即清除（CLS，不打印），预热驱动的字体光栅化
+# 默认关闭：启用后每次启动都会向打印机发送命令
+WARMUP_RASTERIZE = False
+# 启动时渲染的示例任务（不打印）：预热字体度量、条码几何和布局计算；可以加入常用的 custom 布局
+WARMUP_JOBS = [
+    {"template": "single-text", "print_list": [{"text": "预热 Warm-up 0123456789"}]},
+    {"template": "double-text", "print_list": [{"text1": "预热", "text2": "Warm-up 0123456789"}]},
+    {"template": "qrcode-with-text", "print_list": [{"qrcode": "https://example.com/warmup", "text": "预热"}]},
+    {"template": "barcode-with-text", "print_list": [{"barcode": "1234567890", "text": "预热"}]},
+]
+
+# ============================================================
+# 日志
+# ============================================================
+LOG_LEVEL = "INFO"  # 日志级别（DEBUG 时记录采样的每张标签发送事件）
+LOG_FORMAT = "text"  # text：可读文本；json：每行一个 JSON 对象（便于日志系统按 job_id 检索）
+LOG_FILE = None  # 日志文件路径（按大小轮转），None 时只输出到控制台
+LOG_FILE_MAX_BYTES = 10 * 1024 * 1024  # 单个日志文件的大小上限（字节）
+LOG_FILE_BACKUPS = 5  # 保留的轮转日志文件数
+LOG_QUEUE_SIZE = 10000  # 待写入的日志条数上限，写入跟不上时丢弃新日志（logging.dropped），不阻塞打印
+LOG_LABEL_SAMPLE = 100  # 每张标签的调试事件每 N 张记录一张
+
+# ============================================================
+# 性能剖析
+# ============================================================
+PROFILE_DIR = "profiles"  # 剖析结果目录（.prof + .json）
+PROFILE_MAX_JOBS = 20  # POST /profile 一次最多剖析的任务数
+PROFILE_TOP = 30  # .json 中列出的耗时最多的函数数（按累计耗时）
+# 管理员密钥：/profile 接口需要在请求头 X-Admin-Key 中提供该值；None 时性能剖析接口不可用（404）
+PROFILE_ADMIN_KEY = None
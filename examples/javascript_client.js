@@ -3,6 +3,12 @@
  * 
  * 展示如何使用 JavaScript/Node.js 调用打印中间件的各种功能
  * 
+ * - 所有请求共享 keep-alive 连接（Node.js 使用 keepAlive Agent，浏览器由 XHR 复用连接）
+ * - 合并请求：短时间窗口（lingerMs）内对同一模板的多次打印调用合并为一次 /print 请求，
+ *   每个调用方仍然得到自己的标签的打印结果
+ * - 限制同时进行的请求数（maxInFlight），大列表按 chunkSize 分块依次发送
+ * - 连接失败、超时时使用同一个 Idempotency-Key 重试，不会重复打印
+ * 
  * 安装依赖: npm install axios
  * 运行示例: node javascript_client.js
  */
@@ -12,83 +18,237 @@ const axios = require('axios');
 // 服务地址配置
 const BASE_URL = 'http://localhost:8000';
 
+// 每个条目正好是一张标签的模板：不同调用方的条目可以合并到同一个 print_list
+// （double-text 两个条目共用一张纸、custom 没有 print_list，不跨调用方合并）
+const COALESCE_TEMPLATES = ['single-text', 'qrcode-with-text', 'barcode-with-text'];
+
+// 代理/网关返回这些状态码时请求可能没有到达服务，使用同一个 Idempotency-Key 重试是安全的
+const RETRY_STATUS = [502, 504];
+
+/**
+ * 创建 keep-alive 连接（仅 Node.js；浏览器中返回空对象）
+ * @param {number} maxSockets - 最大连接数
+ */
+function keepAliveAgents(maxSockets) {
+  if (typeof window !== 'undefined') return {};
+  const http = require('http');
+  const https = require('https');
+  return {
+    httpAgent: new http.Agent({ keepAlive: true, maxSockets }),
+    httpsAgent: new https.Agent({ keepAlive: true, maxSockets })
+  };
+}
+
+/**
+ * 生成 Idempotency-Key
+ */
+function idempotencyKey() {
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
+}
+
+const sleep = ms => new Promise(resolve => setTimeout(resolve, ms));
+
+/**
+ * 把一次 /print 的响应拆分为每张标签的结果
+ * @param {Object} data - 响应内容（成功时）或错误详情（409/503 且含 job_id 时）
+ * @param {number} count - 请求中的条目数
+ * @param {number} perSheet - 每张纸的条目数（double-text 为 2）
+ * @returns {Array<Object>} 每个条目的结果：{ state, job_id, index, message }
+ *   - state: printed（已打印）/ spooled（离线队列，恢复连接后打印）/
+ *     pending（任务中断，打印机恢复后自动继续）/ paused / cancelled / rejected（条目校验失败）
+ */
+function labelOutcomes(data, count, perSheet) {
+  if (data.spooled) {
+    return Array.from({ length: count }, (_, index) => ({
+      state: 'spooled', spool_id: data.spool_id, index, message: data.message
+    }));
+  }
+  // 未完成的任务：序号小于已打印张数的条目已打印，其余取决于任务状态
+  const printed = data.printed === undefined ? count : data.printed * perSheet;
+  const rest = { interrupted: 'pending', paused: 'paused', cancelled: 'cancelled' }[data.state] || 'printed';
+  return Array.from({ length: count }, (_, index) => ({
+    state: index < printed ? 'printed' : rest,
+    job_id: data.job_id,
+    index,
+    message: data.message
+  }));
+}
+
 /**
  * TSC 打印客户端类
  */
 class TSCPrintClient {
-  constructor(baseUrl = BASE_URL) {
+  /**
+   * @param {string} baseUrl - 服务地址
+   * @param {Object} options
+   * @param {string} options.apiKey - 客户端标识（X-API-Key，服务端按客户端公平调度）
+   * @param {number} options.timeout - 单次请求超时(ms)，/print 在打印完成后才返回
+   * @param {number} options.retries - 连接失败、超时时的最大重试次数
+   * @param {number} options.maxInFlight - 同时进行的最大请求数
+   * @param {number} options.lingerMs - 合并窗口(ms)：第一次调用后等待其他调用的时间
+   * @param {number} options.chunkSize - 单次 /print 请求的最大条目数（合并和大列表分块共用）
+   */
+  constructor(baseUrl = BASE_URL, options = {}) {
+    const {
+      apiKey = null,
+      timeout = 300000,
+      retries = 3,
+      maxInFlight = 4,
+      lingerMs = 20,
+      chunkSize = 200
+    } = options;
+
     this.baseUrl = baseUrl;
+    this.retries = retries;
+    this.maxInFlight = maxInFlight;
+    this.lingerMs = lingerMs;
+    this.chunkSize = chunkSize;
     this.client = axios.create({
       baseURL: baseUrl,
-      timeout: 30000,
+      timeout,
       headers: {
-        'Content-Type': 'application/json'
-      }
+        'Content-Type': 'application/json',
+        ...(apiKey ? { 'X-API-Key': apiKey } : {})
+      },
+      ...keepAliveAgents(maxInFlight)
     });
+
+    this._inFlight = 0;
+    this._waiting = [];       // 等待发送的请求（超过 maxInFlight 时排队）
+    this._buffers = new Map(); // 合并键 -> { template, priority, entries, timer }
+  }
+
+  /**
+   * 发送请求（连接失败、超时、502/504 时重试，所有重试使用同一个 Idempotency-Key）
+   * @param {string} method - HTTP 方法
+   * @param {string} path - 接口路径
+   * @param {Object} body - JSON 请求体
+   * @param {boolean} idempotent - 是否带 Idempotency-Key（打印请求）
+   */
+  async request(method, path, body = undefined, idempotent = false) {
+    const headers = idempotent ? { 'Idempotency-Key': idempotencyKey() } : {};
+    for (let attempt = 0; ; attempt++) {
+      try {
+        const response = await this.client.request({ method, url: path, data: body, headers });
+        return response.data;
+      } catch (error) {
+        const retryable = error.response
+          ? RETRY_STATUS.includes(error.response.status)
+          : error.code !== 'ERR_CANCELED';
+        if (!retryable || attempt >= this.retries) throw error;
+        await sleep(500 * 2 ** attempt);
+      }
+    }
   }
 
   /**
    * 健康检查
    */
   async healthCheck() {
-    const response = await this.client.get('/health');
-    return response.data;
+    return this.request('get', '/health');
   }
 
   /**
    * 测试打印机连接
    */
   async testConnection() {
-    const response = await this.client.post('/test');
-    return response.data;
+    return this.request('post', '/test');
+  }
+
+  /**
+   * 查询打印任务状态
+   * @param {string} jobId - 任务ID
+   */
+  async getJob(jobId) {
+    return this.request('get', `/jobs/${jobId}`);
+  }
+
+  /**
+   * 提交一个完整的 /print 请求体（受 maxInFlight 限制）
+   * @param {Object} job - 请求体
+   */
+  async printJob(job) {
+    return this._limit(() => this.request('post', '/print', job, true));
+  }
+
+  /**
+   * 打印一个条目列表：可合并的模板与同一窗口内的其他调用合并，大列表按 chunkSize 分块发送
+   * @param {string} template - 模板名称
+   * @param {Array<Object>} items - print_list 条目
+   * @param {Object} options
+   * @param {string} options.priority - 优先级（urgent / normal / bulk）
+   * @param {Function} options.onProgress - 每个分块完成时回调 (完成条目数, 总条目数)
+   * @returns {Promise<Object>} { status, message, labels }，labels 为每个条目的结果（顺序与 items 一致）
+   */
+  async printList(template, items, { priority = 'normal', onProgress = null } = {}) {
+    let done = 0;
+    const track = promise => promise.finally(() => {
+      done++;
+      if (onProgress && (done % this.chunkSize === 0 || done === items.length)) onProgress(done, items.length);
+    });
+
+    let labels;
+    if (COALESCE_TEMPLATES.includes(template)) {
+      labels = await Promise.all(items.map(item => track(this._enqueue(template, priority, item))));
+    } else {
+      // 不合并的模板：按 chunkSize 分块（double-text 分块保持偶数，不拆开同一张纸的两个条目）
+      const size = template === 'double-text' ? this.chunkSize - (this.chunkSize % 2) || 2 : this.chunkSize;
+      const chunks = [];
+      for (let start = 0; start < items.length; start += size) {
+        const chunk = items.slice(start, start + size);
+        chunks.push(this._sendChunk(template, priority, chunk).then(outcomes => {
+          outcomes.forEach(outcome => { outcome.index += start; });
+          done += chunk.length;
+          if (onProgress) onProgress(done, items.length);
+          return outcomes;
+        }));
+      }
+      labels = (await Promise.all(chunks)).flat();
+    }
+
+    const printed = labels.filter(label => label.state === 'printed').length;
+    return {
+      status: 'ok',
+      message: `${template} ${items.length}个条目：已打印${printed}个` +
+        (printed < items.length ? `，${items.length - printed}个未打印（见 labels）` : ''),
+      labels
+    };
   }
 
   /**
    * 单行文本打印
    * @param {string[]} textList - 文本列表
+   * @param {Object} options - 优先级、进度回调（同 printList）
    */
-  async printSingleText(textList) {
-    const response = await this.client.post('/print', {
-      template: 'single-text',
-      print_list: textList.map(text => ({ text }))
-    });
-    return response.data;
+  async printSingleText(textList, options = {}) {
+    return this.printList('single-text', textList.map(text => ({ text })), options);
   }
 
   /**
    * 双行文本打印
    * @param {Array<{text1: string, text2?: string}>} textPairs - 文本对列表
+   * @param {Object} options - 优先级、进度回调（同 printList）
    */
-  async printDoubleText(textPairs) {
-    const response = await this.client.post('/print', {
-      template: 'double-text',
-      print_list: textPairs
-    });
-    return response.data;
+  async printDoubleText(textPairs, options = {}) {
+    return this.printList('double-text', textPairs, options);
   }
 
   /**
    * 二维码+文本打印
    * @param {Array<{qrcode: string, text: string}>} items - 二维码列表
+   * @param {Object} options - 优先级、进度回调（同 printList）
    */
-  async printQRCode(items) {
-    const response = await this.client.post('/print', {
-      template: 'qrcode-with-text',
-      print_list: items
-    });
-    return response.data;
+  async printQRCode(items, options = {}) {
+    return this.printList('qrcode-with-text', items, options);
   }
 
   /**
    * 条形码+文本打印
    * @param {Array<{barcode: string, text: string}>} items - 条形码列表
+   * @param {Object} options - 优先级、进度回调（同 printList）
    */
-  async printBarcode(items) {
-    const response = await this.client.post('/print', {
-      template: 'barcode-with-text',
-      print_list: items
-    });
-    return response.data;
+  async printBarcode(items, options = {}) {
+    return this.printList('barcode-with-text', items, options);
   }
 
   /**
@@ -103,12 +263,100 @@ class TSCPrintClient {
     if (width) layout.width = width;
     if (height) layout.height = height;
 
-    const response = await this.client.post('/print', {
+    return this.printJob({
       template: 'custom',
       layout,
       qty
     });
-    return response.data;
+  }
+
+  /**
+   * 立即发送所有合并窗口中的条目
+   */
+  flush() {
+    for (const key of [...this._buffers.keys()]) this._flushKey(key);
+  }
+
+  /**
+   * 条目加入合并窗口
+   * @returns {Promise<Object>} 该条目的结果
+   */
+  _enqueue(template, priority, item) {
+    return new Promise((resolve, reject) => {
+      const key = `${template}|${priority}`;
+      let buffer = this._buffers.get(key);
+      if (!buffer) {
+        buffer = { template, priority, entries: [], timer: null };
+        buffer.timer = setTimeout(() => this._flushKey(key), this.lingerMs);
+        this._buffers.set(key, buffer);
+      }
+      buffer.entries.push({ item, resolve, reject });
+      if (buffer.entries.length >= this.chunkSize) this._flushKey(key);
+    });
+  }
+
+  /**
+   * 发送一个合并窗口，把每张标签的结果交给对应的调用方
+   */
+  _flushKey(key) {
+    const buffer = this._buffers.get(key);
+    if (!buffer) return;
+    this._buffers.delete(key);
+    clearTimeout(buffer.timer);
+
+    const { template, priority, entries } = buffer;
+    this._sendChunk(template, priority, entries.map(entry => entry.item)).then(
+      outcomes => outcomes.forEach((outcome, i) => entries[i].resolve(outcome)),
+      error => entries.forEach(entry => entry.reject(error))
+    );
+  }
+
+  /**
+   * 发送一个分块（一次 /print 请求）
+   * 
+   * 某个条目校验失败（400，detail 为 "print_list[i]: ..."）时只有该条目为 rejected，其余条目重新发送。
+   * @returns {Promise<Array<Object>>} 每个条目的结果；请求失败（连接失败、其他错误）时 reject
+   */
+  async _sendChunk(template, priority, items) {
+    const perSheet = template === 'double-text' ? 2 : 1;
+    try {
+      const data = await this.printJob({ template, priority, print_list: items });
+      return labelOutcomes(data, items.length, perSheet);
+    } catch (error) {
+      const detail = error.response && error.response.data && error.response.data.detail;
+      if (detail && detail.job_id !== undefined) {
+        // 409（暂停、取消）、503（中断）：任务已部分打印
+        return labelOutcomes(detail, items.length, perSheet);
+      }
+      const match = typeof detail === 'string' && error.response.status === 400 && /^print_list\[(\d+)\]/.exec(detail);
+      if (!match || perSheet !== 1) throw error;
+
+      const bad = Number(match[1]);
+      const rest = items.filter((_, i) => i !== bad);
+      const outcomes = rest.length ? await this._sendChunk(template, priority, rest) : [];
+      outcomes.forEach((outcome, i) => { outcome.index = i < bad ? i : i + 1; });
+      outcomes.splice(bad, 0, { state: 'rejected', index: bad, message: detail, error });
+      return outcomes;
+    }
+  }
+
+  /**
+   * 限制同时进行的请求数
+   */
+  async _limit(send) {
+    if (this._inFlight >= this.maxInFlight) {
+      // 等待正在进行的请求结束后把名额直接交给本请求
+      await new Promise(resolve => this._waiting.push(resolve));
+    } else {
+      this._inFlight++;
+    }
+    try {
+      return await send();
+    } finally {
+      const next = this._waiting.shift();
+      if (next) next();
+      else this._inFlight--;
+    }
   }
 }
 
@@ -344,6 +592,43 @@ async function example8ErrorHandling() {
   }
 }
 
+/**
+ * 示例9: 合并请求（多个工位组件同时打印，合并为一次 /print 请求）
+ */
+async function example9Coalescing() {
+  console.log('\n=== 示例9: 合并请求 ===');
+
+  const client = new TSCPrintClient(BASE_URL, { apiKey: 'station-01', lingerMs: 50 });
+
+  // 30 次独立调用在 50ms 窗口内合并为一次请求，每个调用方得到自己标签的结果
+  const results = await Promise.all(
+    Array.from({ length: 30 }, (_, i) => client.printSingleText([`SN-${String(i + 1).padStart(4, '0')}`]))
+  );
+
+  const jobIds = new Set(results.map(result => result.labels[0].job_id));
+  console.log(`✅ 30次调用，${jobIds.size}个打印任务`);
+}
+
+/**
+ * 示例10: 大列表分块发送
+ */
+async function example10Streaming() {
+  console.log('\n=== 示例10: 大列表分块发送 ===');
+
+  const client = new TSCPrintClient(BASE_URL, { chunkSize: 100, maxInFlight: 2 });
+
+  const items = Array.from({ length: 1000 }, (_, i) => ({
+    barcode: String(i + 1).padStart(10, '0'),
+    text: `订单号: ${String(i + 1).padStart(10, '0')}`
+  }));
+
+  // 每 100 个条目一次请求，同时最多 2 个请求
+  const result = await client.printBarcode(items, {
+    onProgress: (done, total) => console.log(`   进度: ${done}/${total}`)
+  });
+  console.log(`✅ ${result.message}`);
+}
+
 /**
  * 主函数 - 运行所有示例
  */
@@ -372,7 +657,9 @@ async function main() {
     example5CustomSimple,
     example6CustomComplex,
     example7BatchPrinting,
-    example8ErrorHandling
+    example8ErrorHandling,
+    example9Coalescing,
+    example10Streaming
   ];
 
   for (const example of examples) {
@@ -2,31 +2,164 @@
 TSC-Print-Middleware Python 客户端示例
 
 展示如何使用 Python 调用打印中间件的各种功能
+
+- TSCPrintClient：同步客户端，共享 keep-alive 连接池（requests.Session）
+- AsyncTSCPrintClient：asyncio 客户端（需要 httpx: pip install httpx）
+- 两者都支持：
+  - 连接失败、超时时自动重试，重试使用同一个 Idempotency-Key，服务端不会重复打印
+  - submit() 在客户端缓冲标签，攒够 batch_size 张或等待 linger 秒后合并为一次 /print 请求，
+    立即返回 future，服务端报告打印完成后得到结果
 """
+import asyncio
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+
 import requests
-from typing import List, Dict, Any
+from requests.adapters import HTTPAdapter
 
 # 服务地址配置
 BASE_URL = "http://localhost:8000"
 
+# 代理/网关返回这些状态码时请求可能没有到达服务，使用同一个 Idempotency-Key 重试是安全的
+# （服务端返回的 503 表示打印机故障，立即重试没有意义，因此不自动重试。打印机恢复后可以用同一个键重新提交：
+#  没有打印任何标签的失败不缓存，会重新打印；已打印部分标签的中断（detail.state 为 interrupted）由服务端自动续打，
+#  同一个键重新提交只会得到同一个 503（带 Idempotency-Replayed: true），不会重复打印；400 等参数错误同样重放）
+RETRY_STATUS = (502, 504)
+
+
+def _backoff(attempt: int, base: float) -> float:
+    """第 attempt 次重试前的等待时间（指数退避）"""
+    return base * (2 ** attempt)
+
+
+def _batch_body(key: Tuple[str, str], items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """把同一模板、同一优先级的缓冲标签合并为一个 /print 请求体"""
+    template, priority = key
+    return {"template": template, "priority": priority, "print_list": items}
+
 
 class TSCPrintClient:
-    """TSC 打印客户端封装"""
-    
-    def __init__(self, base_url: str = BASE_URL):
-        self.base_url = base_url
-    
+    """
+    TSC 打印客户端封装
+
+    Args:
+        base_url: 服务地址
+        api_key: 客户端标识（X-API-Key 请求头，服务端按客户端公平调度）
+        timeout: 单次请求超时（秒）；/print 在打印完成后才返回，大批量打印需要较长的超时
+        retries: 连接失败、超时时的最大重试次数
+        backoff: 重试等待的基数（秒）
+        pool_size: 连接池大小（同时进行的请求数）
+        batch_size: submit() 缓冲的标签达到该数量时立即发送
+        linger: submit() 第一张标签缓冲后最多等待的时间（秒）
+    """
+
+    def __init__(
+        self,
+        base_url: str = BASE_URL,
+        api_key: str = None,
+        timeout: float = 300,
+        retries: int = 3,
+        backoff: float = 0.5,
+        pool_size: int = 4,
+        batch_size: int = 100,
+        linger: float = 0.05
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.batch_size = batch_size
+        self.linger = linger
+
+        # 所有请求共享一个 Session：复用 TCP 连接（keep-alive）
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if api_key:
+            self.session.headers["X-API-Key"] = api_key
+
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="tsc-print")
+        self._lock = threading.Lock()
+        self._buffers: Dict[Tuple[str, str], List[Tuple[Dict[str, Any], Future]]] = {}
+        self._timers: Dict[Tuple[str, str], threading.Timer] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """发送缓冲中的标签，等待所有请求完成后关闭连接"""
+        self.flush()
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+    # ------------------------------------------------------------
+    # 请求
+    # ------------------------------------------------------------
+
+    def request(self, method: str, path: str, body: Dict[str, Any] = None, idempotent: bool = False) -> Dict[str, Any]:
+        """
+        发送请求（连接失败、超时时重试）
+
+        Args:
+            method: HTTP 方法
+            path: 接口路径
+            body: JSON 请求体
+            idempotent: 是否带 Idempotency-Key（打印请求），所有重试使用同一个键
+
+        Returns:
+            响应 JSON
+
+        Raises:
+            requests.exceptions.HTTPError: 服务端返回错误（e.response.json()["detail"] 为错误详情）
+            requests.exceptions.ConnectionError / Timeout: 重试次数用完
+        """
+        headers = {"Idempotency-Key": uuid.uuid4().hex} if idempotent else None
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.request(
+                    method, f"{self.base_url}{path}", json=body, headers=headers, timeout=self.timeout
+                )
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt == self.retries:
+                    raise
+                time.sleep(_backoff(attempt, self.backoff))
+                continue
+            if response.status_code in RETRY_STATUS and attempt < self.retries:
+                time.sleep(_backoff(attempt, self.backoff))
+                continue
+            response.raise_for_status()
+            return response.json()
+
     def health_check(self) -> Dict[str, Any]:
         """健康检查"""
-        response = requests.get(f"{self.base_url}/health")
-        response.raise_for_status()
-        return response.json()
+        return self.request("GET", "/health")
     
     def test_connection(self) -> Dict[str, Any]:
         """测试打印机连接"""
-        response = requests.post(f"{self.base_url}/test")
-        response.raise_for_status()
-        return response.json()
+        return self.request("POST", "/test")
+
+    def print_job(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """提交一个完整的 /print 请求体，打印完成后返回"""
+        return self.request("POST", "/print", job, idempotent=True)
+
+    def print_batch(self, jobs: List[Dict[str, Any]], priority: str = "normal") -> Dict[str, Any]:
+        """混合模板批量打印（/print/batch）"""
+        return self.request("POST", "/print/batch", {"jobs": jobs, "priority": priority}, idempotent=True)
+
+    def get_job(self, job_id: str) -> Dict[str, Any]:
+        """查询打印任务状态"""
+        return self.request("GET", f"/jobs/{job_id}")
+
+    def cancel_job(self, job_id: str) -> Dict[str, Any]:
+        """取消打印任务"""
+        return self.request("POST", f"/jobs/{job_id}/cancel")
     
     def print_single_text(self, text_list: List[str]) -> Dict[str, Any]:
         """
@@ -38,12 +171,10 @@ class TSCPrintClient:
         Returns:
             打印结果
         """
-        response = requests.post(f"{self.base_url}/print", json={
+        return self.print_job({
             "template": "single-text",
             "print_list": [{"text": text} for text in text_list]
         })
-        response.raise_for_status()
-        return response.json()
     
     def print_double_text(self, text_pairs: List[Dict[str, str]]) -> Dict[str, Any]:
         """
@@ -55,12 +186,10 @@ class TSCPrintClient:
         Returns:
             打印结果
         """
-        response = requests.post(f"{self.base_url}/print", json={
+        return self.print_job({
             "template": "double-text",
             "print_list": text_pairs
         })
-        response.raise_for_status()
-        return response.json()
     
     def print_qrcode(self, items: List[Dict[str, str]]) -> Dict[str, Any]:
         """
@@ -72,12 +201,10 @@ class TSCPrintClient:
         Returns:
             打印结果
         """
-        response = requests.post(f"{self.base_url}/print", json={
+        return self.print_job({
             "template": "qrcode-with-text",
             "print_list": items
         })
-        response.raise_for_status()
-        return response.json()
     
     def print_barcode(self, items: List[Dict[str, str]]) -> Dict[str, Any]:
         """
@@ -89,12 +216,10 @@ class TSCPrintClient:
         Returns:
             打印结果
         """
-        response = requests.post(f"{self.base_url}/print", json={
+        return self.print_job({
             "template": "barcode-with-text",
             "print_list": items
         })
-        response.raise_for_status()
-        return response.json()
     
     def print_custom(self, elements: List[Dict[str, Any]], qty: int = 1, 
                      width: int = None, height: int = None) -> Dict[str, Any]:
@@ -116,13 +241,212 @@ class TSCPrintClient:
         if height:
             layout["height"] = height
         
-        response = requests.post(f"{self.base_url}/print", json={
+        return self.print_job({
             "template": "custom",
             "layout": layout,
             "qty": qty
         })
-        response.raise_for_status()
-        return response.json()
+
+    # ------------------------------------------------------------
+    # 客户端合并发送
+    # ------------------------------------------------------------
+
+    def submit(self, template: str, item: Dict[str, Any], priority: str = "normal") -> Future:
+        """
+        提交一张标签（不阻塞）
+
+        同一模板、同一优先级的标签在客户端缓冲，攒够 batch_size 张或等待 linger 秒后
+        合并为一次 /print 请求发送。
+
+        Args:
+            template: 预设模板名称（single-text / double-text / qrcode-with-text / barcode-with-text）
+            item: print_list 中的一项，如 {"text": "A-001"}
+            priority: 优先级（urgent / normal / bulk）
+
+        Returns:
+            Future：服务端报告打印完成后得到该批次的打印结果（同一批次的标签得到同一个结果，含 job_id），
+            打印失败时为 requests 异常
+        """
+        key = (template, priority)
+        future: Future = Future()
+        with self._lock:
+            buffer = self._buffers.setdefault(key, [])
+            buffer.append((item, future))
+            if len(buffer) >= self.batch_size:
+                batch = self._take(key)
+            else:
+                batch = None
+                if len(buffer) == 1:
+                    timer = self._timers[key] = threading.Timer(self.linger, self._flush_key, (key,))
+                    timer.daemon = True
+                    timer.start()
+        if batch:
+            self._executor.submit(self._send, key, batch)
+        return future
+
+    def flush(self):
+        """立即发送所有缓冲中的标签并等待结果"""
+        with self._lock:
+            batches = [(key, self._take(key)) for key in list(self._buffers)]
+        futures = [self._executor.submit(self._send, key, batch) for key, batch in batches if batch]
+        for future in futures:
+            future.result()
+
+    def _flush_key(self, key: Tuple[str, str]):
+        """linger 到期：发送该模板的缓冲"""
+        with self._lock:
+            batch = self._take(key)
+        if batch:
+            self._executor.submit(self._send, key, batch)
+
+    def _take(self, key: Tuple[str, str]) -> List[Tuple[Dict[str, Any], Future]]:
+        """取出缓冲并取消定时器（调用方持有 _lock）"""
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        return self._buffers.pop(key, [])
+
+    def _send(self, key: Tuple[str, str], batch: List[Tuple[Dict[str, Any], Future]]):
+        """发送一个批次，把结果分发给该批次的所有 future"""
+        try:
+            result = self.print_job(_batch_body(key, [item for item, _ in batch]))
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+        else:
+            for _, future in batch:
+                future.set_result(result)
+
+
+class AsyncTSCPrintClient:
+    """
+    asyncio 打印客户端（基于 httpx.AsyncClient，共享连接池）
+
+    参数同 TSCPrintClient；所有接口方法都是协程，submit() 返回 asyncio.Future。
+    """
+
+    def __init__(
+        self,
+        base_url: str = BASE_URL,
+        api_key: str = None,
+        timeout: float = 300,
+        retries: int = 3,
+        backoff: float = 0.5,
+        pool_size: int = 4,
+        batch_size: int = 100,
+        linger: float = 0.05
+    ):
+        import httpx
+
+        self._httpx = httpx
+        self.retries = retries
+        self.backoff = backoff
+        self.batch_size = batch_size
+        self.linger = linger
+        self.client = httpx.AsyncClient(
+            base_url=base_url.rstrip("/"),
+            timeout=timeout,
+            headers={"X-API-Key": api_key} if api_key else None,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        )
+        self._buffers: Dict[Tuple[str, str], List[Tuple[Dict[str, Any], asyncio.Future]]] = {}
+        self._timers: Dict[Tuple[str, str], asyncio.TimerHandle] = {}
+        self._sending: set = set()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        """发送缓冲中的标签，等待所有请求完成后关闭连接"""
+        await self.flush()
+        await self.client.aclose()
+
+    async def request(self, method: str, path: str, body: Dict[str, Any] = None, idempotent: bool = False) -> Dict[str, Any]:
+        """
+        发送请求（连接失败、超时时重试，同 TSCPrintClient.request）
+
+        Raises:
+            httpx.HTTPStatusError: 服务端返回错误
+            httpx.TransportError: 重试次数用完
+        """
+        headers = {"Idempotency-Key": uuid.uuid4().hex} if idempotent else None
+        for attempt in range(self.retries + 1):
+            try:
+                response = await self.client.request(method, path, json=body, headers=headers)
+            except self._httpx.TransportError:
+                if attempt == self.retries:
+                    raise
+                await asyncio.sleep(_backoff(attempt, self.backoff))
+                continue
+            if response.status_code in RETRY_STATUS and attempt < self.retries:
+                await asyncio.sleep(_backoff(attempt, self.backoff))
+                continue
+            response.raise_for_status()
+            return response.json()
+
+    async def health_check(self) -> Dict[str, Any]:
+        """健康检查"""
+        return await self.request("GET", "/health")
+
+    async def print_job(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """提交一个完整的 /print 请求体，打印完成后返回"""
+        return await self.request("POST", "/print", job, idempotent=True)
+
+    async def get_job(self, job_id: str) -> Dict[str, Any]:
+        """查询打印任务状态"""
+        return await self.request("GET", f"/jobs/{job_id}")
+
+    def submit(self, template: str, item: Dict[str, Any], priority: str = "normal") -> asyncio.Future:
+        """
+        提交一张标签（不阻塞，需要在事件循环中调用），合并规则同 TSCPrintClient.submit
+
+        Returns:
+            asyncio.Future：服务端报告打印完成后得到该批次的打印结果
+        """
+        loop = asyncio.get_running_loop()
+        key = (template, priority)
+        future = loop.create_future()
+        buffer = self._buffers.setdefault(key, [])
+        buffer.append((item, future))
+        if len(buffer) >= self.batch_size:
+            self._start(key)
+        elif len(buffer) == 1:
+            self._timers[key] = loop.call_later(self.linger, self._start, key)
+        return future
+
+    async def flush(self):
+        """立即发送所有缓冲中的标签并等待结果"""
+        for key in list(self._buffers):
+            self._start(key)
+        if self._sending:
+            await asyncio.gather(*self._sending, return_exceptions=True)
+
+    def _start(self, key: Tuple[str, str]):
+        """取出缓冲并在后台发送"""
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._buffers.pop(key, [])
+        if batch:
+            task = asyncio.ensure_future(self._send(key, batch))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, key: Tuple[str, str], batch: List[Tuple[Dict[str, Any], asyncio.Future]]):
+        """发送一个批次，把结果分发给该批次的所有 future"""
+        try:
+            result = await self.print_job(_batch_body(key, [item for item, _ in batch]))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(result)
 
 
 def example_1_single_text():
@@ -338,6 +662,37 @@ def example_8_error_handling():
         print("❌ 无法连接到打印服务，请确认服务是否启动")
 
 
+def example_9_client_batching():
+    """示例9: 客户端合并发送（扫码枪逐张提交，合并为少量 /print 请求）"""
+    print("\n=== 示例9: 客户端合并发送 ===")
+    
+    with TSCPrintClient(api_key="station-01", batch_size=50, linger=0.1) as client:
+        futures = [
+            client.submit("single-text", {"text": f"SN-{i:04d}"})
+            for i in range(1, 121)
+        ]
+        # 120 张标签合并为 3 次请求（50 + 50 + 20），全部打印完成后返回
+        job_ids = {future.result()["job_id"] for future in futures}
+    
+    print(f"✅ 120张标签，{len(job_ids)}个打印任务")
+
+
+def example_10_async_client():
+    """示例10: asyncio 客户端（需要 pip install httpx）"""
+    print("\n=== 示例10: asyncio 客户端 ===")
+    
+    async def run():
+        async with AsyncTSCPrintClient(api_key="station-02") as client:
+            futures = [
+                client.submit("barcode-with-text", {"barcode": f"{i:010d}", "text": f"订单号: {i:010d}"})
+                for i in range(1, 21)
+            ]
+            results = await asyncio.gather(*futures)
+            print(f"✅ {results[0]['message']}")
+    
+    asyncio.run(run())
+
+
 def main():
     """主函数 - 运行所有示例"""
     print("=" * 60)
@@ -363,7 +718,9 @@ def main():
         example_5_custom_simple,
         example_6_custom_complex,
         example_7_batch_printing,
-        example_8_error_handling
+        example_8_error_handling,
+        example_9_client_batching,
+        example_10_async_client
     ]
     
     for example in examples:
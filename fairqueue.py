@@ -0,0 +1,101 @@
+"""
+公平队列模块
+同一优先级内按客户端（API Key 或来源 IP）分队列，以标签为单位做加权差额轮询（Deficit Round Robin）
+
+- 每个客户端轮到时获得 权重 × FAIR_QUANTUM 张标签的额度，每发送一张标签扣除 1，
+  额度用完或没有可执行的任务时轮到下一个客户端
+- 同一客户端的任务按提交顺序执行
+- 一个客户端提交的大批量任务不会让其他客户端的小任务一直等待：
+  最多等待其他客户端各发送一轮额度的标签
+
+非线程安全，由调用方（jobs）持有锁访问。
+"""
+from collections import OrderedDict, deque
+from typing import Callable, Iterator, Optional
+
+from config import CLIENT_WEIGHTS, FAIR_QUANTUM
+
+
+def weight(client: str) -> int:
+    """客户端权重（CLIENT_WEIGHTS 中未配置的客户端为 1）"""
+    return CLIENT_WEIGHTS.get(client, 1)
+
+
+class FairQueue:
+    """
+    一个优先级的任务队列
+
+    队列元素需要有 client 属性（客户端标识）。
+    """
+
+    def __init__(self):
+        # 客户端 -> 任务队列；顺序即轮询顺序，第一个为当前轮到的客户端
+        self._clients: "OrderedDict[str, deque]" = OrderedDict()
+        self._deficit: dict[str, float] = {}
+        self._turn: Optional[str] = None  # 已获得本轮额度的客户端
+
+    def __len__(self) -> int:
+        return sum(len(tasks) for tasks in self._clients.values())
+
+    def __iter__(self) -> Iterator:
+        """所有任务（按当前轮询顺序）"""
+        for tasks in self._clients.values():
+            yield from tasks
+
+    def __contains__(self, task) -> bool:
+        tasks = self._clients.get(task.client)
+        return tasks is not None and task in tasks
+
+    def append(self, task):
+        """任务加入所属客户端队列的末尾（新客户端排在轮询顺序的末尾）"""
+        self._clients.setdefault(task.client, deque()).append(task)
+
+    def appendleft(self, task):
+        """任务加入所属客户端队列的开头（重试中断的任务）"""
+        self._clients.setdefault(task.client, deque()).appendleft(task)
+
+    def remove(self, task):
+        """移出任务；客户端没有任务时退出轮询并清零额度"""
+        tasks = self._clients.get(task.client)
+        if tasks is None or task not in tasks:
+            return
+        tasks.remove(task)
+        if not tasks:
+            del self._clients[task.client]
+            self._deficit.pop(task.client, None)
+            if self._turn == task.client:
+                self._turn = None
+
+    def pick(self, runnable: Callable[[object], bool]):
+        """
+        选择下一张标签所属的任务
+
+        Args:
+            runnable: 判断任务当前能否执行（如未暂停）
+
+        Returns:
+            任务；没有可执行的任务时返回 None
+        """
+        # 每个客户端最多检查两次：额度用完轮换一次、获得新额度后再检查一次
+        for _ in range(2 * len(self._clients) + 1):
+            if not self._clients:
+                return None
+            client, tasks = next(iter(self._clients.items()))
+            if self._turn != client:
+                self._deficit[client] = self._deficit.get(client, 0) + weight(client) * FAIR_QUANTUM
+                self._turn = client
+
+            task = next((task for task in tasks if runnable(task)), None)
+            if task is not None and self._deficit[client] >= 1:
+                return task
+            if task is None:
+                # 没有可执行的任务（如全部暂停）：额度不保留
+                self._deficit[client] = 0
+            self._clients.move_to_end(client)
+            self._turn = None
+        return None
+
+    def charge(self, client: str, labels: int = 1):
+        """扣除客户端额度（每发送一张标签）"""
+        if client in self._deficit:
+            self._deficit[client] -= labels
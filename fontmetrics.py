@@ -0,0 +1,292 @@
+"""
+字体度量模块
+从本地字体文件（TTF/TTC）读取字符步进宽度，精确计算 Windows 字体文本的打印宽度
+
+- 每种字体只在第一次使用时解析一次，按 BMP 码位索引保存为紧凑的 uint16 数组
+- 单条文本宽度按 (文本, 字体, 高度) 做 LRU 缓存
+- 批量宽度使用 NumPy 一次查表计算
+- 找不到字体文件时回退到估算规则（中文和全角字符 = 字体高度，其他 = 0.6 倍字体高度）
+"""
+import logging
+import os
+import struct
+import threading
+from functools import lru_cache
+
+import numpy as np
+
+from config import FONT_FILES, FONT_WIDTH_CACHE_SIZE
+
+# 估算规则的字符宽度分类表（BMP 码位 -> 宽度类别）：
+#   - 宽字符：中文字符 U+4E00-U+9FFF、中文标点 U+3000-U+303F、
+#     全角字符 U+FF00-U+FF60 和 U+FFE0-U+FFE6（全角标点、数字、字母、货币符号），宽度等于字体高度
+#   - 窄字符：英文、数字、其他符号（含半角片假名等半角形式、BMP 以外的字符），宽度为字体高度的 0.6 倍
+_NARROW = 0
+_WIDE = 1
+_WIDTH_CLASS_TABLE = np.full(0x10000, _NARROW, dtype=np.uint8)
+_WIDTH_CLASS_TABLE[0x4E00:0xA000] = _WIDE
+_WIDTH_CLASS_TABLE[0x3000:0x3040] = _WIDE
+_WIDTH_CLASS_TABLE[0xFF00:0xFF61] = _WIDE
+_WIDTH_CLASS_TABLE[0xFFE0:0xFFE7] = _WIDE
+
+
+class FontMetrics:
+    """
+    单个字体的步进宽度表
+
+    - advances: 长度 65536 的 uint16 数组，按码位索引的步进宽度（字体单位），
+      字体中没有的字符按估算规则填充
+    - cell_height: 字符单元高度（字体单位，usWinAscent + usWinDescent），
+      Windows 字体的高度参数对应该值
+    """
+
+    def __init__(self, name: str, path: str, advances: np.ndarray, cell_height: int):
+        self.name = name
+        self.path = path
+        self.advances = advances
+        self.cell_height = cell_height
+
+
+_fonts: dict[str, FontMetrics | None] = {}
+_fonts_lock = threading.Lock()
+
+
+def get_font_metrics(font_name: str) -> FontMetrics | None:
+    """
+    获取字体度量（首次调用时从字体文件加载）
+
+    Args:
+        font_name: 字体名称（如 "宋体"、"Arial"），对应 config.FONT_FILES 中的键
+
+    Returns:
+        FontMetrics，字体未配置或文件不存在时返回 None
+    """
+    if font_name in _fonts:
+        return _fonts[font_name]
+
+    with _fonts_lock:
+        if font_name not in _fonts:
+            _fonts[font_name] = _load_font_metrics(font_name)
+        return _fonts[font_name]
+
+
+def _load_font_metrics(font_name: str) -> FontMetrics | None:
+    """按 config.FONT_FILES 中的候选路径加载字体"""
+    for path in FONT_FILES.get(font_name, []):
+        if not os.path.exists(path):
+            continue
+        try:
+            advances, cell_height = _parse_font_file(path)
+        except (OSError, ValueError, struct.error) as e:
+            logging.warning(f"字体文件解析失败: {path}: {e}")
+            continue
+        logging.info(f"字体度量已加载: {font_name} ({path})")
+        return FontMetrics(font_name, path, advances, cell_height)
+
+    logging.warning(f"未找到字体文件，文本宽度使用估算值: {font_name}")
+    return None
+
+
+def _parse_font_file(path: str, index: int = 0) -> tuple[np.ndarray, int]:
+    """
+    解析 TrueType 字体文件（TTF，或 TTC 中的第 index 个字体）
+
+    只读取计算步进宽度所需的 head / hhea / hmtx / cmap / OS/2 表。
+
+    Returns:
+        (按码位索引的步进宽度数组, 字符单元高度)
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+
+    offset = 0
+    if data[:4] == b"ttcf":
+        num_fonts = struct.unpack_from(">I", data, 8)[0]
+        if index >= num_fonts:
+            raise ValueError(f"TTC 中只有 {num_fonts} 个字体")
+        offset = struct.unpack_from(">I", data, 12 + 4 * index)[0]
+
+    num_tables = struct.unpack_from(">H", data, offset + 4)[0]
+    tables = {}
+    for i in range(num_tables):
+        tag, _, table_offset, _ = struct.unpack_from(">4sIII", data, offset + 12 + 16 * i)
+        tables[tag.decode("latin-1")] = table_offset
+    for tag in ("head", "hhea", "hmtx", "cmap"):
+        if tag not in tables:
+            raise ValueError(f"缺少 {tag} 表")
+
+    units_per_em = struct.unpack_from(">H", data, tables["head"] + 18)[0]
+    ascender, descender = struct.unpack_from(">hh", data, tables["hhea"] + 4)
+    num_hmetrics = struct.unpack_from(">H", data, tables["hhea"] + 34)[0]
+    if "OS/2" in tables:
+        win_ascent, win_descent = struct.unpack_from(">HH", data, tables["OS/2"] + 74)
+        cell_height = win_ascent + win_descent
+    else:
+        cell_height = ascender - descender
+    if cell_height <= 0:
+        cell_height = units_per_em
+
+    # hmtx: numberOfHMetrics 个 (advanceWidth, lsb)，之后的字形沿用最后一个步进宽度
+    glyph_advances = np.frombuffer(
+        data, dtype=">u2", count=num_hmetrics * 2, offset=tables["hmtx"]
+    )[0::2].astype(np.int64)
+
+    glyphs = _parse_cmap(data, tables["cmap"])
+    mapped = glyphs > 0
+    advances = np.where(
+        _WIDTH_CLASS_TABLE == _WIDE, cell_height, int(cell_height * 0.6)
+    ).astype(np.int64)
+    advances[mapped] = glyph_advances[np.minimum(glyphs[mapped], num_hmetrics - 1)]
+    return advances.astype(np.uint16), cell_height
+
+
+def _parse_cmap(data: bytes, cmap_offset: int) -> np.ndarray:
+    """
+    解析 cmap 表，返回 BMP 码位 -> 字形编号 数组（0 表示没有字形）
+
+    优先使用 Unicode 全字符集子表（format 12），其次 BMP 子表（format 4）。
+    """
+    num_subtables = struct.unpack_from(">H", data, cmap_offset + 2)[0]
+    candidates = {}
+    for i in range(num_subtables):
+        platform_id, encoding_id, sub_offset = struct.unpack_from(">HHI", data, cmap_offset + 4 + 8 * i)
+        sub = cmap_offset + sub_offset
+        fmt = struct.unpack_from(">H", data, sub)[0]
+        if (platform_id, encoding_id) in ((3, 10), (0, 4), (0, 6)) and fmt == 12:
+            candidates.setdefault(12, sub)
+        elif (platform_id, encoding_id) in ((3, 1), (0, 3), (0, 1), (0, 0)) and fmt == 4:
+            candidates.setdefault(4, sub)
+
+    glyphs = np.zeros(0x10000, dtype=np.int64)
+    if 12 in candidates:
+        sub = candidates[12]
+        num_groups = struct.unpack_from(">I", data, sub + 12)[0]
+        for g in range(num_groups):
+            start, end, start_glyph = struct.unpack_from(">III", data, sub + 16 + 12 * g)
+            if start > 0xFFFF:
+                break
+            end = min(end, 0xFFFF)
+            glyphs[start:end + 1] = np.arange(start_glyph, start_glyph + end - start + 1)
+        return glyphs
+
+    if 4 not in candidates:
+        raise ValueError("没有可用的 Unicode cmap 子表")
+
+    sub = candidates[4]
+    seg_count = struct.unpack_from(">H", data, sub + 6)[0] // 2
+    ends_at = sub + 14
+    starts_at = ends_at + 2 * seg_count + 2
+    deltas_at = starts_at + 2 * seg_count
+    range_offsets_at = deltas_at + 2 * seg_count
+    for s in range(seg_count):
+        end = struct.unpack_from(">H", data, ends_at + 2 * s)[0]
+        start = struct.unpack_from(">H", data, starts_at + 2 * s)[0]
+        delta = struct.unpack_from(">h", data, deltas_at + 2 * s)[0]
+        range_offset = struct.unpack_from(">H", data, range_offsets_at + 2 * s)[0]
+        if start > end:
+            continue
+        codes = np.arange(start, end + 1)
+        if range_offset == 0:
+            glyphs[start:end + 1] = (codes + delta) & 0xFFFF
+        else:
+            # glyphIdArray 相对于 idRangeOffset[s] 自身地址寻址
+            base = range_offsets_at + 2 * s + range_offset
+            ids = np.frombuffer(data, dtype=">u2", count=end - start + 1, offset=base).astype(np.int64)
+            glyphs[start:end + 1] = np.where(ids != 0, (ids + delta) & 0xFFFF, 0)
+    # 0xFFFF 段只是结束标记
+    glyphs[0xFFFF] = 0
+    return glyphs
+
+
+@lru_cache(maxsize=64)
+def _dot_widths(font_name: str, font_height: int) -> np.ndarray | None:
+    """
+    指定字体和高度下按码位索引的字符宽度（dots）
+
+    与 GDI 一致，每个字形的步进宽度先按像素取整再累加。
+    """
+    font = get_font_metrics(font_name)
+    if font is None:
+        return None
+    return np.rint(font.advances * (font_height / font.cell_height)).astype(np.int32)
+
+
+@lru_cache(maxsize=FONT_WIDTH_CACHE_SIZE)
+def text_width(text: str, font_height: int, font_name: str = None) -> int:
+    """
+    计算文本打印宽度（单位：dots），结果按 (文本, 高度, 字体) 缓存
+
+    Args:
+        text: 文本内容
+        font_height: 字体高度（点）
+        font_name: 字体名称，为 None 或找不到字体文件时使用估算规则
+
+    Returns:
+        文本宽度（dots）
+    """
+    table = _dot_widths(font_name, font_height) if font_name else None
+    if table is None:
+        return _heuristic_width(text, font_height)
+    codes = np.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+    # mode="clip"：BMP 以外的字符按 U+FFFF 处理
+    return int(table.take(codes, mode="clip").sum())
+
+
+def text_widths(texts: list[str], font_height: int, font_name: str = None) -> list[int]:
+    """
+    批量计算文本打印宽度（单位：dots）
+
+    所有文本拼接后转换为码位数组，一次查表得到每个字符的宽度，
+    再按文本边界分段求和，结果与逐条调用 text_width 完全一致。
+
+    Args:
+        texts: 文本列表
+        font_height: 字体高度（点）
+        font_name: 字体名称，为 None 或找不到字体文件时使用估算规则
+
+    Returns:
+        与 texts 一一对应的宽度列表（dots）
+    """
+    if not texts:
+        return []
+
+    codes = np.frombuffer("".join(texts).encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+    ends = np.cumsum(lengths)
+
+    table = _dot_widths(font_name, font_height) if font_name else None
+    if table is not None:
+        cumulative = np.concatenate(([0], np.cumsum(table.take(codes, mode="clip"), dtype=np.int64)))
+        return (cumulative[ends] - cumulative[ends - lengths]).tolist()
+
+    # 估算规则只有两种宽度，统计每条文本中的宽字符数即可
+    wide_cumulative = np.concatenate(
+        ([0], np.cumsum(_WIDTH_CLASS_TABLE.take(codes, mode="clip"), dtype=np.int32))
+    )
+    wide_counts = wide_cumulative[ends] - wide_cumulative[ends - lengths]
+    narrow_width = int(font_height * 0.6)
+    return (lengths * narrow_width + wide_counts * (font_height - narrow_width)).tolist()
+
+
+def _heuristic_width(text: str, font_height: int) -> int:
+    """估算规则：宽字符（_WIDTH_CLASS_TABLE）宽度等于字体高度，其他字符为字体高度的 0.6 倍"""
+    width = 0
+    for char in text:
+        code = ord(char)
+        if code <= 0xFFFF and _WIDTH_CLASS_TABLE[code] == _WIDE:
+            width += font_height
+        else:
+            width += int(font_height * 0.6)
+    return width
+
+
+def cache_info() -> dict:
+    """文本宽度缓存命中统计"""
+    info = text_width.cache_info()
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "size": info.currsize,
+        "maxsize": info.maxsize,
+        "fonts": {name: font.path if font else None for name, font in _fonts.items()},
+    }
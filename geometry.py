@@ -0,0 +1,199 @@
+"""
+条码几何计算模块
+根据内容计算二维码（QR Code）和一维码（Code 128）的实际打印尺寸，用于居中布局
+
+- 二维码：按内容和纠错等级 H 计算最小版本号，模块数 = 17 + 4 × 版本号
+- Code 128：按最少码字的方式在 A/B/C 字符集之间切换（连续数字使用 C 集两位一码），
+  得到总模块数
+- 结果按内容做 LRU 缓存，同一内容重复打印时不再重复计算
+"""
+from functools import lru_cache
+
+from config import GEOMETRY_CACHE_SIZE
+
+# ============================================================
+# QR Code
+# ============================================================
+
+# 纠错等级 H 下版本 1-40 的数据码字数
+_QR_DATA_CODEWORDS_H = (
+    9, 16, 26, 36, 46, 60, 66, 86, 100, 122,
+    140, 158, 180, 197, 223, 253, 283, 313, 341, 385,
+    406, 442, 464, 514, 538, 596, 628, 661, 701, 745,
+    793, 845, 901, 961, 986, 1054, 1096, 1142, 1222, 1276,
+)
+
+# 字母数字模式可编码的字符
+_QR_ALPHANUMERIC = set("0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ $%*+-./:")
+
+# 各模式字符计数指示符的位数（版本 1-9 / 10-26 / 27-40）
+_QR_COUNT_BITS = {
+    "numeric": (10, 12, 14),
+    "alphanumeric": (9, 11, 13),
+    "byte": (8, 16, 16),
+}
+
+
+def _qr_mode(content: str) -> str:
+    """选择能编码全部内容的最紧凑模式"""
+    if content.isascii() and content.isdigit():
+        return "numeric"
+    if all(char in _QR_ALPHANUMERIC for char in content):
+        return "alphanumeric"
+    return "byte"
+
+
+def _qr_payload_bits(content: str, mode: str) -> int:
+    """数据部分的位数（不含模式指示符和字符计数指示符）"""
+    if mode == "numeric":
+        n = len(content)
+        return 10 * (n // 3) + (0, 4, 7)[n % 3]
+    if mode == "alphanumeric":
+        n = len(content)
+        return 11 * (n // 2) + 6 * (n % 2)
+    # 字节模式按 UTF-8 编码计算
+    return 8 * len(content.encode("utf-8"))
+
+
+@lru_cache(maxsize=GEOMETRY_CACHE_SIZE)
+def qr_version(content: str) -> int:
+    """
+    计算内容在纠错等级 H 下所需的最小二维码版本
+
+    Args:
+        content: 二维码内容
+
+    Returns:
+        版本号（1-40）
+
+    Raises:
+        ValueError: 内容超出版本 40 的容量
+    """
+    mode = _qr_mode(content)
+    payload_bits = _qr_payload_bits(content, mode)
+    count_bits = _QR_COUNT_BITS[mode]
+
+    for version, codewords in enumerate(_QR_DATA_CODEWORDS_H, start=1):
+        size_class = 0 if version <= 9 else 1 if version <= 26 else 2
+        bits = 4 + count_bits[size_class] + payload_bits
+        if bits <= codewords * 8:
+            return version
+
+    raise ValueError(f"二维码内容过长（{len(content)}个字符），超出纠错等级H的最大容量")
+
+
+def qr_modules(content: str) -> int:
+    """二维码每边的模块数（不含静区）"""
+    return 17 + 4 * qr_version(content)
+
+
+def qr_width(content: str, cell_width: int) -> int:
+    """
+    二维码打印宽度（单位：dots）
+
+    Args:
+        content: 二维码内容
+        cell_width: 单元宽度（QRCODE 指令的 cell width 参数）
+    """
+    return qr_modules(content) * cell_width
+
+
+# ============================================================
+# Code 128
+# ============================================================
+
+_CODE128_SYMBOL_MODULES = 11  # 起始符、数据码字、校验码字各 11 个模块
+_CODE128_STOP_MODULES = 13  # 终止符（含终止条）
+
+
+def _code128_in_set_a(code: int) -> bool:
+    return code < 96
+
+
+def _code128_in_set_b(code: int) -> bool:
+    return 32 <= code < 128
+
+
+@lru_cache(maxsize=GEOMETRY_CACHE_SIZE)
+def code128_symbols(data: str) -> int:
+    """
+    计算 Code 128 编码所需的最少数据码字数（不含起始符、校验符、终止符）
+
+    在 A/B/C 三个字符集之间做最短路径搜索：
+    - A 集：控制字符和大写字母，B 集：可打印 ASCII，一个字符一个码字
+    - C 集：两位数字一个码字
+    - 切换字符集（CODE A/B/C）占一个码字，A/B 之间临时切换一个字符（SHIFT）也占一个码字
+
+    Args:
+        data: 条码内容（仅支持 ASCII）
+
+    Returns:
+        数据码字数
+
+    Raises:
+        ValueError: 内容包含 ASCII 以外的字符
+    """
+    if not data.isascii():
+        raise ValueError("Code 128 条码内容只能包含 ASCII 字符")
+
+    inf = float("inf")
+    n = len(data)
+    codes = [ord(char) for char in data]
+    # cost[i][s]：编码前 i 个字符后处于字符集 s（0=A, 1=B, 2=C）的最少码字数
+    cost = [[inf, inf, inf] for _ in range(n + 1)]
+    cost[0] = [0, 0, 0]  # 起始符可以直接选择任意字符集
+
+    for i in range(n + 1):
+        # 切换字符集
+        best = min(cost[i])
+        for s in range(3):
+            cost[i][s] = min(cost[i][s], best + 1)
+        if i == n:
+            break
+
+        code = codes[i]
+        in_a = _code128_in_set_a(code)
+        in_b = _code128_in_set_b(code)
+        for s, current in ((0, cost[i][0]), (1, cost[i][1])):
+            in_current = in_a if s == 0 else in_b
+            in_other = in_b if s == 0 else in_a
+            if in_current:
+                cost[i + 1][s] = min(cost[i + 1][s], current + 1)
+            elif in_other:
+                # SHIFT：只对下一个字符临时使用另一个字符集
+                cost[i + 1][s] = min(cost[i + 1][s], current + 2)
+        if i + 1 < n and data[i].isdigit() and data[i + 1].isdigit():
+            cost[i + 2][2] = min(cost[i + 2][2], cost[i][2] + 1)
+
+    return int(min(cost[n]))
+
+
+def code128_modules(data: str) -> int:
+    """Code 128 条码总模块数（起始符 + 数据 + 校验符 + 终止符，不含静区）"""
+    symbols = 1 + code128_symbols(data) + 1
+    return symbols * _CODE128_SYMBOL_MODULES + _CODE128_STOP_MODULES
+
+
+def code128_width(data: str, narrow: int) -> int:
+    """
+    Code 128 条码打印宽度（单位：dots）
+
+    Args:
+        data: 条码内容
+        narrow: 窄条宽度（BARCODE 指令的 narrow 参数，即单个模块的宽度）
+    """
+    return code128_modules(data) * narrow
+
+
+def cache_info() -> dict:
+    """几何计算缓存命中统计"""
+    result = {}
+    for name, func in (("qr_version", qr_version), ("code128_symbols", code128_symbols)):
+        info = func.cache_info()
+        result[name] = {
+            "hits": info.hits,
+            "misses": info.misses,
+            "size": info.currsize,
+            "maxsize": info.maxsize,
+        }
+    return result
@@ -0,0 +1,126 @@
+"""
+幂等请求模块
+按 Idempotency-Key 缓存最近的打印请求及其结果（有界、带过期时间）
+
+- 同一个键的重试请求直接返回第一次的结果，不会再次打印
+- 第一次请求仍在打印时，重试请求等待它完成后返回同一个结果
+- 同一个键对应不同的请求内容时拒绝执行（IdempotencyConflict）
+- 可重试的失败（如打印机通信失败且没有打印任何标签）不缓存：正在等待的重试请求收到同一个错误，
+  之后的重试重新执行
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Tuple
+
+import metrics
+from config import IDEMPOTENCY_MAX_ENTRIES, IDEMPOTENCY_TTL
+
+
+class IdempotencyConflict(Exception):
+    """同一个幂等键被用于不同的请求内容"""
+
+
+class Replayed(Exception):
+    """重放第一次执行时的异常（原始异常见 error）"""
+
+    def __init__(self, error: Exception):
+        super().__init__(str(error))
+        self.error = error
+
+
+class _Entry:
+    """一个幂等键对应的请求：执行中或已完成（结果或异常）"""
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.finished = None
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def outcome(self) -> Any:
+        """返回结果，或抛出 Replayed（包含第一次执行时的异常）"""
+        if self.error is not None:
+            raise Replayed(self.error) from self.error
+        return self.result
+
+
+_lock = threading.Lock()
+_entries: "OrderedDict[str, _Entry]" = OrderedDict()
+
+
+def execute(
+    key: str,
+    fingerprint: str,
+    func: Callable[[], Any],
+    retryable: Optional[Callable[[Exception], bool]] = None
+) -> Tuple[Any, bool]:
+    """
+    按幂等键执行请求
+
+    Args:
+        key: 幂等键（客户端提供的 Idempotency-Key，或服务端计算的请求哈希）
+        fingerprint: 请求内容摘要，用于发现同一个键被用于不同的请求
+        func: 实际执行打印的函数
+        retryable: 判断 func 抛出的异常是否可重试；可重试的异常不缓存，之后使用同一个键的请求重新执行
+
+    Returns:
+        (结果, 是否为重放的结果)
+
+    Raises:
+        IdempotencyConflict: 同一个键对应的请求内容不同
+        Replayed: 重试请求得到第一次执行时的异常
+        其他异常: func 抛出的异常
+    """
+    with _lock:
+        _evict(time.monotonic())
+        entry = _entries.get(key)
+        if entry is not None and entry.fingerprint != fingerprint:
+            raise IdempotencyConflict(f"Idempotency-Key 已用于不同的请求内容: {key}")
+        owner = entry is None
+        if owner:
+            entry = _entries[key] = _Entry(fingerprint)
+
+    if not owner:
+        # 重试：等待第一次请求完成（已完成时立即返回）
+        metrics.inc("idempotency.attached" if not entry.done.is_set() else "idempotency.replayed")
+        entry.done.wait()
+        return entry.outcome(), True
+
+    try:
+        entry.result = func()
+    except Exception as e:
+        entry.error = e
+        if retryable is not None and retryable(e):
+            with _lock:
+                if _entries.get(key) is entry:
+                    del _entries[key]
+            metrics.inc("idempotency.retryable")
+        raise
+    finally:
+        entry.finished = time.monotonic()
+        entry.done.set()
+    return entry.result, False
+
+
+def _evict(now: float):
+    """清理过期条目，并在超过容量时淘汰最早的已完成条目（调用方持有 _lock）"""
+    # 过期时间从请求完成时开始计算；执行中的条目不会被清理
+    while _entries:
+        key, entry = next(iter(_entries.items()))
+        if not entry.done.is_set() or now - entry.finished < IDEMPOTENCY_TTL:
+            break
+        del _entries[key]
+
+    if len(_entries) >= IDEMPOTENCY_MAX_ENTRIES:
+        for key in [key for key, entry in _entries.items() if entry.done.is_set()]:
+            del _entries[key]
+            if len(_entries) < IDEMPOTENCY_MAX_ENTRIES:
+                break
+
+
+def size() -> int:
+    """当前缓存的请求数"""
+    with _lock:
+        return len(_entries)
@@ -0,0 +1,861 @@
+"""
+打印任务调度模块
+所有打印任务提交到队列，由唯一的打印线程（print-worker）持有打印机会话逐张发送标签，
+并发请求不再各自打开 USB 端口。
+
+- 任务内容和发送进度记入任务日志（journal），服务重启后从第一张未确认的标签继续打印
+- USB 中断时已部分打印的任务进入 interrupted 状态，状态轮询发现打印机重新连接时
+  （最迟每隔 JOB_RETRY_INTERVAL 秒）重试，从中断处继续
+- 打印机缺纸、开盖、暂停时在标签边界暂停发送（见 status），恢复后自动继续
+- 打印机未连接时提交的请求暂存在离线队列（见 spool），重新连接后先于新任务
+  在同一个会话中按顺序回放
+- 任务按优先级（JOB_LANES：urgent / normal / bulk）分队列，打印线程每发送一张标签后
+  重新选择最高优先级的任务，紧急任务可以插在大批量任务的两张标签之间打印；
+  同一优先级内按客户端公平轮询（见 fairqueue），同一客户端的任务按提交顺序执行
+- 任务可以取消、暂停和继续（cancel / pause / resume），打印线程在下一个标签边界执行
+- 提交任务的请求线程等待任务结束（完成、失败或中断）后返回
+- 每张标签的发送耗时和间隔用于校准打印时间估算（见 throughput），queue() 按调度顺序估算各任务的完成时间
+"""
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import nullcontext
+from typing import Callable, Iterator, List, Optional
+
+import fairqueue
+import journal
+import logs
+import metrics
+import profiling
+import program
+import spool
+import status
+import throughput
+from config import (
+    CLIENT_STATS_MAX, CLIENT_RATE_WINDOW,
+    JOB_CONTROL_TIMEOUT, JOB_HISTORY, JOB_LANES, JOB_LANE_SLO, JOB_RETRY_INTERVAL, STATUS_POLL_INTERVAL, SPOOL_WRITE_BYTES
+)
+from pipeline import PipelineStats, prerender, record
+from printer import Label, PrinterSession
+
+
+class TaskPart:
+    """
+    任务中的一段（/print 只有一段，/print/batch 每个子任务一段）
+
+    Args:
+        name: 名称（模板名）
+        render: 渲染函数，返回 Label 迭代器
+        describe: 根据执行统计生成结果描述
+        shape: 打印形状（标签数、走纸时间等），用于估算打印时间
+    """
+
+    def __init__(
+        self,
+        name: str,
+        render: Callable[[], Iterator[Label]],
+        describe: Callable[[PipelineStats], str],
+        shape: Optional[throughput.Shape] = None
+    ):
+        self.name = name
+        self.render = render
+        self.describe = describe
+        self.shape = shape
+
+
+class PrintTask:
+    """
+    打印任务
+
+    状态：queued（排队）→ printing（打印中）→ done（完成）/ failed（失败）；
+    USB 中断时为 interrupted，重试时回到 queued 从中断处继续；
+    暂停时为 paused，继续时回到 queued；取消后为 cancelled。
+
+    Args:
+        kind: 任务类型（print / batch / compiled）
+        payload: 请求内容（JSON），记入任务日志，服务重启后用于重新渲染
+        parts: 任务各段
+        task_id: 任务ID，默认自动生成；从任务日志恢复时使用原ID
+        sent: 已确认发送的标签数，从任务日志恢复时跳过这些标签
+        priority: 优先级（JOB_LANES 之一）
+        client: 提交任务的客户端（API Key 摘要或来源 IP），用于公平调度
+    """
+
+    def __init__(
+        self,
+        kind: str,
+        payload: str,
+        parts: List[TaskPart],
+        task_id: str = None,
+        sent: int = 0,
+        priority: str = "normal",
+        client: str = "local"
+    ):
+        self.id = task_id or uuid.uuid4().hex[:16]
+        self.kind = kind
+        self.priority = priority
+        self.client = client
+        self.payload = payload
+        self.parts = parts
+        self.recovered = task_id is not None
+        self.state = "queued"
+        self.sent = sent
+        self.results: List[Optional[dict]] = [None] * len(parts)
+        self.error: Optional[str] = None
+        self.device_error = False
+        self.created = time.time()
+        self.started: Optional[float] = None  # 发送第一张标签的时间
+        self.finished: Optional[float] = None
+        # 任务结束（完成、失败、中断、暂停或取消）时触发，请求线程据此返回
+        self.done = threading.Event()
+        self.buffer_cleared = False  # 取消时是否清除了打印机缓冲区
+
+        # 待打印线程执行的操作（"cancel" / "pause"），执行后置为 None
+        self._control: Optional[str] = None
+
+        # 执行位置（只由打印线程访问）
+        self._skip = sent  # 序号小于该值的标签已确认发送，重新渲染时跳过
+        self._position = 0  # 下一张标签在整个任务中的序号
+        self._part = 0
+        self._part_start = 0
+        self._rendered = None
+        self._stats = None
+        self._started = 0.0
+        self._profile = None  # 性能剖析器（见 profiling），未剖析时为 None
+
+    def labels(self) -> Optional[int]:
+        """任务的标签总数；有段没有打印形状时返回 None"""
+        if any(part.shape is None for part in self.parts):
+            return None
+        return sum(part.shape.labels for part in self.parts)
+
+    def remaining_seconds(self) -> Optional[float]:
+        """尚未发送的标签的估算打印时间（秒）；有段没有打印形状时返回 None"""
+        remaining = 0.0
+        start = 0
+        for part in self.parts:
+            if part.shape is None:
+                return None
+            end = start + part.shape.labels
+            if end > self.sent:
+                remaining += (end - max(start, self.sent)) * throughput.label_seconds(part.shape)
+            start = end
+        return remaining
+
+    def as_dict(self) -> dict:
+        """任务状态（用于接口响应）"""
+        remaining = None if self.state in journal.FINISHED_STATES else self.remaining_seconds()
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "priority": self.priority,
+            "client": self.client,
+            "state": self.state,
+            "sent": self.sent,
+            "labels": self.labels(),
+            "remaining_seconds": None if remaining is None else round(remaining, 1),
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+class JobStateError(Exception):
+    """任务当前状态不允许该操作（如取消已完成的任务）"""
+
+
+class _DeviceError(Exception):
+    """发送标签时打印机通信失败（原始异常见 __cause__）"""
+
+
+# _next_task 返回该标记时回放离线队列
+_SPOOL = object()
+
+_cond = threading.Condition()
+_lanes: dict[str, fairqueue.FairQueue] = {lane: fairqueue.FairQueue() for lane in JOB_LANES}  # 各优先级的任务队列
+_clients: "OrderedDict[str, dict]" = OrderedDict()  # 客户端统计（最近活动的 CLIENT_STATS_MAX 个）
+_interrupted: List[PrintTask] = []
+_retry_at = 0.0
+_drain = False  # 离线队列待回放
+_drain_at = 0.0  # 回放失败后的重试时间
+_tasks: "OrderedDict[str, PrintTask]" = OrderedDict()
+_worker: Optional[threading.Thread] = None
+_stopping = False
+_last_sent: Optional[float] = None  # 上一张标签发送完成的时间（连续发送时用于测量标签间隔）
+_NOT_PROFILED = nullcontext()
+
+
+def start():
+    """打开任务日志并启动打印线程"""
+    global _worker, _stopping, _drain, _drain_at
+    journal.open_journal()
+    status.add_listener(_on_status_change)
+    _stopping = False
+    _drain = bool(spool.pending())
+    _drain_at = 0.0
+    _worker = threading.Thread(target=_run, name="print-worker", daemon=True)
+    _worker.start()
+
+
+def stop(timeout: float = 10):
+    """
+    停止打印线程（在下一张标签边界停止）并关闭任务日志
+
+    未完成的任务保留在任务日志中，下次启动时继续打印。
+    """
+    global _stopping
+    with _cond:
+        _stopping = True
+        _cond.notify_all()
+    if _worker is not None:
+        _worker.join(timeout)
+
+    with _cond:
+        for task in _queued() + _interrupted:
+            if not task.done.is_set():
+                task.error = "服务正在停止，任务将在重启后继续打印"
+                task.device_error = True
+                task.done.set()
+    journal.close_journal()
+
+
+def submit(task: PrintTask) -> PrintTask:
+    """
+    提交任务（新任务同时记入任务日志）
+
+    Returns:
+        提交的任务，调用方可以等待 task.done
+    """
+    if not task.recovered:
+        journal.record(task.id, task.kind, task.payload, task.client)
+        task._profile = profiling.claim()
+    with _cond:
+        _tasks[task.id] = task
+        _trim_history()
+        _client_entry(task.client)["jobs"] += 1
+        _lanes[task.priority].append(task)
+        _update_queue_gauges()
+        _cond.notify_all()
+    return task
+
+
+def get(task_id: str) -> Optional[PrintTask]:
+    """查询内存中的任务（最近 JOB_HISTORY 个）"""
+    with _cond:
+        return _tasks.get(task_id)
+
+
+def cancel(task_id: str) -> Optional[PrintTask]:
+    """
+    取消任务：不再发送后续标签
+
+    打印中的任务在下一个标签边界停止；如果打印机中最后接收的标签属于该任务，
+    同时清除打印机缓冲区中尚未打印的标签。
+
+    Returns:
+        任务（等待打印线程执行，最多 JOB_CONTROL_TIMEOUT 秒）；任务不在内存中时返回 None
+
+    Raises:
+        JobStateError: 任务已结束
+    """
+    return _control(task_id, "cancel")
+
+
+def pause(task_id: str) -> Optional[PrintTask]:
+    """
+    暂停任务：在下一个标签边界停止发送，其他任务继续打印
+
+    Returns:
+        任务；任务不在内存中时返回 None
+
+    Raises:
+        JobStateError: 任务已结束或已暂停
+    """
+    return _control(task_id, "pause")
+
+
+def resume(task_id: str) -> Optional[PrintTask]:
+    """
+    继续暂停的任务（从第一张未发送的标签继续，按优先级重新排队）
+
+    Returns:
+        任务；任务不在内存中时返回 None
+
+    Raises:
+        JobStateError: 任务未暂停
+    """
+    with _cond:
+        task = _tasks.get(task_id)
+        if task is None:
+            return None
+        if task.state != "paused":
+            raise JobStateError(f"任务未暂停（{task.state}），无法继续")
+        task.state = "queued"
+        journal.update(task.id, "queued", task.sent)
+        _cond.notify_all()
+    logging.info("任务 %s 继续打印（已打印%d张）", task.id, task.sent)
+    return task
+
+
+def _control(task_id: str, action: str) -> Optional[PrintTask]:
+    """
+    请求打印线程取消或暂停任务，并等待执行
+
+    排队中、打印中的任务由打印线程在标签边界处理；中断等待重试的任务没有在执行，直接处理。
+    """
+    with _cond:
+        task = _tasks.get(task_id)
+        if task is None:
+            return None
+        if task.state in journal.FINISHED_STATES:
+            raise JobStateError(f"任务已结束（{task.state}）")
+        if action == "pause" and task.state == "paused":
+            raise JobStateError("任务已暂停")
+
+        if task in _interrupted:
+            _interrupted.remove(task)
+            if action == "pause":
+                task.state = "paused"
+                journal.update(task.id, "paused", task.sent, task.error)
+                _lanes[task.priority].appendleft(task)
+                _update_queue_gauges()
+        else:
+            task._control = action
+            _cond.notify_all()
+            _cond.wait_for(lambda: task._control is None, timeout=JOB_CONTROL_TIMEOUT)
+            return task
+
+    if action == "cancel":
+        _finish(task, "cancelled")
+    return task
+
+
+def lane_stats() -> dict:
+    """
+    各优先级的排队任务数和时延目标（SLO）达成情况
+
+    Returns:
+        {优先级: {"queued", "slo_seconds", "slo_met", "slo_missed", "slo_ratio"}}
+    """
+    counters = metrics.snapshot()["counters"]
+    with _cond:
+        queued = {lane: len(tasks) for lane, tasks in _lanes.items()}
+    stats = {}
+    for lane in JOB_LANES:
+        met = counters.get(f"jobs.slo_met.{lane}", 0)
+        missed = counters.get(f"jobs.slo_missed.{lane}", 0)
+        stats[lane] = {
+            "queued": queued[lane],
+            "slo_seconds": JOB_LANE_SLO[lane],
+            "slo_met": met,
+            "slo_missed": missed,
+            "slo_ratio": round(met / (met + missed), 4) if met + missed else None
+        }
+    return stats
+
+
+def queue() -> List[dict]:
+    """
+    排队和打印中的任务及估算的完成时间
+
+    按调度顺序（优先级从高到低，同一优先级内按当前轮询顺序）依次累加各任务的剩余打印时间；
+    同一优先级内客户端轮流打印，实际完成时间会在相邻任务之间交错。
+    暂停和中断等待重试的任务排在最后，不估算完成时间。
+
+    Returns:
+        任务状态列表，每项增加 eta_seconds（距完成的秒数）和 predicted_completion（完成时间戳）
+    """
+    with _cond:
+        tasks = _queued()
+        waiting = [task for task in tasks if task.state == "paused"] + list(_interrupted)
+        running = [task for task in tasks if task.state != "paused"]
+
+    now = time.time()
+    eta: Optional[float] = 0.0
+    entries = []
+    for task in running:
+        entry = task.as_dict()
+        remaining = entry["remaining_seconds"]
+        eta = None if eta is None or remaining is None else eta + remaining
+        entry["eta_seconds"] = None if eta is None else round(eta, 1)
+        entry["predicted_completion"] = None if eta is None else round(now + eta, 1)
+        entries.append(entry)
+    for task in waiting:
+        entries.append({**task.as_dict(), "eta_seconds": None, "predicted_completion": None})
+    return entries
+
+
+def client_stats() -> dict:
+    """
+    各客户端的排队任务数、吞吐量和等待时间
+
+    Returns:
+        {客户端: {"weight", "queued", "jobs", "labels", "labels_per_minute", "wait_avg", "wait_max"}}；
+        wait 为任务从提交到发送第一张标签的时间（秒）
+    """
+    now = time.monotonic()
+    with _cond:
+        queued = {}
+        for task in _queued():
+            queued[task.client] = queued.get(task.client, 0) + 1
+        stats = {}
+        for client, entry in _clients.items():
+            recent = entry["recent"]
+            while recent and now - recent[0] > CLIENT_RATE_WINDOW:
+                recent.popleft()
+            stats[client] = {
+                "weight": fairqueue.weight(client),
+                "queued": queued.get(client, 0),
+                "jobs": entry["jobs"],
+                "labels": entry["labels"],
+                "labels_per_minute": round(len(recent) * 60 / CLIENT_RATE_WINDOW, 1),
+                "wait_avg": round(entry["wait_sum"] / entry["waits"], 3) if entry["waits"] else None,
+                "wait_max": round(entry["wait_max"], 3),
+            }
+    return stats
+
+
+def _client_entry(client: str) -> dict:
+    """客户端统计条目（不存在时创建，淘汰最久没有活动的客户端；调用方持有 _cond）"""
+    entry = _clients.get(client)
+    if entry is None:
+        entry = _clients[client] = {
+            "jobs": 0, "labels": 0, "recent": deque(), "waits": 0, "wait_sum": 0.0, "wait_max": 0.0
+        }
+        while len(_clients) > CLIENT_STATS_MAX:
+            _clients.popitem(last=False)
+    else:
+        _clients.move_to_end(client)
+    return entry
+
+
+def _queued() -> List[PrintTask]:
+    """所有排队中的任务（按优先级，调用方持有 _cond）"""
+    return [task for lane in JOB_LANES for task in _lanes[lane]]
+
+
+def _update_queue_gauges():
+    """更新排队任务数指标（调用方持有 _cond）"""
+    for lane, tasks in _lanes.items():
+        metrics.set_gauge(f"jobs.queue_length.{lane}", len(tasks))
+    metrics.set_gauge("jobs.queue_length", sum(len(tasks) for tasks in _lanes.values()))
+
+
+def _dequeue(task: PrintTask):
+    """把任务移出所在优先级的队列（调用方持有 _cond）"""
+    lane = _lanes[task.priority]
+    if task in lane:
+        lane.remove(task)
+    _update_queue_gauges()
+
+
+def _trim_history():
+    """只保留最近的 JOB_HISTORY 个任务，优先淘汰最早结束的（调用方持有 _cond）"""
+    if len(_tasks) <= JOB_HISTORY:
+        return
+    for task_id in [task_id for task_id, task in _tasks.items() if task.state in journal.FINISHED_STATES]:
+        del _tasks[task_id]
+        if len(_tasks) <= JOB_HISTORY:
+            return
+
+
+def _on_status_change(state: dict):
+    """打印机重新连接后立即回放离线队列、重试中断的任务，不必等到重试间隔"""
+    global _retry_at, _drain, _drain_at
+    if state["state"] == "offline":
+        return
+    pending = spool.pending()
+    with _cond:
+        if _interrupted:
+            _retry_at = 0.0
+        if pending:
+            _drain = True
+            _drain_at = 0.0
+        _cond.notify_all()
+
+
+def _next_task(block: bool) -> Optional[PrintTask]:
+    """
+    取出下一个要执行的任务：最高优先级队列的队首（执行中的任务留在队首，逐张推进）
+
+    每张标签之后都重新选择，高优先级任务到达时在标签边界插入，被插队的任务稍后从下一张继续。
+
+    Args:
+        block: 队列为空时是否等待
+
+    Returns:
+        任务（离线队列待回放时为 _SPOOL）；队列为空且不等待，或正在停止时返回 None
+    """
+    with _cond:
+        while not _stopping:
+            # 取消、暂停请求先于打印处理
+            for task in _queued():
+                if task._control is not None:
+                    return task
+            now = time.monotonic()
+            if _drain and now >= _drain_at:
+                # 离线队列先于所有任务回放（其中的请求提交得更早）
+                return _SPOOL
+            if _interrupted and now >= _retry_at:
+                # 重试中断的任务（排在同一优先级的新任务之前，保持提交顺序）
+                for task in reversed(_interrupted):
+                    task.state = "queued"
+                    _lanes[task.priority].appendleft(task)
+                _interrupted.clear()
+                _update_queue_gauges()
+            for lane in JOB_LANES:
+                task = _lanes[lane].pick(lambda task: task.state != "paused")
+                if task is not None:
+                    return task
+            if not block:
+                return None
+            deadlines = ([_retry_at] if _interrupted else []) + ([_drain_at] if _drain else [])
+            _cond.wait(timeout=max(0.0, min(deadlines) - now) if deadlines else None)
+        return None
+
+
+def _run():
+    """打印线程：有任务时保持会话打开，逐张发送；队列空闲时关闭端口"""
+    session = None
+    held = None
+    current = None
+    while True:
+        task = _next_task(block=session is None)
+        if task is None:
+            if session is None:
+                break
+            session = _close_session(session)
+            continue
+
+        if isinstance(task, PrintTask) and task._control is not None:
+            with status.device_lock, logs.job_context(task.id):
+                _apply_control(session, task, last_sent=task is current)
+            _reset_interval()
+            if task is current:
+                current = None
+            continue
+
+        if (task is not current and isinstance(task, PrintTask) and isinstance(current, PrintTask)
+                and current.state == "printing" and task.priority != current.priority):
+            # 高优先级任务在标签边界插队（同一优先级内客户端之间的轮换不计入）
+            logging.info("任务 %s（%s）插队，任务 %s 在第%d张后暂停", task.id, task.priority, current.id, current.sent)
+            metrics.inc("jobs.preempted")
+        current = task
+
+        # 缺纸、开盖、暂停等：在标签边界暂停发送，等待状态轮询发现恢复
+        reason = status.held()
+        if reason != held:
+            if reason:
+                logging.info("打印机未就绪（%s），暂停发送", reason)
+            else:
+                logging.info("打印机已恢复，继续发送")
+            metrics.set_gauge("jobs.held", 1 if reason else 0)
+            held = reason
+        if reason:
+            _reset_interval()
+            status.wait_ready(STATUS_POLL_INTERVAL)
+            continue
+
+        with status.device_lock:
+            if session is None:
+                try:
+                    session = PrinterSession()
+                    session.__enter__()
+                    status.attach(session.printer)
+                except Exception as e:
+                    logging.error("打印机连接失败: %s", e)
+                    session = None
+                    if task is _SPOOL:
+                        _postpone_drain()
+                    else:
+                        _interrupt(task, f"USB打印机连接失败: {e}")
+                    continue
+
+            if task is _SPOOL:
+                try:
+                    _drain_spool(session)
+                except _DeviceError as e:
+                    logging.error("离线队列回放失败: %s", e.__cause__)
+                    session = _close_session(session, failed=True)
+                    _postpone_drain()
+                continue
+
+            with logs.job_context(task.id), task._profile or _NOT_PROFILED:
+                try:
+                    _step(session, task)
+                except _DeviceError as e:
+                    logging.error("打印机通信失败: 任务 %s 已发送 %d 张: %s", task.id, task.sent, e.__cause__)
+                    session = _close_session(session, failed=True)
+                    _interrupt(task, f"打印机通信失败: {e.__cause__}")
+
+    # 停止：结束渲染线程，未完成的任务保留在任务日志中
+    with _cond:
+        for task in _queued() + _interrupted:
+            _close_part(task)
+
+
+def _apply_control(session: Optional[PrinterSession], task: PrintTask, last_sent: bool):
+    """
+    在标签边界执行取消或暂停
+
+    Args:
+        session: 当前会话（未打开时为 None）
+        task: 任务
+        last_sent: 会话最后发送的标签是否属于该任务（只有这时才清除打印机缓冲区，
+            否则会连带清除其他任务的标签）
+    """
+    action = task._control
+    _close_part(task)
+    if action == "cancel":
+        if session is not None and last_sent and task.sent > 0:
+            try:
+                session.clear_printer_buffer()
+                task.buffer_cleared = True
+            except Exception as e:
+                logging.warning("清除打印机缓冲区失败: %s", e)
+        logging.info("任务 %s 已取消（已打印%d张）", task.id, task.sent)
+        _finish(task, "cancelled")
+    else:
+        task.state = "paused"
+        journal.update(task.id, "paused", task.sent, task.error)
+        logging.info("任务 %s 已暂停（已打印%d张）", task.id, task.sent)
+        metrics.inc("jobs.paused")
+        task.done.set()
+
+    with _cond:
+        task._control = None
+        _cond.notify_all()
+
+
+def _close_session(session: PrinterSession, failed: bool = False) -> None:
+    """关闭会话（正常关闭时先写入缓冲区），关闭失败只记录日志"""
+    _reset_interval()
+    with status.device_lock:
+        status.attach(None)
+        try:
+            if failed:
+                session.__exit__(_DeviceError, None, None)
+            else:
+                session.__exit__(None, None, None)
+        except Exception as e:
+            logging.warning("关闭打印机端口失败: %s", e)
+    return None
+
+
+def _reset_interval():
+    """下一张标签不是连续发送的，不测量标签间隔（会话关闭、打印机暂停、取消或回放离线队列之后）"""
+    global _last_sent
+    _last_sent = None
+
+
+def _drain_spool(session: PrinterSession):
+    """
+    回放离线队列中最早的一个文件（整个文件以大块连续写入），写入后删除
+
+    Raises:
+        _DeviceError: 写入失败，文件保留，下次跳过已写入的标签继续回放
+    """
+    global _drain
+    paths = spool.pending()
+    if not paths:
+        with _cond:
+            _drain = False
+        logging.info("离线队列已全部打印")
+        return
+
+    path = paths[0]
+    try:
+        meta, text = spool.load(path)
+    except Exception as e:
+        logging.error("离线队列文件无法读取，已丢弃: %s: %s", path, e)
+        spool.remove(path)
+        return
+
+    t0 = time.perf_counter()
+    sent = meta.get("sent", 0)
+    if sent:
+        logging.info("离线队列继续回放: %s（跳过已打印的%d张）", meta.get("id"), sent)
+    try:
+        prints = program.replay(
+            session, text, SPOOL_WRITE_BYTES, skip=sent, progress=lambda count: spool.mark_sent(path, count)
+        )
+    except Exception as e:
+        session.reset_settings()
+        raise _DeviceError() from e
+    spool.remove(path)
+    _reset_interval()
+    metrics.inc("spool.drained")
+    metrics.inc("spool.labels", prints)
+    logging.info("离线队列已打印: %s（%d张标签，%.2f秒）", meta.get("id"), prints, time.perf_counter() - t0)
+
+
+def _postpone_drain():
+    """离线队列回放失败：JOB_RETRY_INTERVAL 秒后（或打印机重新连接时）重试"""
+    global _drain_at
+    with _cond:
+        _drain_at = time.monotonic() + JOB_RETRY_INTERVAL
+
+
+def _step(session: PrinterSession, task: PrintTask):
+    """
+    推进任务：发送一张标签（或结束当前段）
+
+    Raises:
+        _DeviceError: 发送失败，标签未确认
+    """
+    if task.state != "printing":
+        task.state = "printing"
+        journal.update(task.id, "printing", task.sent)
+
+    if task._rendered is None:
+        task._stats = PipelineStats()
+        task._started = time.perf_counter()
+        # 剖析的任务在打印线程中逐张渲染，渲染和发送记录在同一份剖析中
+        depth = 0 if task._profile is not None else None
+        task._rendered = prerender(task.parts[task._part].render(), task._stats, depth)
+
+    try:
+        label = next(task._rendered)
+    except StopIteration:
+        _finish_part(task)
+        return
+    except Exception as e:
+        # 渲染出错：任务失败，后续各段不再执行
+        logging.error("打印失败: 任务 %s 第%d段: %s", task.id, task._part + 1, e)
+        task.results[task._part] = {"status": "error", "message": str(e)}
+        _close_part(task)
+        _finish(task, "failed", f"打印失败: {e}")
+        return
+
+    if task._position < task._skip:
+        # 任务日志中已确认发送的标签
+        task._position += 1
+        return
+
+    global _last_sent
+    sent_bytes = session.bytes_sent
+    t0 = time.perf_counter()
+    try:
+        session.send_label(label)
+    except Exception as e:
+        raise _DeviceError() from e
+    now = time.perf_counter()
+    label_bytes = session.bytes_sent - sent_bytes
+    task._stats.send_time += now - t0
+    shape = task.parts[task._part].shape
+    if shape is not None:
+        interval = None if _last_sent is None else now - _last_sent
+        throughput.observe(shape, label_bytes, now - t0, interval)
+    _last_sent = now
+    logs.label_event(task._position, label_bytes, now - t0)
+    task._stats.labels += 1
+    task._position += 1
+    task.sent = task._position
+    journal.progress(task.id, task.sent)
+    _account_label(task)
+
+
+def _account_label(task: PrintTask):
+    """扣除客户端的公平调度额度，并更新客户端统计"""
+    now = time.time()
+    with _cond:
+        _lanes[task.priority].charge(task.client)
+        entry = _client_entry(task.client)
+        entry["labels"] += 1
+        recent = entry["recent"]
+        recent.append(time.monotonic())
+        while recent[-1] - recent[0] > CLIENT_RATE_WINDOW:
+            recent.popleft()
+        if task.started is None:
+            task.started = now
+            wait = now - task.created
+            entry["waits"] += 1
+            entry["wait_sum"] += wait
+            entry["wait_max"] = max(entry["wait_max"], wait)
+
+
+def _finish_part(task: PrintTask):
+    """当前段的标签已全部发送：记录结果，进入下一段或完成任务"""
+    stats = task._stats
+    task._rendered = None
+    stats.elapsed = time.perf_counter() - task._started
+    record(stats)
+
+    part = task.parts[task._part]
+    task.results[task._part] = {
+        "status": "ok",
+        "message": part.describe(stats),
+        "pipeline": stats.as_dict()
+    }
+    task._part += 1
+    task._part_start = task._position
+    if task._part == len(task.parts):
+        _finish(task, "done")
+
+
+def _close_part(task: PrintTask):
+    """放弃当前段的渲染，下次从本段开头重新渲染（跳过已确认的标签）"""
+    if task._rendered is not None:
+        task._rendered.close()
+        task._rendered = None
+    task._position = task._part_start
+    task._skip = task.sent
+
+
+def _finish(task: PrintTask, state: str, error: str = None):
+    """任务结束（done / failed）"""
+    task.state = state
+    task.error = error
+    task.finished = time.time()
+    journal.update(task.id, state, task.sent, error)
+    with _cond:
+        _dequeue(task)
+    metrics.inc(f"jobs.{state}")
+    if state == "done":
+        # 时延：从提交到全部标签发送完成（包括排队、被插队和中断等待的时间）
+        latency = task.finished - task.created
+        metrics.observe(f"jobs.latency_seconds.{task.priority}", latency)
+        met = latency <= JOB_LANE_SLO[task.priority]
+        metrics.inc(f"jobs.{'slo_met' if met else 'slo_missed'}.{task.priority}")
+    if task._profile is not None:
+        _save_profile(task)
+    task.done.set()
+
+
+def _save_profile(task: PrintTask):
+    """写入任务的剖析结果（任务信息、各段模板和流水线统计）"""
+    profiling.save(task._profile, {
+        **task.as_dict(),
+        "parts": [part.name for part in task.parts],
+        "payload_bytes": len(task.payload),
+        "results": task.results,
+    })
+    task._profile = None
+
+
+def _interrupt(task: PrintTask, error: str):
+    """
+    打印机连接或通信失败
+
+    已发送过标签的任务（或从任务日志恢复的任务）进入 interrupted 状态，稍后从中断处继续；
+    尚未发送任何标签的新任务直接失败，由请求方决定是否重试。
+    """
+    global _retry_at
+    _close_part(task)
+    task.device_error = True
+    if task.sent == 0 and not task.recovered:
+        _finish(task, "failed", error)
+        return
+
+    task.state = "interrupted"
+    task.error = error
+    journal.update(task.id, "interrupted", task.sent, error)
+    with _cond:
+        _dequeue(task)
+        _interrupted.append(task)
+        _retry_at = time.monotonic() + JOB_RETRY_INTERVAL
+    metrics.inc("jobs.interrupted")
+    task.done.set()
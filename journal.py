@@ -0,0 +1,197 @@
+"""
+任务日志模块
+使用 SQLite（WAL 模式）持久化打印任务的内容、状态和已确认发送的标签数
+
+- 任务提交时记录请求内容，服务重启后可以重新渲染
+- 标签按顺序发送，sent 即每张标签的状态：序号小于 sent 的已发送，其余未发送
+- 发送进度在内存中累积，每 JOURNAL_COMMIT_LABELS 张或每 JOURNAL_COMMIT_INTERVAL 秒提交一次，
+  状态变化（开始、完成、中断）立即提交；进程异常退出时最多重复打印未提交的那部分标签
+"""
+import logging
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from config import (
+    JOURNAL_PATH, JOURNAL_COMMIT_LABELS, JOURNAL_COMMIT_INTERVAL, JOURNAL_RETENTION
+)
+
+# 未完成的任务状态（服务重启后需要继续打印）
+UNFINISHED_STATES = ("queued", "printing", "interrupted", "paused")
+# 已结束的任务状态
+FINISHED_STATES = ("done", "failed", "cancelled")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL,
+    sent INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    client TEXT
+)
+"""
+
+_COLUMNS = "id, kind, payload, state, sent, error, created, updated, client"
+
+_lock = threading.Lock()
+_conn: Optional[sqlite3.Connection] = None
+_pending: dict[str, int] = {}  # 任务ID -> 未提交的发送进度
+_pending_labels = 0
+_last_commit = 0.0
+
+
+def open_journal(path: str = None):
+    """
+    打开任务日志（不存在时创建），并清理过期的已完成任务
+
+    Args:
+        path: 数据库文件路径，默认使用 config 中的 JOURNAL_PATH
+    """
+    global _conn, _last_commit
+    path = path or JOURNAL_PATH
+    with _lock:
+        if _conn is not None:
+            return
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(_SCHEMA)
+        # 旧版本创建的任务日志没有 client 列
+        if "client" not in [row[1] for row in conn.execute("PRAGMA table_info(jobs)")]:
+            conn.execute("ALTER TABLE jobs ADD COLUMN client TEXT")
+        conn.execute(
+            f"DELETE FROM jobs WHERE state IN ({', '.join('?' * len(FINISHED_STATES))}) AND updated < ?",
+            (*FINISHED_STATES, time.time() - JOURNAL_RETENTION)
+        )
+        conn.commit()
+        _conn = conn
+        _last_commit = time.monotonic()
+    logging.info(f"任务日志已打开: {path}")
+
+
+def close_journal():
+    """提交未写入的进度并关闭任务日志"""
+    global _conn
+    with _lock:
+        if _conn is None:
+            return
+        _flush()
+        _conn.close()
+        _conn = None
+
+
+def record(task_id: str, kind: str, payload: str, client: str = None):
+    """
+    记录新提交的任务
+
+    Args:
+        task_id: 任务ID
+        kind: 任务类型（print / batch / compiled）
+        payload: 请求内容（JSON）
+        client: 提交任务的客户端
+    """
+    now = time.time()
+    with _lock:
+        _conn.execute(
+            "INSERT INTO jobs (id, kind, payload, state, sent, created, updated, client) "
+            "VALUES (?, ?, ?, 'queued', 0, ?, ?, ?)",
+            (task_id, kind, payload, now, now, client)
+        )
+        _conn.commit()
+
+
+def update(task_id: str, state: str, sent: int, error: str = None):
+    """
+    更新任务状态（立即提交）
+
+    Args:
+        task_id: 任务ID
+        state: 任务状态
+        sent: 已确认发送的标签数
+        error: 错误信息
+    """
+    with _lock:
+        _pending.pop(task_id, None)
+        _conn.execute(
+            "UPDATE jobs SET state = ?, sent = ?, error = ?, updated = ? WHERE id = ?",
+            (state, sent, error, time.time(), task_id)
+        )
+        _flush()
+
+
+def progress(task_id: str, sent: int):
+    """
+    记录发送进度（批量提交，每张标签只做一次内存写入）
+
+    Args:
+        task_id: 任务ID
+        sent: 已确认发送的标签数
+    """
+    global _pending_labels
+    with _lock:
+        _pending[task_id] = sent
+        _pending_labels += 1
+        if (_pending_labels >= JOURNAL_COMMIT_LABELS
+                or time.monotonic() - _last_commit >= JOURNAL_COMMIT_INTERVAL):
+            _flush()
+
+
+def _flush():
+    """把累积的进度写入数据库并提交（调用方持有 _lock）"""
+    global _pending_labels, _last_commit
+    if _pending:
+        now = time.time()
+        _conn.executemany(
+            "UPDATE jobs SET sent = ?, updated = ? WHERE id = ?",
+            [(sent, now, task_id) for task_id, sent in _pending.items()]
+        )
+        _pending.clear()
+    _conn.commit()
+    _pending_labels = 0
+    _last_commit = time.monotonic()
+
+
+def _row_to_dict(row) -> dict:
+    return dict(zip(_COLUMNS.split(", "), row))
+
+
+def unfinished() -> list[dict]:
+    """
+    未完成的任务（按提交顺序），服务启动时用于继续打印
+
+    Returns:
+        任务记录列表
+    """
+    with _lock:
+        rows = _conn.execute(
+            f"SELECT {_COLUMNS} FROM jobs "
+            f"WHERE state IN ({', '.join('?' * len(UNFINISHED_STATES))}) ORDER BY created",
+            UNFINISHED_STATES
+        ).fetchall()
+    return [_row_to_dict(row) for row in rows]
+
+
+def get(task_id: str) -> Optional[dict]:
+    """
+    查询任务记录
+
+    Returns:
+        任务记录，不存在时返回 None
+    """
+    with _lock:
+        sent = _pending.get(task_id)
+        row = _conn.execute(
+            f"SELECT {_COLUMNS} FROM jobs WHERE id = ?",
+            (task_id,)
+        ).fetchone()
+    if row is None:
+        return None
+    entry = _row_to_dict(row)
+    if sent is not None:
+        entry["sent"] = sent
+    return entry
@@ -0,0 +1,164 @@
+"""
+日志模块
+所有日志先放入内存队列，由后台线程（QueueListener）格式化并写入控制台或文件，
+打印线程和请求线程不等待日志 I/O
+
+- setup()：配置根日志（只执行一次，替代各模块分别调用 logging.basicConfig）
+- 结构化输出：LOG_FORMAT 为 text（可读文本）或 json（每行一个 JSON 对象，包含 extra 字段）
+- 关联ID：job_context(job_id) 期间记录的日志自动带上 job_id（contextvars，各线程互不影响）
+- 每张标签的调试事件：label_event() 只在启用 DEBUG 时按 LOG_LABEL_SAMPLE 采样记录，未启用时不做任何格式化
+- 日志消息使用 %s 占位符和参数（logging.info("任务 %s", task_id)），级别未启用时不格式化；
+  队列已满时丢弃新日志并计数（logging.dropped），不阻塞打印
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterator, Optional
+
+import metrics
+from config import LOG_FILE, LOG_FILE_BACKUPS, LOG_FILE_MAX_BYTES, LOG_FORMAT, LOG_LABEL_SAMPLE, LOG_LEVEL, LOG_QUEUE_SIZE
+
+_job_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("job_id", default=None)
+_listener: Optional[logging.handlers.QueueListener] = None
+
+# LogRecord 的标准属性，其余属性为调用方通过 extra 传入的结构化字段
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message", "asctime", "job_id", "job_tag"
+}
+
+label_logger = logging.getLogger("tsc.labels")
+
+
+class _JobFilter(logging.Filter):
+    """在记录日志的线程中附加当前的任务ID"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.job_id = _job_id.get()
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    只在记录线程中合并消息参数，时间格式化、JSON 序列化和写入由后台线程完成；
+    队列已满时丢弃（不阻塞）
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 参数可能在之后被修改，合并为消息文本后再交给后台线程
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.inc("logging.dropped")
+
+
+class _TextFormatter(logging.Formatter):
+    """可读文本，有任务ID时在消息前加 [job_id]"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s - %(levelname)s - %(job_tag)s%(message)s")
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        job_id = getattr(record, "job_id", None)
+        record.job_tag = f"[{job_id}] " if job_id else ""
+        return super().formatMessage(record)
+
+
+class _JsonFormatter(logging.Formatter):
+    """每行一个 JSON 对象：time、level、logger、message、job_id、exception 及 extra 字段"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        job_id = getattr(record, "job_id", None)
+        if job_id:
+            entry["job_id"] = job_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup():
+    """
+    配置根日志：队列处理器 + 后台写入线程（重复调用不生效）
+
+    输出到标准错误，配置 LOG_FILE 时同时写入按大小轮转的日志文件。
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    formatter = _JsonFormatter() if LOG_FORMAT == "json" else _TextFormatter()
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if LOG_FILE:
+        handlers.append(logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUPS, encoding="utf-8"
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    records = queue.Queue(LOG_QUEUE_SIZE)
+    queue_handler = _QueueHandler(records)
+    queue_handler.addFilter(_JobFilter())
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown)
+
+
+def shutdown():
+    """写完队列中剩余的日志并停止后台线程"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+@contextmanager
+def job_context(job_id: str) -> Iterator[None]:
+    """期间记录的日志带上任务ID（job_id）"""
+    token = _job_id.set(job_id)
+    try:
+        yield
+    finally:
+        _job_id.reset(token)
+
+
+def label_event(position: int, label_bytes: int, send_seconds: float):
+    """
+    记录一张标签的发送事件（DEBUG，每 LOG_LABEL_SAMPLE 张记录一张）
+
+    Args:
+        position: 标签在任务中的序号（从 0 开始）
+        label_bytes: 写入打印机的字节数
+        send_seconds: 写入耗时（秒）
+    """
+    if position % LOG_LABEL_SAMPLE or not label_logger.isEnabledFor(logging.DEBUG):
+        return
+    label_logger.debug(
+        "标签已发送: 第%d张，%d字节，%.1fms", position + 1, label_bytes, send_seconds * 1000,
+        extra={"label": position + 1, "bytes": label_bytes, "send_ms": round(send_seconds * 1000, 2)}
+    )
@@ -3,26 +3,70 @@ TSC打印服务 - FastAPI入口
 提供HTTP接口控制TSC打印机（USB模式）
 使用模板系统支持多种打印场景
 """
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
-from typing import Optional, Literal, List, Union
+from typing import Optional, Literal, List, Union, Dict, Iterator
+from string import Formatter
+from contextlib import asynccontextmanager
 from printer import (
-    print_type1, print_type2, test_connection,
-    _init_printer_settings, _estimate_text_width
+    Label, _type2_layout, _draw_type2_label, _estimate_text_widths, load_driver, tsc_printer
 )
-from tsclib import TSCPrinter
+import bitmap
+import compiled
+import fontmetrics
+import geometry
+import idempotency
+import jobs
+import journal
+import logs
+import program
+import spool
+import status
+import throughput
+import warmup
+import packing
+import metrics
+import profiling
 from config import (
     DEFAULT_WIDTH, DEFAULT_HEIGHT, DPI_RATIO, PRINT_MARGIN,
     TYPE1_FONT_HEIGHT, TYPE1_FONT_NAME,
-    TYPE2_FONT_HEIGHT, TYPE2_FONT_NAME, TYPE2_QR_SIZE, TYPE2_QR_SPACING
+    TYPE2_FONT_HEIGHT, TYPE2_FONT_NAME, TYPE2_QR_SIZE, TYPE2_QR_SPACING,
+    TYPE2_BARCODE_HEIGHT, TYPE2_BARCODE_NARROW,
+    MAIL_MERGE_MAX_ROWS, BATCH_MAX_JOBS, NUP_GUTTER,
+    IDEMPOTENCY_AUTO_HASH, COMPILED_MAX_BYTES, COMPILED_MAX_COPIES, COMPILED_TTL,
+    PRINT_PROFILES, TEMPLATE_PROFILES, TSCLIB_LAZY_LOAD, WARMUP_JOBS, WARMUP_RASTERIZE,
+    PROFILE_ADMIN_KEY, PROFILE_MAX_JOBS
 )
+import hashlib
+import hmac
+import json
 import logging
+import re
+
+# 配置日志（队列 + 后台写入线程，见 logs）
+logs.setup()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    启动状态轮询和打印线程，继续打印任务日志中未完成的任务，在后台预热；退出时在标签边界停止
+
+    TSCLIB_LAZY_LOAD 为 False 时先同步加载打印机驱动库再开始响应。
+    """
+    if not TSCLIB_LAZY_LOAD:
+        load_driver()
+    status.start()
+    jobs.start()
+    _recover_tasks()
+    warmup.start(_warmup_steps())
+    yield
+    jobs.stop()
+    status.stop()
 
-# 配置日志
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
 app = FastAPI(
+    lifespan=lifespan,
     title="TSC-Print-Middleware",
     version="3.0.0",
     description="TSC打印机USB中间件 | 模板化打印 | Windows部署 | 纸张: 10cm×8cm"
@@ -71,15 +115,38 @@ class BarcodeElement(BaseModel):
     barcode_type: str = Field("128", description="条形码类型 (128, EAN13等)")
 
 
+class ImageElement(BaseModel):
+    """图片元素（logo、危险品标志等，转换为 1 位点阵打印）"""
+    type: Literal["image"] = "image"
+    x: int = Field(..., description="X坐标 (dots)", ge=0)
+    y: int = Field(..., description="Y坐标 (dots)", ge=0)
+    path: Optional[str] = Field(None, description="图片文件路径（相对于图片目录 IMAGE_DIR）")
+    data: Optional[str] = Field(None, description="base64 编码的图片内容（PNG、JPEG、BMP 等），与 path 二选一")
+    width: Optional[int] = Field(
+        None, description="宽度 (dots)，只提供宽高之一时按比例缩放，都不提供时按图片 DPI 换算", ge=1
+    )
+    height: Optional[int] = Field(None, description="高度 (dots)", ge=1)
+    dither: Literal["threshold", "ordered", "diffusion"] = Field(
+        "threshold", description="黑白化方式：threshold 阈值（logo、图标）/ ordered 有序抖动 / diffusion 误差扩散（照片）"
+    )
+    threshold: int = Field(128, description="阈值（仅 threshold），灰度低于该值的点打印为黑色", ge=0, le=255)
+    store: bool = Field(False, description="下载到打印机内存，同一批标签只传输一次")
+
+
 class CustomLayout(BaseModel):
     """自定义布局"""
     width: Optional[int] = Field(None, description="标签宽度(mm)")
     height: Optional[int] = Field(None, description="标签高度(mm)")
-    elements: List[Union[TextElement, QRCodeElement, BarcodeElement]] = Field(
+    elements: List[Union[TextElement, QRCodeElement, BarcodeElement, ImageElement]] = Field(
         ..., 
         description="打印元素列表",
         discriminator="type"
     )
+    rows: Optional[List[Dict[str, Union[str, int, float]]]] = Field(
+        None,
+        description="批量填充数据（邮件合并）：每行填充一次元素 text/content 中的 {占位符}",
+        max_length=MAIL_MERGE_MAX_ROWS
+    )
 
 
 class SingleTextData(BaseModel):
@@ -105,6 +172,17 @@ class BarcodeWithTextData(BaseModel):
     text: str = Field(..., description="文本内容")
 
 
+class NUpOptions(BaseModel):
+    """N-up 排版（一张纸排多个标签）"""
+    mode: Literal["grid", "rows"] = Field(
+        "grid",
+        description="grid：统一格子大小铺满纸张；rows：按实际尺寸逐行排列"
+    )
+    gutter: int = Field(NUP_GUTTER, description="标签间距 (dots)", ge=0, le=400)
+    cell_width: Optional[int] = Field(None, description="格子宽度 (dots)，仅grid，默认取最大标签宽度", ge=1)
+    cell_height: Optional[int] = Field(None, description="格子高度 (dots)，仅grid，默认取最大标签高度", ge=1)
+
+
 class PrintJob(BaseModel):
     """打印任务模型"""
     template: Literal["single-text", "double-text", "qrcode-with-text", "barcode-with-text", "custom"] = Field(
@@ -119,7 +197,43 @@ class PrintJob(BaseModel):
         None,
         description="自定义布局（仅template=custom时使用）"
     )
-    qty: int = Field(1, description="打印数量（仅custom模板使用）", ge=1, le=100)
+    qty: int = Field(1, description="打印数量（仅custom模板使用，提供rows时为每行的打印数量）", ge=1, le=100)
+    nup: Optional[NUpOptions] = Field(
+        None,
+        description="N-up 排版（仅预设模板使用）：按标签实际尺寸在一张纸上排多个标签"
+    )
+    priority: Literal["urgent", "normal", "bulk"] = Field(
+        "normal",
+        description="优先级：urgent 任务可以插在正在打印的 normal / bulk 任务的两张标签之间（批量打印中的子任务忽略此参数）"
+    )
+    profile: Optional[str] = Field(
+        None,
+        description="打印配置（PRINT_PROFILES 中的名称，如 fast / quality）：速度、浓度、纸张间隙和出纸方式；"
+                    "未指定时使用模板的默认配置"
+    )
+
+
+class BatchPrintJob(BaseModel):
+    """混合模板批量打印任务"""
+    jobs: List[PrintJob] = Field(
+        ...,
+        description="按顺序执行的子任务列表（任意模板），在同一次连接中打印",
+        min_length=1,
+        max_length=BATCH_MAX_JOBS
+    )
+    priority: Literal["urgent", "normal", "bulk"] = Field("normal", description="优先级（同 /print）")
+
+
+class CompiledPrintJob(BaseModel):
+    """预编译程序打印任务"""
+    handle: Optional[str] = Field(None, description="/compile 返回的句柄")
+    program: Optional[str] = Field(
+        None,
+        description="TSPL 程序（/compile 返回的 program 或自行生成），与 handle 二选一",
+        max_length=COMPILED_MAX_BYTES
+    )
+    copies: int = Field(1, description="打印份数（整个程序重复打印的次数）", ge=1, le=COMPILED_MAX_COPIES)
+    priority: Literal["urgent", "normal", "bulk"] = Field("normal", description="优先级（同 /print）")
 
 
 # ============================================================
@@ -135,14 +249,113 @@ def root():
         "mode": "USB",
         "docs": "/docs",
         "health": "/health",
-        "templates": ["single-text", "double-text", "qrcode-with-text", "barcode-with-text", "custom"]
+        "ready": "/ready",
+        "templates": ["single-text", "double-text", "qrcode-with-text", "barcode-with-text", "custom"],
+        "profiles": list(PRINT_PROFILES)
     }
 
 
 @app.get("/health")
 def health():
-    """健康检查"""
-    return {"status": "alive", "service": "tsc-print-middleware"}
+    """
+    健康检查（存活状态，启动后立即可用）
+
+    printer 为状态轮询缓存的打印机状态（不访问设备）：
+    ready / printing / paused / paper-out / ribbon-out / head-open / paper-jam / error / offline / unknown；
+    ready 为预热是否完成（见 /ready）
+    """
+    return {
+        "status": "alive",
+        "service": "tsc-print-middleware",
+        "ready": warmup.is_ready(),
+        "printer": status.snapshot()
+    }
+
+
+@app.get("/ready")
+def ready(response: Response):
+    """
+    就绪检查
+
+    打印机驱动库已加载、缓存已预热时返回 200，否则返回 503（预热中或必需步骤失败）。
+    steps 为各预热步骤的状态和耗时。打印机未连接不影响就绪（请求进入离线队列）。
+    """
+    state = warmup.snapshot()
+    if not state["ready"]:
+        response.status_code = 503
+    return {"status": state.pop("state"), **state}
+
+
+@app.get("/metrics")
+def api_metrics():
+    """
+    运行指标
+
+    包含预渲染流水线的队列深度（pipeline.queue_depth）、
+    发送端等待渲染时间（pipeline.consumer_stall_seconds）等统计，
+    以及文本宽度、条码几何计算、图片点阵的缓存命中情况（font_metrics、geometry、bitmap）、离线队列（spool）、
+    预编译程序缓存（compiled）、打印时间估算的校准状态（throughput：USB 带宽、各种标签的实测速度）、
+    各优先级的排队任务数和时延目标达成率（lanes）、各客户端的吞吐量和等待时间（clients）
+    """
+    return {
+        "status": "ok",
+        **metrics.snapshot(),
+        "font_metrics": fontmetrics.cache_info(),
+        "geometry": geometry.cache_info(),
+        "bitmap": bitmap.cache_info(),
+        "idempotency": {"entries": idempotency.size()},
+        "spool": spool.stats(),
+        "compiled": compiled.stats(),
+        "throughput": throughput.stats(),
+        "lanes": jobs.lane_stats(),
+        "clients": jobs.client_stats()
+    }
+
+
+@app.get("/profile")
+def api_profile(admin_key: Optional[str] = Header(None, alias="X-Admin-Key")):
+    """性能剖析状态：还要剖析的任务数（remaining）、结果目录和最近写入的剖析结果"""
+    _check_admin(admin_key)
+    return {"status": "ok", **profiling.snapshot()}
+
+
+@app.post("/profile")
+def api_profile_start(count: int = 1, admin_key: Optional[str] = Header(None, alias="X-Admin-Key")):
+    """
+    剖析接下来提交的 count 个打印任务（cProfile）
+
+    每个任务结束时在 PROFILE_DIR 写入 .prof（pstats 格式，可用 snakeviz / flameprof 查看火焰图）
+    和同名 .json（任务信息和耗时最多的函数）。剖析的任务不使用预渲染线程，打印速度会变慢
+    """
+    _check_admin(admin_key)
+    if not 1 <= count <= PROFILE_MAX_JOBS:
+        raise HTTPException(status_code=400, detail=f"count 应为 1~{PROFILE_MAX_JOBS}")
+    profiling.arm(count)
+    return {
+        "status": "ok",
+        "message": f"将剖析接下来的{count}个打印任务",
+        **profiling.snapshot()
+    }
+
+
+@app.delete("/profile")
+def api_profile_stop(admin_key: Optional[str] = Header(None, alias="X-Admin-Key")):
+    """停止剖析尚未提交的任务（已选中的任务仍会写入结果）"""
+    _check_admin(admin_key)
+    profiling.arm(0)
+    return {"status": "ok", "message": "已停止性能剖析", **profiling.snapshot()}
+
+
+def _check_admin(admin_key: Optional[str]):
+    """
+    校验请求头 X-Admin-Key
+
+    未配置 PROFILE_ADMIN_KEY 时性能剖析接口不可用（404），密钥不匹配时返回 403
+    """
+    if not PROFILE_ADMIN_KEY:
+        raise HTTPException(status_code=404, detail="性能剖析未启用（未配置 PROFILE_ADMIN_KEY）")
+    if not hmac.compare_digest(admin_key or "", PROFILE_ADMIN_KEY):
+        raise HTTPException(status_code=403, detail="需要管理员密钥（X-Admin-Key）")
 
 
 @app.post("/test")
@@ -150,28 +363,29 @@ def api_test():
     """
     测试USB打印机连接
     
-    返回打印机连接状态
+    立即查询一次打印机实时状态（打印中时在两张标签之间查询），返回连接状态和打印机状态
     """
-    try:
-        if test_connection():
-            return {
-                "status": "ok",
-                "message": "USB打印机连接成功"
-            }
-        else:
-            raise HTTPException(
-                status_code=503,
-                detail="USB打印机连接失败"
-            )
-    except Exception as e:
+    printer_status = status.refresh()
+    if printer_status["state"] == "offline":
         raise HTTPException(
             status_code=503,
-            detail=f"USB打印机连接失败: {str(e)}"
+            detail=f"USB打印机连接失败: {printer_status['error']}"
         )
+    return {
+        "status": "ok",
+        "message": "USB打印机连接成功",
+        "printer": printer_status
+    }
 
 
 @app.post("/print")
-def api_print(job: PrintJob):
+def api_print(
+    job: PrintJob,
+    request: Request,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    api_key: Optional[str] = Header(None, alias="X-API-Key")
+):
     """
     统一打印接口（模板系统）
     
@@ -191,26 +405,46 @@ def api_print(job: PrintJob):
     - print_list: [{"barcode": "123456", "text": "文本"}]
     
     **5. custom - 完全自定义布局**
-    - layout: {width, height, elements: [...]}
-    - qty: 打印数量
+    - layout: {width, height, elements: [...], rows: [...]}
+    - qty: 打印数量（提供 rows 时为每行的打印数量）
+    - rows（可选）: 按行填充元素 text/content 中的 {占位符}，所有行在同一次连接中打印
+    
+    **优先级**：priority 为 urgent / normal（默认）/ bulk，高优先级任务在标签边界插队
+    
+    **打印配置**：profile 选择 PRINT_PROFILES 中的速度、浓度、纸张间隙和出纸方式（如 fast / quality）
+    
+    **幂等**：请求头 Idempotency-Key 相同的重试请求返回第一次的结果，不会重复打印
+
+    **离线队列**：打印机未连接时标签暂存到磁盘，返回 202（spooled: true），恢复连接后自动打印
+    
+    **公平调度**：同一优先级内按客户端（请求头 X-API-Key，未提供时为来源 IP）轮流打印
     """
+    client = _client_id(request, api_key)
+    return _spooled(
+        response,
+        _idempotent("/print", job, idempotency_key, response, lambda: _print(job, client))
+    )
+
+
+def _print(job: PrintJob, client: str):
+    """按模板分发打印任务"""
     try:
         # ========== 预设模板处理 ==========
         if job.template == "single-text":
-            return handle_single_text(job)
+            return handle_single_text(job, client)
         
         elif job.template == "double-text":
-            return handle_double_text(job)
+            return handle_double_text(job, client)
         
         elif job.template == "qrcode-with-text":
-            return handle_qrcode_with_text(job)
+            return handle_qrcode_with_text(job, client)
         
         elif job.template == "barcode-with-text":
-            return handle_barcode_with_text(job)
+            return handle_barcode_with_text(job, client)
         
         # ========== 自定义布局 ==========
         elif job.template == "custom":
-            return handle_custom_layout(job)
+            return handle_custom_layout(job, client)
         
         else:
             raise HTTPException(
@@ -228,247 +462,1214 @@ def api_print(job: PrintJob):
         )
 
 
+@app.post("/print/batch")
+def api_print_batch(
+    batch: BatchPrintJob,
+    request: Request,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    api_key: Optional[str] = Header(None, alias="X-API-Key")
+):
+    """
+    混合模板批量打印接口
+
+    jobs 中的子任务作为一个打印任务按顺序执行，子任务可以是任意模板。
+    纸张尺寸等设置只在子任务之间发生变化时才重新下发。
+    所有子任务先完成参数校验，任一校验失败则不打印任何内容。
+
+    返回每个子任务的执行结果；某个子任务失败时停止执行后续子任务。
+    支持 Idempotency-Key 请求头、离线队列和公平调度（同 /print）。
+    """
+    client = _client_id(request, api_key)
+    return _spooled(
+        response,
+        _idempotent("/print/batch", batch, idempotency_key, response, lambda: _print_batch(batch, client))
+    )
+
+
+@app.post("/compile")
+def api_compile(job: PrintJob, include_program: bool = True):
+    """
+    编译打印任务（dry-run，不访问打印机）
+
+    按 /print 的规则校验和渲染任意模板，返回与实际发送给打印机一致的 TSPL 程序、
+    标签数、字节数和估算的打印时间（按实测速度校准，见 GET /metrics 的 throughput），并缓存程序返回句柄。
+    之后通过 /print-compiled 按句柄重复打印，不再校验和计算布局。
+
+    - include_program=false 时响应中不包含程序文本（只需要句柄时减少传输）
+    - 句柄在最后一次使用 COMPILED_TTL 秒后失效，服务重启后也会失效
+    """
+    _validate_job(job)
+    try:
+        text, _ = program.compile_labels(_task_part(job).render())
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"编译失败: {e}")
+        raise HTTPException(status_code=500, detail=f"编译失败: {str(e)}")
+    if len(text.encode("utf-8")) > COMPILED_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"编译结果超过 {COMPILED_MAX_BYTES} 字节，请拆分任务")
+
+    info = program.measure(text)
+    handle = compiled.put(text, info)
+    shape = throughput.program_shape(info)
+    return {
+        "status": "ok",
+        "message": f"编译成功：{info['labels']}张标签（{info['bytes']}字节）",
+        "handle": handle,
+        **info,
+        "estimated_seconds": round(shape.labels * throughput.label_seconds(shape), 2),
+        "expires_in": COMPILED_TTL,
+        **({"program": text} if include_program else {})
+    }
+
+
+@app.post("/print-compiled")
+def api_print_compiled(
+    job: CompiledPrintJob,
+    request: Request,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    api_key: Optional[str] = Header(None, alias="X-API-Key")
+):
+    """
+    打印预编译程序
+
+    按句柄（/compile 返回）或上传的程序直接打印，跳过参数校验和布局计算。
+    程序按 PRINT 命令拆分为标签，与普通任务一样逐张发送：支持优先级插队、取消、暂停、
+    断点续打、离线队列、Idempotency-Key 和公平调度（同 /print）。
+
+    句柄不存在或已过期时返回 404，请重新调用 /compile。
+    """
+    client = _client_id(request, api_key)
+    return _spooled(
+        response,
+        _idempotent("/print-compiled", job, idempotency_key, response, lambda: _print_compiled(job, client))
+    )
+
+
+def _print_compiled(job: CompiledPrintJob, client: str) -> dict:
+    """提交预编译程序并等待打印结束"""
+    if (job.handle is None) == (job.program is None):
+        raise HTTPException(status_code=400, detail="需要提供 handle 或 program（二选一）")
+    
+    if job.handle is not None:
+        entry = compiled.get(job.handle)
+        if entry is None:
+            raise HTTPException(status_code=404, detail=f"预编译程序不存在或已过期: {job.handle}")
+        text, info = entry
+    else:
+        text = job.program
+        if len(text.encode("utf-8")) > COMPILED_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"程序超过 {COMPILED_MAX_BYTES} 字节")
+        info = program.measure(text)
+    if info["labels"] == 0:
+        raise HTTPException(status_code=400, detail="程序中没有 PRINT 命令")
+
+    part = _compiled_part(text, job.copies, info)
+    if _printer_offline():
+        return _spool_parts("compiled", [part])
+
+    # 任务日志保存程序本身（句柄在服务重启后失效）
+    payload = CompiledPrintJob(program=text, copies=job.copies, priority=job.priority).model_dump_json()
+    task = jobs.submit(jobs.PrintTask("compiled", payload, [part], priority=job.priority, client=client))
+    task.done.wait()
+    if task.state == "done":
+        return {**task.results[0], "job_id": task.id}
+    raise _task_error(task, task.error)
+
+
+def _compiled_part(text: str, copies: int, info: dict) -> jobs.TaskPart:
+    """预编译程序对应的任务段：按 PRINT 命令拆分的标签重复 copies 次"""
+    return jobs.TaskPart(
+        "compiled",
+        lambda: (label for _ in range(copies) for label in program.split_labels(text)),
+        lambda stats: f"预编译程序打印成功：{info['labels'] * copies}张标签",
+        throughput.program_shape(info, copies)
+    )
+
+
+@app.get("/jobs")
+def api_jobs():
+    """
+    打印队列
+
+    排队和打印中的任务按调度顺序排列，附带估算的剩余时间（remaining_seconds）、
+    距完成的时间（eta_seconds）和完成时间戳（predicted_completion）；
+    暂停和中断等待重试的任务排在最后，不估算完成时间
+    """
+    entries = jobs.queue()
+    eta = next((entry["eta_seconds"] for entry in reversed(entries) if entry["eta_seconds"] is not None), 0.0)
+    return {
+        "status": "ok",
+        "jobs": entries,
+        "queued": len(entries),
+        "eta_seconds": eta,
+        "printer": status.snapshot()["state"]
+    }
+
+
+@app.get("/jobs/{job_id}")
+def api_job(job_id: str):
+    """
+    查询打印任务状态
+
+    state: queued / printing / interrupted / paused / done / failed / cancelled；
+    sent 为已确认发送的标签数（打印中断时据此从下一张继续打印）；
+    排队和打印中的任务附带估算的完成时间（eta_seconds、predicted_completion，见 GET /jobs）
+    """
+    task = jobs.get(job_id)
+    if task is not None:
+        entry = next((entry for entry in jobs.queue() if entry["job_id"] == job_id), None)
+        return {"status": "ok", **(entry or task.as_dict())}
+    
+    entry = journal.get(job_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"任务不存在: {job_id}")
+    return {
+        "status": "ok",
+        "job_id": entry["id"],
+        "kind": entry["kind"],
+        "priority": json.loads(entry["payload"]).get("priority", "normal"),
+        "state": entry["state"],
+        "sent": entry["sent"],
+        "error": entry["error"],
+        "created": entry["created"],
+        "finished": entry["updated"] if entry["state"] in journal.FINISHED_STATES else None
+    }
+
+
+@app.post("/jobs/{job_id}/cancel")
+def api_job_cancel(job_id: str):
+    """
+    取消打印任务
+
+    打印中的任务在下一个标签边界停止发送；打印机最后接收的标签属于该任务时，
+    同时清除打印机缓冲区中尚未打印的标签（buffer_cleared）。printed 为已发送给打印机的标签数
+    """
+    task = _control_job(job_id, jobs.cancel, "取消")
+    return {
+        "status": "ok",
+        "message": f"任务已取消：已打印{task.sent}张",
+        **task.as_dict(),
+        "printed": task.sent,
+        "buffer_cleared": task.buffer_cleared
+    }
+
+
+@app.post("/jobs/{job_id}/pause")
+def api_job_pause(job_id: str):
+    """
+    暂停打印任务
+
+    在下一个标签边界停止发送，其他任务继续打印；通过 /jobs/{job_id}/resume 从下一张继续
+    """
+    task = _control_job(job_id, jobs.pause, "暂停")
+    return {
+        "status": "ok",
+        "message": f"任务已暂停：已打印{task.sent}张",
+        **task.as_dict(),
+        "printed": task.sent
+    }
+
+
+@app.post("/jobs/{job_id}/resume")
+def api_job_resume(job_id: str):
+    """继续暂停的打印任务（从第一张未打印的标签继续，按优先级重新排队）"""
+    task = _control_job(job_id, jobs.resume, "继续")
+    return {
+        "status": "ok",
+        "message": f"任务已继续：将从第{task.sent + 1}张开始打印",
+        **task.as_dict()
+    }
+
+
+def _control_job(job_id: str, action, name: str) -> jobs.PrintTask:
+    """
+    执行任务控制操作
+
+    Raises:
+        HTTPException: 任务不存在（404）或当前状态不允许该操作（409）
+    """
+    try:
+        task = action(job_id)
+    except jobs.JobStateError as e:
+        raise HTTPException(status_code=409, detail=f"无法{name}任务: {e}")
+    if task is None:
+        entry = journal.get(job_id)
+        if entry is None:
+            raise HTTPException(status_code=404, detail=f"任务不存在: {job_id}")
+        raise HTTPException(status_code=409, detail=f"无法{name}任务: 任务已结束（{entry['state']}）")
+    return task
+
+
+def _print_batch(batch: BatchPrintJob, client: str):
+    """按顺序在同一次连接中执行批量任务"""
+    for index, job in enumerate(batch.jobs):
+        try:
+            _validate_job(job)
+        except HTTPException as e:
+            raise HTTPException(status_code=400, detail=f"jobs[{index}]: {e.detail}")
+    
+    parts = [_task_part(job) for job in batch.jobs]
+    if _printer_offline():
+        return _spool_parts("batch", parts)
+    
+    task = jobs.submit(jobs.PrintTask(
+        "batch", batch.model_dump_json(), parts, priority=batch.priority, client=client
+    ))
+    task.done.wait()
+    
+    results = [
+        {"index": index, "template": job.template, **(result or {"status": "skipped", "message": "未执行"})}
+        for index, (job, result) in enumerate(zip(batch.jobs, task.results))
+    ]
+    if task.state != "done":
+        failed = [r for r in results if r["status"] == "error"]
+        if failed:
+            logging.error(f"批量打印子任务失败: jobs[{failed[0]['index']}] {failed[0]['template']}: {failed[0]['message']}")
+            raise HTTPException(
+                status_code=500,
+                detail={
+                    "message": f"批量打印失败：jobs[{failed[0]['index']}] 执行出错",
+                    "job_id": task.id,
+                    "results": results
+                }
+            )
+        raise _task_error(task, results)
+    
+    return {
+        "status": "ok",
+        "message": f"批量打印成功：{len(results)}个子任务",
+        "job_id": task.id,
+        "results": results
+    }
+
+
+def _client_id(request: Request, api_key: Optional[str]) -> str:
+    """
+    客户端标识（公平调度、统计使用）
+
+    提供 X-API-Key 时为其摘要（不在统计中暴露原始密钥），否则为来源 IP
+    """
+    if api_key:
+        return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:8]
+    return request.client.host if request.client else "local"
+
+
+def _idempotent(path: str, body: BaseModel, key: Optional[str], response: Response, func):
+    """
+    按幂等键执行打印请求
+
+    同一个键的重试请求返回第一次的结果，第一次请求仍在打印时等待其完成；
+    可重试的失败（见 _retryable）不缓存，之后的重试重新执行。
+    重放的结果（包括重放的错误）带 Idempotency-Replayed: true 响应头。
+
+    Args:
+        path: 接口路径（不同接口的相同内容视为不同请求）
+        body: 请求体
+        key: 请求头 Idempotency-Key，未提供时按 IDEMPOTENCY_AUTO_HASH 决定是否使用内容哈希
+        response: 响应对象（用于设置响应头）
+        func: 实际执行打印的函数
+    """
+    fingerprint = hashlib.sha256(f"{path}\n{body.model_dump_json()}".encode("utf-8")).hexdigest()
+    if key is None:
+        if not IDEMPOTENCY_AUTO_HASH:
+            return func()
+        key = fingerprint
+    
+    try:
+        result, replayed = idempotency.execute(key, fingerprint, func, _retryable)
+    except idempotency.IdempotencyConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except idempotency.Replayed as e:
+        logging.info(f"重复请求，返回已有结果（失败）: Idempotency-Key={key}")
+        error = e.error
+        if isinstance(error, HTTPException):
+            raise HTTPException(
+                status_code=error.status_code,
+                detail=error.detail,
+                headers={**(error.headers or {}), "Idempotency-Replayed": "true"}
+            )
+        raise error
+    
+    if replayed:
+        logging.info(f"重复请求，返回已有结果: Idempotency-Key={key}")
+        response.headers["Idempotency-Replayed"] = "true"
+    return result
+
+
+def _retryable(error: Exception) -> bool:
+    """
+    失败的请求能否用同一个幂等键重试（不缓存结果）
+
+    服务端错误和打印机连接、通信失败（5xx）可以重试；打印中断（interrupted）的任务
+    恢复后会自动继续打印，重试请求应得到同一个结果而不是再次提交；参数错误等 4xx 不可重试
+    """
+    if not isinstance(error, HTTPException):
+        return True
+    if error.status_code < 500:
+        return False
+    return not (isinstance(error.detail, dict) and error.detail.get("state") == "interrupted")
+
+
 # ============================================================
 # 模板处理函数
 # ============================================================
+# 每个模板对应一个渲染函数：把任务渲染为 Label 生成器（只做布局计算，不访问打印机），
+# 由预渲染流水线在后台线程中迭代，与 USB 写入重叠执行。
 
-def handle_single_text(job: PrintJob):
-    """处理单行文本模板"""
+def _require_print_list(job: PrintJob):
+    """校验预设模板的 print_list"""
     if not job.print_list:
         raise HTTPException(status_code=400, detail="print_list不能为空")
+
+
+def _require_encodable(job: PrintJob):
+    """
+    校验二维码/条形码内容能否编码（二维码不超过最大容量、Code 128 仅 ASCII），
+    并且按内容计算的符号尺寸能放进标签的有效打印区域（N-up 由 _require_packable 按格子校验）
+    """
+    layout = _type2_layout(DEFAULT_WIDTH, DEFAULT_HEIGHT, TYPE2_QR_SIZE)
+    if job.template == "qrcode-with-text":
+        def measure(item):
+            size = geometry.qr_width(item.qrcode, TYPE2_QR_SIZE)
+            return size, size + layout["spacing"] + layout["font_height"], "二维码"
+    elif job.template == "barcode-with-text":
+        def measure(item):
+            width = geometry.code128_width(item.barcode, TYPE2_BARCODE_NARROW)
+            return width, TYPE2_BARCODE_HEIGHT + layout["spacing"] + layout["font_height"], "条形码"
+    else:
+        return
+
+    for i, item in enumerate(job.print_list):
+        try:
+            width, height, name = measure(item)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"print_list[{i}]: {e}")
+        if job.nup:
+            continue
+        if width > layout["effective_width"] or height > layout["effective_height"]:
+            raise HTTPException(
+                status_code=400,
+                detail=f"print_list[{i}]: {name}内容过长，{name}和文本（{width} × {height} dots）"
+                       f"超出可打印区域（{layout['effective_width']} × {layout['effective_height']} dots）"
+            )
+
+
+def _task_part(job: PrintJob) -> jobs.TaskPart:
+    """
+    把一个已校验的模板任务转换为调度任务中的一段
+
+    Args:
+        job: 已校验的打印任务
+
+    Returns:
+        TaskPart：渲染函数（经过预渲染流水线逐张发送）和结果描述函数
+    """
+    if job.nup:
+        return jobs.TaskPart(
+            job.template,
+            lambda: _with_profile(_render_nup(job), _job_profile(job)),
+            lambda stats: f"{job.template} N-up 打印成功：{len(job.print_list)}个标签（共{stats.labels}张纸）",
+            _task_shape(job)
+        )
+    renderer, describe = TEMPLATES[job.template]
+    return jobs.TaskPart(
+        job.template,
+        lambda: _with_profile(renderer(job), _job_profile(job)),
+        lambda stats: describe(job),
+        _task_shape(job)
+    )
+
+
+def _job_profile(job: PrintJob) -> str:
+    """任务的打印配置：请求中的 profile，否则为模板的默认配置（TEMPLATE_PROFILES）"""
+    return job.profile or TEMPLATE_PROFILES.get(job.template, "default")
+
+
+def _with_profile(labels: Iterator[Label], profile: str) -> Iterator[Label]:
+    """为渲染的标签设置打印配置"""
+    for label in labels:
+        label.profile = profile
+        yield label
+
+
+def _task_shape(job: PrintJob) -> throughput.Shape:
+    """
+    模板任务的打印形状（用于估算打印时间）
+
+    N-up 的纸张数要排版后才能确定，按每个标签一张纸估算（上限）。
+    """
+    if job.template == "custom":
+        return throughput.label_shape(
+            "custom", len(job.layout.rows or [{}]), job.layout.height or DEFAULT_HEIGHT, job.qty, _job_profile(job)
+        )
+    labels = len(job.print_list)
+    if job.template == "double-text" and not job.nup:
+        labels = (labels + 1) // 2
+    return throughput.label_shape(job.template, labels, DEFAULT_HEIGHT, profile=_job_profile(job))
+
+
+def _submit_print(job: PrintJob, client: str) -> dict:
+    """
+    提交单个模板任务并等待打印结束
+
+    Returns:
+        打印结果，包含任务ID和流水线统计；打印机未连接时为离线队列结果
+    """
+    part = _task_part(job)
+    if _printer_offline():
+        return _spool_parts("print", [part])
     
-    p = TSCPrinter()
+    task = jobs.submit(jobs.PrintTask(
+        "print", job.model_dump_json(), [part], priority=job.priority, client=client
+    ))
+    task.done.wait()
+    if task.state == "done":
+        return {**task.results[0], "job_id": task.id}
+    raise _task_error(task, task.error)
+
+
+def _printer_offline() -> bool:
+    """状态轮询确认打印机未连接"""
+    return status.snapshot()["state"] == "offline"
+
+
+def _spool_parts(kind: str, parts: List[jobs.TaskPart]) -> dict:
+    """
+    打印机未连接：把任务渲染编译为 TSPL 程序并加入离线队列
+
+    Returns:
+        离线队列结果（spooled: true）
+    """
+    labels = (label for part in parts for label in part.render())
     try:
-        p.open_port(0)
+        text, count = program.compile_labels(labels)
+    except Exception as e:
+        logging.error(f"打印失败: {e}")
+        raise HTTPException(status_code=500, detail=f"打印失败: {str(e)}")
+    try:
+        spool_id = spool.add(text, count, kind)
+    except spool.SpoolFull as e:
+        raise HTTPException(status_code=503, detail=f"USB打印机未连接，且{e}")
+    return {
+        "status": "ok",
+        "message": f"打印机未连接，已加入离线队列（{count}张标签），恢复连接后自动打印",
+        "spooled": True,
+        "spool_id": spool_id,
+        "labels": count
+    }
+
+
+def _spooled(response: Response, result: dict) -> dict:
+    """离线队列结果（包括幂等重放）使用 202 Accepted"""
+    if result.get("spooled"):
+        response.status_code = 202
+    return result
+
+
+def _task_error(task: jobs.PrintTask, detail) -> HTTPException:
+    """
+    未完成任务对应的错误响应
+
+    - interrupted：已部分打印，打印机恢复后自动从中断处继续（503，detail 含 job_id、state 和已打印张数）
+    - paused / cancelled：任务被暂停或取消（409，detail 含 job_id、state 和已打印张数）
+    - 打印机连接或通信失败：503
+    - 渲染出错：500
+    """
+    if task.state == "interrupted":
+        return HTTPException(status_code=503, detail={
+            "message": f"打印中断：已打印{task.sent}张，打印机恢复后将从第{task.sent + 1}张继续打印",
+            "job_id": task.id,
+            "state": task.state,
+            "printed": task.sent,
+            "error": task.error,
+            **({"results": detail} if isinstance(detail, list) else {})
+        })
+    if task.state in ("paused", "cancelled"):
+        return HTTPException(status_code=409, detail={
+            "message": (
+                f"任务已暂停：已打印{task.sent}张，继续后将从第{task.sent + 1}张开始打印"
+                if task.state == "paused" else f"任务已取消：已打印{task.sent}张"
+            ),
+            "job_id": task.id,
+            "state": task.state,
+            "printed": task.sent,
+            **({"results": detail} if isinstance(detail, list) else {})
+        })
+    if isinstance(detail, list):
+        detail = {"message": f"批量打印失败: {task.error}", "job_id": task.id, "results": detail}
+    return HTTPException(status_code=503 if task.device_error else 500, detail=detail)
+
+
+def _recover_tasks():
+    """把任务日志中未完成的任务重新提交，从第一张未确认的标签继续打印"""
+    for entry in journal.unfinished():
+        try:
+            if entry["kind"] == "compiled":
+                request = CompiledPrintJob.model_validate_json(entry["payload"])
+                parts = [_compiled_part(request.program, request.copies, program.measure(request.program))]
+            else:
+                if entry["kind"] == "batch":
+                    request = BatchPrintJob.model_validate_json(entry["payload"])
+                    print_jobs = request.jobs
+                else:
+                    request = PrintJob.model_validate_json(entry["payload"])
+                    print_jobs = [request]
+                parts = [_task_part(job) for job in print_jobs]
+        except Exception as e:
+            logging.error(f"任务无法恢复: {entry['id']}: {e}")
+            journal.update(entry["id"], "failed", entry["sent"], f"任务无法恢复: {e}")
+            continue
+        
+        task = jobs.PrintTask(
+            entry["kind"], entry["payload"], parts,
+            task_id=entry["id"], sent=entry["sent"], priority=request.priority,
+            client=entry["client"] or "local"
+        )
+        if entry["state"] == "paused":
+            # 暂停的任务保持暂停，等待 /jobs/{job_id}/resume
+            task.state = "paused"
+            logging.info(f"恢复暂停的任务: {entry['id']}（已打印{entry['sent']}张）")
+        else:
+            logging.info(f"继续打印未完成的任务: {entry['id']}（已打印{entry['sent']}张）")
+        jobs.submit(task)
+
+
+def handle_single_text(job: PrintJob, client: str = "local"):
+    """处理单行文本模板"""
+    _validate_job(job)
+    
+    return _submit_print(job, client)
+
+
+def _render_single_text(job: PrintJob) -> Iterator[Label]:
+    """渲染单行文本模板（每条数据一张标签）"""
+    width_dots = int(float(DEFAULT_WIDTH) * DPI_RATIO)
+    height_dots = int(float(DEFAULT_HEIGHT) * DPI_RATIO)
+    effective_width = width_dots - 2 * PRINT_MARGIN
+    effective_height = height_dots - 2 * PRINT_MARGIN
+    font_height = TYPE1_FONT_HEIGHT
+    
+    # 整批文本宽度一次估算
+    texts = [item.text for item in job.print_list]
+    text_widths = _estimate_text_widths(texts, font_height, TYPE1_FONT_NAME)
+    
+    for text, text_width in zip(texts, text_widths):
+        label = Label(DEFAULT_WIDTH, DEFAULT_HEIGHT)
         
-        width_dots = int(float(DEFAULT_WIDTH) * DPI_RATIO)
-        height_dots = int(float(DEFAULT_HEIGHT) * DPI_RATIO)
-        effective_width = width_dots - 2 * PRINT_MARGIN
-        effective_height = height_dots - 2 * PRINT_MARGIN
+        # 水平垂直居中
+        x = PRINT_MARGIN + (effective_width - text_width) // 2
+        y = PRINT_MARGIN + (effective_height - font_height) // 2
         
-        for item in job.print_list:
-            _init_printer_settings(p, DEFAULT_WIDTH, DEFAULT_HEIGHT)
-            
-            text = item.text
-            font_height = TYPE1_FONT_HEIGHT
-            text_width = _estimate_text_width(text, font_height)
-            
-            # 水平垂直居中
-            x = PRINT_MARGIN + (effective_width - text_width) // 2
-            y = PRINT_MARGIN + (effective_height - font_height) // 2
-            
-            p.print_text_windows_font(
-                x=x, y=y,
-                font_height=font_height,
-                rotation=0,
-                font_style=0,
-                font_underline=0,
-                font_face_name=TYPE1_FONT_NAME,
-                text=text
-            )
-            
-            p.send_command("PRINT 1,1")
+        label.print_text_windows_font(
+            x=x, y=y,
+            font_height=font_height,
+            rotation=0,
+            font_style=0,
+            font_underline=0,
+            font_face_name=TYPE1_FONT_NAME,
+            text=text
+        )
         
-        return {
-            "status": "ok",
-            "message": f"单行文本打印成功：{len(job.print_list)}张标签"
-        }
-    finally:
-        p.close_port()
+        yield label
 
 
-def handle_double_text(job: PrintJob):
+def handle_double_text(job: PrintJob, client: str = "local"):
     """处理双行文本模板（每张纸两个标签）"""
-    if not job.print_list:
-        raise HTTPException(status_code=400, detail="print_list不能为空")
+    _validate_job(job)
     
-    p = TSCPrinter()
-    try:
-        p.open_port(0)
+    return _submit_print(job, client)
+
+
+def _double_text_texts(job: PrintJob) -> List[str]:
+    """双行文本模板要打印的文本：偶数位取第一行文本，奇数位取第二行文本"""
+    texts = []
+    for i, item in enumerate(job.print_list):
+        if i % 2 == 0:
+            texts.append(item.text1 if hasattr(item, 'text1') else item.text)
+        else:
+            texts.append(item.text2 if hasattr(item, 'text2') else item.text if hasattr(item, 'text') else item.text1)
+    return texts
+
+
+def _render_double_text(job: PrintJob) -> Iterator[Label]:
+    """渲染双行文本模板（每两条数据一张纸）"""
+    width_dots = int(float(DEFAULT_WIDTH) * DPI_RATIO)
+    height_dots = int(float(DEFAULT_HEIGHT) * DPI_RATIO)
+    effective_width = width_dots - 2 * PRINT_MARGIN
+    effective_height = height_dots - 2 * PRINT_MARGIN
+    font_height = TYPE1_FONT_HEIGHT
+    
+    # 整批宽度一次估算
+    texts = _double_text_texts(job)
+    text_widths = _estimate_text_widths(texts, font_height, TYPE1_FONT_NAME)
+    
+    # 每两个为一组，打印在同一张纸上
+    for i in range(0, len(texts), 2):
+        label = Label(DEFAULT_WIDTH, DEFAULT_HEIGHT)
         
-        width_dots = int(float(DEFAULT_WIDTH) * DPI_RATIO)
-        height_dots = int(float(DEFAULT_HEIGHT) * DPI_RATIO)
-        effective_width = width_dots - 2 * PRINT_MARGIN
-        effective_height = height_dots - 2 * PRINT_MARGIN
-        font_height = TYPE1_FONT_HEIGHT
+        # 第一行（上半部分）
+        text1 = texts[i]
+        text1_width = text_widths[i]
         
-        # 每两个为一组，打印在同一张纸上
-        for i in range(0, len(job.print_list), 2):
-            _init_printer_settings(p, DEFAULT_WIDTH, DEFAULT_HEIGHT)
-            
-            # 第一行（上半部分）
-            item1 = job.print_list[i]
-            text1 = item1.text1 if hasattr(item1, 'text1') else item1.text
-            text1_width = _estimate_text_width(text1, font_height)
+        x1 = PRINT_MARGIN + (effective_width - text1_width) // 2
+        y1 = PRINT_MARGIN + (effective_height // 2 - font_height) // 2
+        
+        label.print_text_windows_font(
+            x=x1, y=y1,
+            font_height=font_height,
+            rotation=0,
+            font_style=0,
+            font_underline=0,
+            font_face_name=TYPE1_FONT_NAME,
+            text=text1
+        )
+        
+        # 第二行（下半部分，如果存在）
+        if i + 1 < len(texts):
+            text2 = texts[i + 1]
+            text2_width = text_widths[i + 1]
             
-            x1 = PRINT_MARGIN + (effective_width - text1_width) // 2
-            y1 = PRINT_MARGIN + (effective_height // 2 - font_height) // 2
+            x2 = PRINT_MARGIN + (effective_width - text2_width) // 2
+            y2 = PRINT_MARGIN + effective_height // 2 + (effective_height // 2 - font_height) // 2
             
-            p.print_text_windows_font(
-                x=x1, y=y1,
+            label.print_text_windows_font(
+                x=x2, y=y2,
                 font_height=font_height,
                 rotation=0,
                 font_style=0,
                 font_underline=0,
                 font_face_name=TYPE1_FONT_NAME,
-                text=text1
+                text=text2
             )
-            
-            # 第二行（下半部分，如果存在）
-            if i + 1 < len(job.print_list):
-                item2 = job.print_list[i + 1]
-                text2 = item2.text2 if hasattr(item2, 'text2') else item2.text if hasattr(item2, 'text') else item2.text1
-                text2_width = _estimate_text_width(text2, font_height)
-                
-                x2 = PRINT_MARGIN + (effective_width - text2_width) // 2
-                y2 = PRINT_MARGIN + effective_height // 2 + (effective_height // 2 - font_height) // 2
-                
-                p.print_text_windows_font(
-                    x=x2, y=y2,
-                    font_height=font_height,
-                    rotation=0,
-                    font_style=0,
-                    font_underline=0,
-                    font_face_name=TYPE1_FONT_NAME,
-                    text=text2
-                )
-            
-            p.send_command("PRINT 1,1")
         
-        sheets = (len(job.print_list) + 1) // 2
-        return {
-            "status": "ok",
-            "message": f"双行文本打印成功：{len(job.print_list)}个标签（共{sheets}张纸）"
-        }
-    finally:
-        p.close_port()
+        yield label
 
 
-def handle_qrcode_with_text(job: PrintJob):
+def handle_qrcode_with_text(job: PrintJob, client: str = "local"):
     """处理二维码+文本模板"""
-    if not job.print_list:
-        raise HTTPException(status_code=400, detail="print_list不能为空")
+    _validate_job(job)
     
-    for item in job.print_list:
-        print_type2(
-            qr_content=item.qrcode,
-            text=item.text,
-            qty=1,
-            width=DEFAULT_WIDTH,
-            height=DEFAULT_HEIGHT,
-            qr_size=TYPE2_QR_SIZE
-        )
+    return _submit_print(job, client)
+
+
+def _render_qrcode_with_text(job: PrintJob) -> Iterator[Label]:
+    """渲染二维码+文本模板（每条数据一张标签）"""
+    # 整批共用一个布局，每张标签只计算文本居中偏移
+    layout = _type2_layout(DEFAULT_WIDTH, DEFAULT_HEIGHT, TYPE2_QR_SIZE)
+    text_widths = _estimate_text_widths(
+        [item.text for item in job.print_list], layout["font_height"], TYPE2_FONT_NAME
+    )
     
-    return {
-        "status": "ok",
-        "message": f"二维码标签打印成功：{len(job.print_list)}张"
-    }
+    for item, text_width in zip(job.print_list, text_widths):
+        label = Label(DEFAULT_WIDTH, DEFAULT_HEIGHT)
+        _draw_type2_label(label, layout, qr_content=item.qrcode, text=item.text, text_width=text_width)
+        yield label
 
 
-def handle_barcode_with_text(job: PrintJob):
+def handle_barcode_with_text(job: PrintJob, client: str = "local"):
     """处理条形码+文本模板"""
-    if not job.print_list:
-        raise HTTPException(status_code=400, detail="print_list不能为空")
+    _validate_job(job)
     
-    p = TSCPrinter()
-    try:
-        p.open_port(0)
+    return _submit_print(job, client)
+
+
+def _render_barcode_with_text(job: PrintJob) -> Iterator[Label]:
+    """渲染条形码+文本模板（每条数据一张标签）"""
+    layout = _type2_layout(DEFAULT_WIDTH, DEFAULT_HEIGHT, TYPE2_QR_SIZE)
+    left = layout["left"]
+    font_height = layout["font_height"]
+    barcode_height = TYPE2_BARCODE_HEIGHT
+    spacing = layout["spacing"]
+    text_widths = _estimate_text_widths([item.text for item in job.print_list], font_height, TYPE2_FONT_NAME)
+    
+    # 整体（条形码 + 间距 + 文本）垂直居中，高度与内容无关
+    total_height = barcode_height + spacing + font_height
+    barcode_y = layout["top"] + max(0, (layout["effective_height"] - total_height) // 2)
+    text_y = barcode_y + barcode_height + spacing
+    center_x = layout["center_x"]
+    
+    for item, text_width in zip(job.print_list, text_widths):
+        label = Label(DEFAULT_WIDTH, DEFAULT_HEIGHT)
         
-        width_dots = int(float(DEFAULT_WIDTH) * DPI_RATIO)
-        height_dots = int(float(DEFAULT_HEIGHT) * DPI_RATIO)
-        effective_width = width_dots - 2 * PRINT_MARGIN
-        effective_height = height_dots - 2 * PRINT_MARGIN
+        # 条形码居中（按实际模块数计算宽度，连续数字按 C 集压缩）
+        barcode_width = geometry.code128_width(item.barcode, TYPE2_BARCODE_NARROW)
+        barcode_x = max(left, center_x - barcode_width // 2)
         
-        for item in job.print_list:
-            _init_printer_settings(p, DEFAULT_WIDTH, DEFAULT_HEIGHT)
-            
-            barcode_height = 80
-            font_height = TYPE2_FONT_HEIGHT
-            spacing = TYPE2_QR_SPACING
-            
-            # 估算条形码宽度（Code 128大约每个字符10 dots）
-            barcode_width = len(item.barcode) * 10 + 40
-            text_width = _estimate_text_width(item.text, font_height)
-            
-            total_height = barcode_height + spacing + font_height
-            start_y = PRINT_MARGIN + (effective_height - total_height) // 2
-            center_x = PRINT_MARGIN + effective_width // 2
-            
-            # 条形码居中
-            barcode_x = center_x - barcode_width // 2
-            barcode_y = start_y
-            
-            p.send_command(f'BARCODE {barcode_x},{barcode_y},"128",{barcode_height},1,0,2,2,"{item.barcode}"')
-            
-            # 文本居中
-            text_x = center_x - text_width // 2
-            text_y = barcode_y + barcode_height + spacing
-            
+        label.send_command(
+            f'BARCODE {barcode_x},{barcode_y},"128",{barcode_height},1,0,'
+            f'{TYPE2_BARCODE_NARROW},{TYPE2_BARCODE_NARROW},"{item.barcode}"'
+        )
+        
+        # 文本居中
+        text_x = max(left, center_x - text_width // 2)
+        
+        label.print_text_windows_font(
+            x=text_x, y=text_y,
+            font_height=font_height,
+            rotation=0,
+            font_style=0,
+            font_underline=0,
+            font_face_name=TYPE2_FONT_NAME,
+            text=item.text
+        )
+        
+        yield label
+
+
+def _parse_placeholders(template: str) -> set[str]:
+    """
+    解析模板中的 {占位符} 字段名
+
+    Args:
+        template: 元素的 text/content 内容
+
+    Returns:
+        占位符字段名集合
+
+    Raises:
+        ValueError: 花括号不匹配或字段名不是合法标识符
+    """
+    fields = set()
+    for _, field_name, _, _ in Formatter().parse(template):
+        if field_name is None:
+            continue
+        if not field_name.isidentifier():
+            raise ValueError(f"非法占位符: {{{field_name}}}")
+        fields.add(field_name)
+    return fields
+
+
+def _compile_custom_layout(layout: CustomLayout) -> list[dict]:
+    """
+    预编译自定义布局
+
+    每个元素只解析一次：固定内容直接保存最终值，含占位符的内容保存
+    模板和字段名，逐行渲染时只需 format_map。未提供 rows 时不解析占位符，
+    内容原样打印（保持与旧版本一致）。
+
+    Args:
+        layout: 自定义布局
+
+    Returns:
+        编译后的元素列表
+
+    Raises:
+        ValueError: 占位符格式错误
+        bitmap.ImageError: 图片无法读取或转换
+    """
+    compiled = []
+    for index, element in enumerate(layout.elements):
+        if element.type == "image":
+            # 图片不支持占位符：转换一次（按内容哈希缓存），每行复用同一个点阵
+            try:
+                image = bitmap.convert(
+                    bitmap.read_source(element.path, element.data),
+                    element.width, element.height, element.dither, element.threshold
+                )
+            except bitmap.ImageError as e:
+                raise bitmap.ImageError(f"elements[{index}]: {e}")
+            compiled.append({"element": element, "bitmap": image, "fields": set()})
+            continue
+        
+        if element.type == "text":
+            template = element.text
+            prefix = ""
+        elif element.type == "qrcode":
+            template = element.content
+            prefix = f"QRCODE {element.x},{element.y},H,{element.size},A,0,M2,"
+        else:
+            template = element.content
+            prefix = f'BARCODE {element.x},{element.y},"{element.barcode_type}",{element.height},1,0,2,2,'
+
+        fields = _parse_placeholders(template) if layout.rows else set()
+        if fields:
+            static = None
+        elif layout.rows:
+            # 无占位符时仍需处理 {{ }} 转义
+            static = template.format_map({})
+        else:
+            static = template
+
+        compiled.append({
+            "element": element,
+            "prefix": prefix,
+            "template": template,
+            "fields": fields,
+            "static": static,
+        })
+    return compiled
+
+
+def _render_compiled_layout(p, compiled: list[dict], row: dict):
+    """
+    按一行数据渲染预编译布局
+
+    Args:
+        p: Label 或 PrinterSession
+        compiled: _compile_custom_layout 的结果
+        row: 占位符数据
+    """
+    for item in compiled:
+        element = item["element"]
+        if element.type == "image":
+            p.put_bitmap(item["bitmap"], element.x, element.y, element.store)
+            continue
+        
+        value = item["static"] if item["static"] is not None else item["template"].format_map(row)
+
+        if element.type == "text":
             p.print_text_windows_font(
-                x=text_x, y=text_y,
-                font_height=font_height,
+                x=element.x,
+                y=element.y,
+                font_height=element.font_size,
                 rotation=0,
                 font_style=0,
                 font_underline=0,
-                font_face_name=TYPE2_FONT_NAME,
-                text=item.text
+                font_face_name=element.font_name,
+                text=value
             )
-            
-            p.send_command("PRINT 1,1")
-        
-        return {
-            "status": "ok",
-            "message": f"条形码标签打印成功：{len(job.print_list)}张"
-        }
-    finally:
-        p.close_port()
+        else:
+            p.send_command(f'{item["prefix"]}"{value}"')
+
+
+# 不能出现在内容中的控制字符（换行等会截断 TSPL 命令并注入新命令）
+_CONTROL_CHARS = re.compile(r"[\x00-\x1f\x7f]")
+
+
+def _unsafe_value(element, value: str) -> Optional[str]:
+    """
+    检查渲染后的元素内容能否安全发送
+
+    二维码、条形码的内容放在 TSPL 命令的双引号中，不能包含双引号；所有元素都不能包含控制字符。
+    文本元素作为参数交给驱动光栅化，可以包含双引号。
+
+    Returns:
+        错误说明，可以发送时返回 None
+    """
+    if _CONTROL_CHARS.search(value):
+        return f"{element.type} 内容不能包含换行等控制字符"
+    if element.type != "text" and '"' in value:
+        return f"{element.type} 内容不能包含双引号"
+    return None
+
+
+def _prepare_custom_layout(job: PrintJob) -> list[dict]:
+    """
+    校验并编译自定义布局
 
+    所有行在打开端口前完成校验（逐行渲染占位符），避免打印到一半才发现缺字段、
+    字段格式不匹配（如 {qty:d} 对应字符串），或内容包含会注入 TSPL 命令的双引号、控制字符。
 
-def handle_custom_layout(job: PrintJob):
-    """处理自定义布局"""
+    Args:
+        job: custom 模板打印任务
+
+    Returns:
+        编译后的元素列表
+    """
+    if job.nup:
+        raise HTTPException(status_code=400, detail="custom模板不支持nup排版")
+    
     if not job.layout:
         raise HTTPException(status_code=400, detail="custom模板需要提供layout参数")
     
     if not job.layout.elements:
         raise HTTPException(status_code=400, detail="layout.elements不能为空")
     
+    rows = job.layout.rows
+    if rows is not None and not rows:
+        raise HTTPException(status_code=400, detail="layout.rows不能为空")
+    
+    try:
+        compiled = _compile_custom_layout(job.layout)
+    except bitmap.ImageError as e:
+        raise HTTPException(status_code=400, detail=f"layout图片错误: {str(e)}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"layout占位符格式错误: {str(e)}")
+    
+    for index, item in enumerate(compiled):
+        if item.get("static") is not None:
+            error = _unsafe_value(item["element"], item["static"])
+            if error:
+                raise HTTPException(status_code=400, detail=f"layout.elements[{index}]: {error}")
+    
+    if rows:
+        required = set().union(*(item["fields"] for item in compiled))
+        templated = [item for item in compiled if item["fields"]]
+        for index, row in enumerate(rows):
+            missing = required - row.keys()
+            if missing:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"rows[{index}] 缺少占位符字段: {', '.join(sorted(missing))}"
+                )
+            for item in templated:
+                try:
+                    value = item["template"].format_map(row)
+                except (ValueError, TypeError, KeyError, IndexError, AttributeError) as e:
+                    raise HTTPException(status_code=400, detail=f"rows[{index}] 字段格式错误: {e}")
+                error = _unsafe_value(item["element"], value)
+                if error:
+                    raise HTTPException(status_code=400, detail=f"rows[{index}]: {error}")
+    
+    return compiled
+
+
+def handle_custom_layout(job: PrintJob, client: str = "local"):
+    """处理自定义布局（支持 rows 邮件合并）"""
+    _validate_job(job)
+    
+    return _submit_print(job, client)
+
+
+def _render_custom_layout(job: PrintJob) -> Iterator[Label]:
+    """渲染自定义布局（提供 rows 时每行一张标签，qty 作用于每行）"""
+    compiled = _compile_custom_layout(job.layout)
     width = str(job.layout.width) if job.layout.width else DEFAULT_WIDTH
     height = str(job.layout.height) if job.layout.height else DEFAULT_HEIGHT
     
-    p = TSCPrinter()
-    try:
-        p.open_port(0)
-        _init_printer_settings(p, width, height)
-        
-        # 渲染所有元素
-        for element in job.layout.elements:
-            if element.type == "text":
-                p.print_text_windows_font(
-                    x=element.x,
-                    y=element.y,
-                    font_height=element.font_size,
+    for row in job.layout.rows or [{}]:
+        label = Label(width, height, qty=job.qty)
+        _render_compiled_layout(label, compiled, row)
+        yield label
+
+
+def _describe_custom_layout(job: PrintJob) -> str:
+    """custom 模板打印结果描述"""
+    if job.layout.rows:
+        return f"自定义布局批量打印成功：{len(job.layout.rows)}行，每行{job.qty}张"
+    return f"自定义布局打印成功：{job.qty}张"
+
+
+# ============================================================
+# 启动预热
+# ============================================================
+
+def _warmup_steps() -> List[warmup.Step]:
+    """预热步骤：驱动库（必需）、示例任务渲染、打印机连接、字体光栅化"""
+    return [
+        ("driver", load_driver, True),
+        ("templates", _warm_templates, False),
+        ("printer", _warm_printer, False),
+        ("rasterize", _warm_rasterize, False),
+    ]
+
+
+def _warm_templates() -> str:
+    """渲染 WARMUP_JOBS 中的示例任务（不打印）：字体度量、条码几何、布局计算和各模块的导入"""
+    for sample in WARMUP_JOBS:
+        job = PrintJob.model_validate(sample)
+        _validate_job(job)
+        program.compile_labels(_task_part(job).render())
+    return f"{len(WARMUP_JOBS)}个示例任务"
+
+
+def _warm_printer() -> str:
+    """打开端口查询一次打印机状态（打印机未连接不算失败）"""
+    return f"打印机状态: {status.refresh()['state']}"
+
+
+def _warm_rasterize() -> str:
+    """
+    打印机空闲时发送一段 Windows 字体文本并立即清除（CLS），预热驱动的字体光栅化
+
+    只在状态为 ready（不在打印中）、没有排队任务和离线队列时发送，否则跳过
+    """
+    if not WARMUP_RASTERIZE:
+        return "未启用"
+    state = status.snapshot()["state"]
+    if state != "ready":
+        return f"打印机状态为 {state}，已跳过"
+    if jobs.queue() or spool.pending():
+        return "有待打印的任务，已跳过"
+    with status.device_lock:
+        if status.attached():
+            return "打印线程正在打印，已跳过"
+        printer = tsc_printer()
+        printer.open_port(0)
+        try:
+            for font_name, font_height in {(TYPE1_FONT_NAME, TYPE1_FONT_HEIGHT), (TYPE2_FONT_NAME, TYPE2_FONT_HEIGHT)}:
+                printer.print_text_windows_font(
+                    x=0, y=0,
+                    font_height=font_height,
                     rotation=0,
                     font_style=0,
                     font_underline=0,
-                    font_face_name=element.font_name,
-                    text=element.text
+                    font_face_name=font_name,
+                    text="预热 Warm-up 0123456789"
                 )
-            
-            elif element.type == "qrcode":
-                p.send_command(f'QRCODE {element.x},{element.y},H,{element.size},A,0,M2,"{element.content}"')
-            
-            elif element.type == "barcode":
-                p.send_command(f'BARCODE {element.x},{element.y},"{element.barcode_type}",{element.height},1,0,2,2,"{element.content}"')
-        
-        # 打印
-        p.send_command(f"PRINT {job.qty},1")
-        
-        return {
-            "status": "ok",
-            "message": f"自定义布局打印成功：{job.qty}张"
-        }
-    finally:
-        p.close_port()
+            printer.send_command("CLS")
+        finally:
+            printer.close_port()
+    return "字体光栅化已预热"
+
+
+# ============================================================
+# N-up 排版
+# ============================================================
+# 预设模板的每条数据先生成一个按实际尺寸测量的 Cell（内容外框 + 绘制函数），
+# 再由 packing 排列到纸张上，每张纸一次 PRINT。
+
+def _text_cells(texts: List[str], font_height: int, font_name: str) -> List[packing.Cell]:
+    """文本标签：外框为文本宽度 × 字体高度"""
+    text_widths = _estimate_text_widths(texts, font_height, font_name)
+    
+    def cell(text: str, text_width: int) -> packing.Cell:
+        def draw(p, x: int, y: int):
+            p.print_text_windows_font(
+                x=x, y=y,
+                font_height=font_height,
+                rotation=0,
+                font_style=0,
+                font_underline=0,
+                font_face_name=font_name,
+                text=text
+            )
+        return packing.Cell(text_width, font_height, draw)
+    
+    return [cell(text, text_width) for text, text_width in zip(texts, text_widths)]
+
+
+def _symbol_with_text_cell(
+    symbol,
+    symbol_width: int,
+    symbol_height: int,
+    text: str,
+    text_width: int
+) -> packing.Cell:
+    """
+    二维码/条形码在上、文本在下的标签，两者在外框内水平居中
+
+    Args:
+        symbol: symbol(x, y) 返回在 (x, y) 处绘制符号的 TSPL 命令
+        symbol_width: 符号宽度（dots）
+        symbol_height: 符号高度（dots）
+        text: 下方显示的文本
+        text_width: 文本宽度（dots）
+    """
+    width = max(symbol_width, text_width)
+    height = symbol_height + TYPE2_QR_SPACING + TYPE2_FONT_HEIGHT
+    
+    def draw(p, x: int, y: int):
+        p.send_command(symbol(x + (width - symbol_width) // 2, y))
+        p.print_text_windows_font(
+            x=x + (width - text_width) // 2,
+            y=y + symbol_height + TYPE2_QR_SPACING,
+            font_height=TYPE2_FONT_HEIGHT,
+            rotation=0,
+            font_style=0,
+            font_underline=0,
+            font_face_name=TYPE2_FONT_NAME,
+            text=text
+        )
+    
+    return packing.Cell(width, height, draw)
+
+
+def _qrcode_with_text_cells(job: PrintJob) -> List[packing.Cell]:
+    """二维码+文本标签（二维码尺寸按内容计算）"""
+    text_widths = _estimate_text_widths(
+        [item.text for item in job.print_list], TYPE2_FONT_HEIGHT, TYPE2_FONT_NAME
+    )
+    cells = []
+    for item, text_width in zip(job.print_list, text_widths):
+        qr_width = geometry.qr_width(item.qrcode, TYPE2_QR_SIZE)
+        symbol = lambda x, y, content=item.qrcode: f'QRCODE {x},{y},H,{TYPE2_QR_SIZE},A,0,M2,"{content}"'
+        cells.append(_symbol_with_text_cell(symbol, qr_width, qr_width, item.text, text_width))
+    return cells
+
+
+def _barcode_with_text_cells(job: PrintJob) -> List[packing.Cell]:
+    """条形码+文本标签（条形码宽度按 Code 128 模块数计算）"""
+    text_widths = _estimate_text_widths(
+        [item.text for item in job.print_list], TYPE2_FONT_HEIGHT, TYPE2_FONT_NAME
+    )
+    cells = []
+    for item, text_width in zip(job.print_list, text_widths):
+        barcode_width = geometry.code128_width(item.barcode, TYPE2_BARCODE_NARROW)
+        symbol = lambda x, y, content=item.barcode: (
+            f'BARCODE {x},{y},"128",{TYPE2_BARCODE_HEIGHT},1,0,'
+            f'{TYPE2_BARCODE_NARROW},{TYPE2_BARCODE_NARROW},"{content}"'
+        )
+        cells.append(_symbol_with_text_cell(symbol, barcode_width, TYPE2_BARCODE_HEIGHT, item.text, text_width))
+    return cells
+
+
+# 模板名称 -> N-up 标签生成函数（custom 模板使用绝对坐标，不支持 N-up）
+NUP_CELLS = {
+    "single-text": lambda job: _text_cells(
+        [item.text for item in job.print_list], TYPE1_FONT_HEIGHT, TYPE1_FONT_NAME
+    ),
+    "double-text": lambda job: _text_cells(_double_text_texts(job), TYPE1_FONT_HEIGHT, TYPE1_FONT_NAME),
+    "qrcode-with-text": _qrcode_with_text_cells,
+    "barcode-with-text": _barcode_with_text_cells,
+}
+
+
+def _pack_job(job: PrintJob) -> list:
+    """按任务的 nup 参数计算每张纸上的标签位置"""
+    cells = NUP_CELLS[job.template](job)
+    return packing.pack(
+        cells, DEFAULT_WIDTH, DEFAULT_HEIGHT,
+        mode=job.nup.mode,
+        gutter=job.nup.gutter,
+        cell_width=job.nup.cell_width,
+        cell_height=job.nup.cell_height
+    )
+
+
+def _render_nup(job: PrintJob) -> Iterator[Label]:
+    """N-up 渲染：每张纸一个 Label，包含多个标签"""
+    return packing.render_sheets(_pack_job(job), DEFAULT_WIDTH, DEFAULT_HEIGHT)
+
+
+def _require_packable(job: PrintJob):
+    """校验 N-up 排版：每个标签都能放进格子和可打印区域"""
+    if job.nup is None:
+        return
+    try:
+        _pack_job(job)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"nup: {e}")
+
+
+# 模板名称 -> (渲染函数, 结果描述函数)
+TEMPLATES = {
+    "single-text": (
+        _render_single_text,
+        lambda job: f"单行文本打印成功：{len(job.print_list)}张标签"
+    ),
+    "double-text": (
+        _render_double_text,
+        lambda job: f"双行文本打印成功：{len(job.print_list)}个标签（共{(len(job.print_list) + 1) // 2}张纸）"
+    ),
+    "qrcode-with-text": (
+        _render_qrcode_with_text,
+        lambda job: f"二维码标签打印成功：{len(job.print_list)}张"
+    ),
+    "barcode-with-text": (
+        _render_barcode_with_text,
+        lambda job: f"条形码标签打印成功：{len(job.print_list)}张"
+    ),
+    "custom": (_render_custom_layout, _describe_custom_layout),
+}
+
+
+def _validate_job(job: PrintJob):
+    """打印前校验任务参数（不访问打印机）"""
+    if job.profile is not None and job.profile not in PRINT_PROFILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"未知的打印配置: {job.profile}（可选: {', '.join(PRINT_PROFILES)}）"
+        )
+    if job.template == "custom":
+        _prepare_custom_layout(job)
+    else:
+        _require_print_list(job)
+        _require_encodable(job)
+        _require_packable(job)
 
 
 if __name__ == "__main__":
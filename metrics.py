@@ -0,0 +1,69 @@
+"""
+运行指标模块
+进程内的计数器、当前值和耗时统计，通过 GET /metrics 查看
+"""
+import threading
+
+_lock = threading.Lock()
+_counters: dict[str, float] = {}
+_gauges: dict[str, float] = {}
+_summaries: dict[str, dict] = {}
+
+
+def inc(name: str, value: float = 1):
+    """
+    累加计数器
+
+    Args:
+        name: 指标名称
+        value: 增量
+    """
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def set_gauge(name: str, value: float):
+    """
+    设置当前值（如队列深度）
+
+    Args:
+        name: 指标名称
+        value: 当前值
+    """
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name: str, value: float):
+    """
+    记录一次观测值（如耗时），统计次数、总和和最大值
+
+    Args:
+        name: 指标名称
+        value: 观测值
+    """
+    with _lock:
+        summary = _summaries.get(name)
+        if summary is None:
+            summary = _summaries[name] = {"count": 0, "sum": 0.0, "max": 0.0}
+        summary["count"] += 1
+        summary["sum"] += value
+        summary["max"] = max(summary["max"], value)
+
+
+def snapshot() -> dict:
+    """
+    获取所有指标的快照
+
+    Returns:
+        {"counters": {...}, "gauges": {...}, "summaries": {...}}
+    """
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "summaries": {
+                name: {**summary, "avg": summary["sum"] / summary["count"]}
+                for name, summary in _summaries.items()
+            },
+        }
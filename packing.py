@@ -0,0 +1,166 @@
+"""
+N-up 排版模块
+把多个逻辑标签（Cell）排列到同一张纸上，每张纸生成一个 Label（一次 PRINT）
+
+- grid：所有标签使用同样大小的格子，按行优先铺满可打印区域，格子内居中
+- rows：按标签实际尺寸逐行排列（行优先），一行放不下时换行，一张纸放不下时换纸
+
+可打印区域 = 纸张尺寸 - 2 × PRINT_MARGIN（与其他模板一致）。
+"""
+from typing import Callable, Iterator, List, Tuple
+
+from config import DPI_RATIO, PRINT_MARGIN
+from printer import Label
+
+# 一个标签在纸上的位置：(标签, x, y)
+Placement = Tuple["Cell", int, int]
+
+
+class Cell:
+    """
+    一个逻辑标签
+
+    - width / height: 内容外框尺寸（dots）
+    - draw: 绘制函数 draw(p, x, y)，在 (x, y) 处绘制内容（左上角）
+    """
+
+    def __init__(self, width: int, height: int, draw: Callable[[Label, int, int], None]):
+        self.width = width
+        self.height = height
+        self.draw = draw
+
+
+def printable_area(width: str, height: str) -> Tuple[int, int]:
+    """纸张可打印区域尺寸 (宽, 高)（dots）"""
+    width_dots = int(float(width) * DPI_RATIO)
+    height_dots = int(float(height) * DPI_RATIO)
+    return width_dots - 2 * PRINT_MARGIN, height_dots - 2 * PRINT_MARGIN
+
+
+def pack(
+    cells: List[Cell],
+    width: str,
+    height: str,
+    mode: str = "grid",
+    gutter: int = 0,
+    cell_width: int = None,
+    cell_height: int = None
+) -> List[List[Placement]]:
+    """
+    计算排版：每张纸上各标签的位置
+
+    Args:
+        cells: 逻辑标签列表（按打印顺序）
+        width: 纸张宽度(mm)
+        height: 纸张高度(mm)
+        mode: "grid" 或 "rows"
+        gutter: 标签之间的间距（dots）
+        cell_width: 格子宽度（dots，仅 grid），默认取最大标签宽度
+        cell_height: 格子高度（dots，仅 grid），默认取最大标签高度
+
+    Returns:
+        每张纸的标签位置列表
+
+    Raises:
+        ValueError: 标签尺寸超过可打印区域或格子尺寸
+    """
+    if not cells:
+        return []
+    area = printable_area(width, height)
+    if mode == "rows":
+        return _pack_rows(cells, area, gutter)
+    return _pack_grid(cells, area, gutter, cell_width, cell_height)
+
+
+def _pack_grid(
+    cells: List[Cell],
+    area: Tuple[int, int],
+    gutter: int,
+    cell_width: int,
+    cell_height: int
+) -> List[List[Placement]]:
+    """网格排版：统一格子大小，整个网格在可打印区域内居中"""
+    area_width, area_height = area
+    slot_width = cell_width or max(cell.width for cell in cells)
+    slot_height = cell_height or max(cell.height for cell in cells)
+
+    for i, cell in enumerate(cells):
+        if cell.width > slot_width or cell.height > slot_height:
+            raise ValueError(
+                f"第{i + 1}个标签尺寸 {cell.width}×{cell.height} 超过格子尺寸 {slot_width}×{slot_height}"
+            )
+
+    columns = (area_width + gutter) // (slot_width + gutter)
+    rows = (area_height + gutter) // (slot_height + gutter)
+    if columns < 1 or rows < 1:
+        raise ValueError(
+            f"格子尺寸 {slot_width}×{slot_height} 超过可打印区域 {area_width}×{area_height}"
+        )
+
+    # 网格整体居中
+    grid_width = columns * slot_width + (columns - 1) * gutter
+    grid_height = rows * slot_height + (rows - 1) * gutter
+    left = PRINT_MARGIN + (area_width - grid_width) // 2
+    top = PRINT_MARGIN + (area_height - grid_height) // 2
+
+    per_sheet = columns * rows
+    sheets = []
+    for start in range(0, len(cells), per_sheet):
+        sheet = []
+        for slot, cell in enumerate(cells[start:start + per_sheet]):
+            row, column = divmod(slot, columns)
+            # 标签在格子内居中
+            x = left + column * (slot_width + gutter) + (slot_width - cell.width) // 2
+            y = top + row * (slot_height + gutter) + (slot_height - cell.height) // 2
+            sheet.append((cell, x, y))
+        sheets.append(sheet)
+    return sheets
+
+
+def _pack_rows(cells: List[Cell], area: Tuple[int, int], gutter: int) -> List[List[Placement]]:
+    """逐行排版：按实际宽度从左到右排列，行高取本行最高的标签"""
+    area_width, area_height = area
+    sheets = []
+    sheet = []
+    x = y = row_height = 0
+
+    for i, cell in enumerate(cells):
+        if cell.width > area_width or cell.height > area_height:
+            raise ValueError(
+                f"第{i + 1}个标签尺寸 {cell.width}×{cell.height} 超过可打印区域 {area_width}×{area_height}"
+            )
+
+        # 本行放不下：换行
+        if x > 0 and x + cell.width > area_width:
+            x = 0
+            y += row_height + gutter
+            row_height = 0
+        # 本张放不下：换纸
+        if y + cell.height > area_height:
+            sheets.append(sheet)
+            sheet = []
+            x = y = row_height = 0
+
+        sheet.append((cell, PRINT_MARGIN + x, PRINT_MARGIN + y))
+        x += cell.width + gutter
+        row_height = max(row_height, cell.height)
+
+    if sheet:
+        sheets.append(sheet)
+    return sheets
+
+
+def render_sheets(sheets: List[List[Placement]], width: str, height: str) -> Iterator[Label]:
+    """
+    按排版结果渲染标签：每张纸一个 Label
+
+    Args:
+        sheets: pack 的结果
+        width: 纸张宽度(mm)
+        height: 纸张高度(mm)
+    """
+    for sheet in sheets:
+        label = Label(width, height)
+        for cell, x, y in sheet:
+            cell.draw(label, x, y)
+        yield label
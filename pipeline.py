@@ -0,0 +1,175 @@
+"""
+预渲染流水线
+渲染线程（生产者）提前把标签渲染成待发送的 Label，放入有界队列；
+发送线程（消费者）从队列取出标签写入打印机。
+布局计算和 USB 写入因此可以重叠进行，打印机不再等待 Python 渲染。
+"""
+import logging
+import queue
+import threading
+import time
+from typing import Iterable, Iterator
+
+import metrics
+from config import PIPELINE_QUEUE_DEPTH
+from printer import Label, PrinterSession
+
+# 渲染结束标记
+_DONE = object()
+
+
+class PipelineStats:
+    """
+    一次流水线执行的统计
+
+    - labels: 已发送的标签数
+    - max_queue_depth: 队列中等待发送的标签数峰值
+    - consumer_stall: 打印机写入线程等待渲染的总时间（秒），越小越好
+    - producer_stall: 渲染线程因队列已满而等待的总时间（秒）
+    - render_time / send_time: 渲染和发送各自的总耗时（秒）
+    """
+
+    def __init__(self):
+        self.labels = 0
+        self.max_queue_depth = 0
+        self.consumer_stall = 0.0
+        self.producer_stall = 0.0
+        self.render_time = 0.0
+        self.send_time = 0.0
+        self.elapsed = 0.0
+
+    def as_dict(self) -> dict:
+        """转换为响应中使用的字典"""
+        return {
+            "labels": self.labels,
+            "max_queue_depth": self.max_queue_depth,
+            "consumer_stall_ms": round(self.consumer_stall * 1000, 2),
+            "producer_stall_ms": round(self.producer_stall * 1000, 2),
+            "render_ms": round(self.render_time * 1000, 2),
+            "send_ms": round(self.send_time * 1000, 2),
+            "elapsed_ms": round(self.elapsed * 1000, 2),
+        }
+
+
+def run_pipeline(
+    session: PrinterSession,
+    labels: Iterable[Label],
+    depth: int = None
+) -> PipelineStats:
+    """
+    通过预渲染流水线发送一批标签
+
+    labels 通常是惰性生成器，渲染（宽度估算、命令格式化）发生在迭代时，
+    因此在后台线程中迭代即可与当前线程的 USB 写入重叠。
+
+    Args:
+        session: 已打开的打印会话
+        labels: 标签可迭代对象
+        depth: 队列深度，默认使用 config 中的 PIPELINE_QUEUE_DEPTH；0 表示同步执行
+
+    Returns:
+        PipelineStats: 本次执行统计
+    """
+    stats = PipelineStats()
+    started = time.perf_counter()
+    rendered = prerender(labels, stats, depth)
+    try:
+        for label in rendered:
+            t0 = time.perf_counter()
+            session.send_label(label)
+            stats.send_time += time.perf_counter() - t0
+            stats.labels += 1
+    finally:
+        rendered.close()
+        stats.elapsed = time.perf_counter() - started
+        record(stats)
+    return stats
+
+
+def record(stats: PipelineStats):
+    """把一次执行的统计记入运行指标"""
+    metrics.inc("pipeline.labels", stats.labels)
+    metrics.observe("pipeline.consumer_stall_seconds", stats.consumer_stall)
+    metrics.observe("pipeline.producer_stall_seconds", stats.producer_stall)
+    metrics.set_gauge("pipeline.queue_depth", 0)
+
+
+def prerender(labels: Iterable[Label], stats: PipelineStats, depth: int = None) -> Iterator[Label]:
+    """
+    预渲染：按顺序产出标签，同时在后台线程中提前渲染后续标签
+
+    调用方逐张取出并发送（发送耗时和张数由调用方记入 stats），
+    可以在任意两张标签之间停止；停止时需要调用 close() 结束渲染线程。
+
+    Args:
+        labels: 标签可迭代对象
+        stats: 记录渲染耗时和等待时间的统计对象
+        depth: 队列深度，默认使用 config 中的 PIPELINE_QUEUE_DEPTH；0 表示不使用后台线程
+
+    Yields:
+        Label: 渲染完成的标签（渲染出错时抛出渲染函数的异常）
+    """
+    if depth is None:
+        depth = PIPELINE_QUEUE_DEPTH
+
+    if depth <= 0:
+        # 不使用后台线程：渲染一张、发送一张
+        iterator = iter(labels)
+        while True:
+            t0 = time.perf_counter()
+            label = next(iterator, _DONE)
+            stats.render_time += time.perf_counter() - t0
+            if label is _DONE:
+                return
+            yield label
+
+    ready = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(item):
+        # 队列已满时分段等待，以便发送端停止后能及时退出
+        while not stop.is_set():
+            try:
+                ready.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def produce():
+        iterator = iter(labels)
+        try:
+            while not stop.is_set():
+                t0 = time.perf_counter()
+                item = next(iterator, _DONE)
+                t1 = time.perf_counter()
+                stats.render_time += t1 - t0
+                put(item)
+                stats.producer_stall += time.perf_counter() - t1
+                if item is _DONE:
+                    return
+        except Exception as e:
+            logging.error("标签渲染失败: %s", e)
+            put(e)
+
+    producer = threading.Thread(target=produce, name="label-prerender", daemon=True)
+    producer.start()
+    try:
+        while True:
+            t0 = time.perf_counter()
+            item = ready.get()
+            stats.consumer_stall += time.perf_counter() - t0
+
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+
+            # 取出前队列中的标签数（含当前这张）
+            depth_now = ready.qsize()
+            stats.max_queue_depth = max(stats.max_queue_depth, depth_now + 1)
+            metrics.set_gauge("pipeline.queue_depth", depth_now)
+
+            yield item
+    finally:
+        stop.set()
+        producer.join()
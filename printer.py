@@ -3,84 +3,385 @@ TSC打印机核心模块（跨平台）
 支持USB连接（已改为使用USB模式，不再使用网络连接）
 """
 import logging
-from tsclib import TSCPrinter
+from functools import lru_cache
+
+import fontmetrics
+import geometry
 from config import (
     DEFAULT_WIDTH, DEFAULT_HEIGHT, DPI_RATIO,
-    PRINT_MARGIN,
+    PRINT_MARGIN, PRINT_PROFILES,
     TYPE1_FONT_HEIGHT, TYPE1_FONT_NAME,
     TYPE2_FONT_HEIGHT, TYPE2_FONT_NAME, TYPE2_QR_SIZE, TYPE2_QR_SPACING
 )
 
-# 配置日志
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+def load_driver():
+    """
+    加载打印机驱动库（导入 tsclib）
+
+    tsclib 导入时加载驱动 DLL，耗时较长；模块导入时不加载，
+    由服务启动后的后台预热（见 warmup）或第一次创建 TSCPrinter 时加载。
+    """
+    import tsclib  # noqa: F401
+
+
+def tsc_printer():
+    """创建 TSCPrinter（第一次调用时加载驱动库）"""
+    from tsclib import TSCPrinter
+    return TSCPrinter()
 
 
-def _estimate_text_width(text: str, font_height: int) -> int:
+def _estimate_text_width(text: str, font_height: int, font_name: str = None) -> int:
     """
-    估算文本打印宽度（单位：dots）
+    计算文本打印宽度（单位：dots）
+    
+    有字体文件时按实际字符步进宽度计算（见 fontmetrics），否则使用估算规则：
+    中文字符宽度约等于字体高度，英文、数字、符号约为字体高度的 0.6 倍。
     
     Args:
         text: 文本内容
         font_height: 字体高度（点）
+        font_name: 字体名称（如 "宋体"），为 None 时使用估算规则
         
     Returns:
-        估算的文本宽度（dots）
-    """
-    width = 0
-    for char in text:
-        # 判断是否为中文字符（包括中文标点）
-        if '\u4e00' <= char <= '\u9fff' or '\u3000' <= char <= '\u303f':
-            # 中文字符宽度约等于字体高度
-            width += font_height
-        else:
-            # 英文、数字、符号宽度约为字体高度的 0.6 倍
-            width += int(font_height * 0.6)
-    return width
+        文本宽度（dots）
+    """
+    return fontmetrics.text_width(text, font_height, font_name)
+
+
+def _estimate_text_widths(texts: list[str], font_height: int, font_name: str = None) -> list[int]:
+    """
+    批量计算文本打印宽度（单位：dots）
+    
+    整个 print_list 一次查表计算，结果与逐条调用 _estimate_text_width 一致。
+    
+    Args:
+        texts: 文本列表
+        font_height: 字体高度（点）
+        font_name: 字体名称（如 "宋体"），为 None 时使用估算规则
+        
+    Returns:
+        与 texts 一一对应的宽度列表（dots）
+    """
+    return fontmetrics.text_widths(texts, font_height, font_name)
 
 
-def _init_printer_settings(printer: TSCPrinter, width: str, height: str):
+# 出纸方式对应的 SET 命令
+_MODE_COMMANDS = {
+    "off": ("SET TEAR OFF", "SET PEEL OFF"),
+    "tear": ("SET TEAR ON", "SET PEEL OFF"),
+    "peel": ("SET TEAR OFF", "SET PEEL ON"),
+    "cutter": ("SET TEAR OFF", "SET PEEL OFF", "SET CUTTER 1"),
+    "batch": ("SET TEAR OFF", "SET PEEL OFF", "SET CUTTER BATCH"),
+}
+# 切换到不包含该设置的打印配置时需要恢复的命令
+_SETTING_RESETS = {"SET CUTTER": "SET CUTTER OFF"}
+
+
+def print_profile(name: str = "default") -> dict:
+    """
+    打印配置的参数（未设置的参数使用 default 的值）
+
+    Raises:
+        KeyError: PRINT_PROFILES 中没有该打印配置
+    """
+    return {**PRINT_PROFILES["default"], **PRINT_PROFILES[name]}
+
+
+@lru_cache(maxsize=64)
+def printer_settings(width: str, height: str, profile: str = "default") -> tuple:
+    """
+    标签尺寸和打印配置对应的打印机设置命令
+
+    Args:
+        width: 标签宽度(mm)
+        height: 标签高度(mm)
+        profile: 打印配置名称（PRINT_PROFILES）
+
+    Returns:
+        设置命令（按下发顺序）
+    """
+    settings = print_profile(profile)
+    return (
+        # 设置标签尺寸（重要：先设置尺寸）
+        f"SIZE {width} mm, {height} mm",
+        # 设置间隙传感器（间隙标签纸，连续纸为 0）
+        f"GAP {settings['gap']} mm, 0 mm",
+        # 设置打印方向（0=正常，1=镜像）
+        "DIRECTION 0",
+        # 设置参考点（0,0）- 从左上角开始打印
+        "REFERENCE 0,0",
+        # 设置偏移量为0（不偏移）
+        "OFFSET 0 mm",
+        # 设置打印速度（1-14，数字越小越慢但质量越好）
+        f"SPEED {settings['speed']}",
+        # 设置打印浓度（0-15）
+        f"DENSITY {settings['density']}",
+        # 出纸方式：默认关闭撕离模式（SET TEAR ON 会导致打印后回退，造成错位问题）
+        *_MODE_COMMANDS[settings["mode"]],
+        # 设置打印停止位置（0 = 打印后不移动纸张）
+        f"SHIFT {settings['shift']}",
+    )
+
+
+def _setting_key(command: str) -> str:
+    """设置命令的键（SET 按第二个词区分：SET TEAR、SET PEEL 等）"""
+    words = command.split()
+    return " ".join(words[:2]) if words[0] == "SET" else words[0]
+
+
+def _init_printer_settings(printer, width: str, height: str, profile: str = "default"):
     """
     初始化打印机设置
     
     Args:
-        printer: TSCPrinter实例
+        printer: TSCPrinter 或 PrinterSession 实例
         width: 标签宽度(mm)
         height: 标签高度(mm)
+        profile: 打印配置名称（PRINT_PROFILES）
     """
     # 清除缓冲区
     printer.send_command("CLS")
+    for command in printer_settings(width, height, profile):
+        printer.send_command(command)
     
-    # 设置标签尺寸（重要：先设置尺寸）
-    printer.send_command(f"SIZE {width} mm, {height} mm")
-    
-    # 设置间隙传感器（3mm间隙用于有间隙的标签纸）
-    # 如果是连续纸，改为 GAP 0 mm, 0 mm
-    printer.send_command("GAP 3 mm, 0 mm")
-    
-    # 设置打印方向（0=正常，1=镜像）
-    printer.send_command("DIRECTION 0")
-    
-    # 设置参考点（0,0）- 从左上角开始打印
-    printer.send_command("REFERENCE 0,0")
-    
-    # 设置偏移量为0（不偏移）
-    printer.send_command("OFFSET 0 mm")
-    
-    # 设置打印速度（1-14，数字越小越慢但质量越好）
-    printer.send_command("SPEED 4")
-    
-    # 设置打印浓度（0-15）
-    printer.send_command("DENSITY 12")
-    
-    # 关闭撕离模式（避免打印撤回错位）
-    # SET TEAR ON 会导致打印后回退，造成错位问题
-    printer.send_command("SET TEAR OFF")
-    printer.send_command("SET PEEL OFF")
-    
-    # 设置打印停止位置（0 = 打印后不移动纸张）
-    printer.send_command("SHIFT 0")
-    
-    logging.info(f"打印机初始化完成: {width}mm x {height}mm")
+    logging.debug("打印机初始化完成: %smm x %smm（%s）", width, height, profile)
+
+
+class Label:
+    """
+    预渲染的标签：按顺序记录的绘制操作
+
+    提供与 TSCPrinter 相同的 send_command / print_text_windows_font 接口，
+    绘制函数可以直接画到 Label 上；布局计算在渲染时完成，
+    发送时（PrinterSession.send_label）只需按顺序回放操作。
+
+    Args:
+        width: 标签宽度(mm)
+        height: 标签高度(mm)
+        qty: 打印数量
+        profile: 打印配置名称（PRINT_PROFILES）
+    """
+
+    def __init__(self, width: str, height: str, qty: int = 1, profile: str = "default"):
+        self.width = str(width)
+        self.height = str(height)
+        self.qty = qty
+        self.profile = profile
+        self.ops = []
+
+    def send_command(self, command: str):
+        """记录一条TSPL命令"""
+        self.ops.append(("cmd", command))
+
+    def print_text_windows_font(self, **kwargs):
+        """记录一段Windows字体文本（参数同 TSCPrinter.print_text_windows_font）"""
+        self.ops.append(("font", kwargs))
+
+    def put_bitmap(self, image, x: int, y: int, store: bool = False):
+        """记录一个点阵图片（参数同 PrinterSession.put_bitmap）"""
+        self.ops.append(("bitmap", (image, x, y, store)))
+
+
+class RawLabel:
+    """
+    预编译的标签：TSPL 程序中的一段（到 PRINT 命令为止），原样发送，不经过布局计算
+
+    片段自带 CLS 和 PRINT 命令。settings 为片段开始时生效的打印机设置命令，
+    会话的设置被其他标签改变过（如插队的紧急任务）时先重新下发；
+    end_settings 为片段结束时生效的设置。
+
+    操作：("cmd", 命令)、("font", Windows 字体参数)、("binary", 含二进制数据的命令)
+
+    downloads 为片段中 PUTBMP 使用的点阵文件（文件名 -> DOWNLOAD 命令）：
+    会话尚未下载该文件时先下载，因此从任意一张开始发送（断点续打、从中间开始的预编译程序）都不会缺少文件。
+    """
+
+    def __init__(self, settings: tuple, end_settings: tuple, ops: list, downloads: dict = None):
+        self.settings = settings
+        self.end_settings = end_settings
+        self.ops = ops
+        self.downloads = downloads or {}
+
+
+class PrinterSession:
+    """
+    打印会话：一次打开USB端口，连续打印多张标签
+
+    会话记录已下发的打印机设置（纸张尺寸、打印配置等），每张标签只清除图像缓冲区（CLS），
+    纸张尺寸或打印配置变化时只下发发生变化的设置命令；会话开始或设置未知时下发完整的初始化命令。
+
+    TSPL 命令先写入缓冲区，在 Windows 字体文本之前和每张标签结束时
+    合并为一次写入，减少 USB 往返次数。
+    提供与 TSCPrinter 相同的 send_command / print_text_windows_font 接口。
+
+    printer 可以传入与 TSCPrinter 接口相同的对象（如 program.ProgramRecorder），
+    用于记录命令流而不访问设备。
+
+    示例：
+        with PrinterSession() as session:
+            session.begin_label("100", "80")
+            session.send_command("BOX 10,10,100,100,3")
+            session.end_label()
+    """
+
+    def __init__(self, port: int = 0, printer=None):
+        self.printer = printer if printer is not None else tsc_printer()
+        self.port = port
+        self._settings = None
+        self._buffer = []
+        self._downloaded = set()  # 本次会话已下载到打印机内存的点阵文件名
+        self.bytes_sent = 0  # 本次会话写入打印机的命令字节数（用于估算 USB 带宽）
+
+    def __enter__(self):
+        logging.info("使用 USB 连接打印机...")
+        self.printer.open_port(self.port)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if exc_type is None:
+                self.flush()
+        finally:
+            self.printer.close_port()
+        return False
+
+    def begin_label(self, width: str, height: str, profile: str = "default"):
+        """
+        开始一张新标签
+
+        Args:
+            width: 标签宽度(mm)
+            height: 标签高度(mm)
+            profile: 打印配置名称（PRINT_PROFILES）
+        """
+        settings = printer_settings(str(width), str(height), profile)
+        if settings == self._settings:
+            self.send_command("CLS")
+        elif self._settings is None or self._settings[0] == "raw":
+            _init_printer_settings(self, str(width), str(height), profile)
+        else:
+            self._switch_settings(settings)
+        self._settings = settings
+
+    def _switch_settings(self, settings: tuple):
+        """只下发与当前设置不同的命令（如只切换 SPEED / DENSITY，或只改变 SIZE）"""
+        current = {_setting_key(command): command for command in self._settings}
+        keys = set()
+        self.send_command("CLS")
+        for command in settings:
+            key = _setting_key(command)
+            keys.add(key)
+            if current.get(key) != command:
+                self.send_command(command)
+        for key, command in _SETTING_RESETS.items():
+            if key in current and key not in keys:
+                self.send_command(command)
+
+    def reset_settings(self):
+        """下一张标签重新下发完整的打印机设置（命令流绕过 begin_label 发送后调用）"""
+        self._settings = None
+
+    def clear_printer_buffer(self):
+        """
+        丢弃尚未写入的命令，并清除打印机中已接收但尚未打印的标签（TSPL <ESC>!.）
+        """
+        self._buffer.clear()
+        self.printer.send_command("\x1b!.")
+        self.reset_settings()
+
+    def end_label(self, qty: int = 1):
+        """
+        打印当前标签并把缓冲区写入打印机
+
+        Args:
+            qty: 打印数量
+        """
+        self.send_command(f"PRINT {qty},1")
+        self.flush()
+
+    def send_label(self, label: Label, flush: bool = True):
+        """
+        发送一张预渲染的标签
+
+        Args:
+            label: 预渲染的标签（Label 或 RawLabel）
+            flush: RawLabel 发送后是否写入打印机；False 时命令留在缓冲区，与之后的标签合并写入（回放离线程序）
+        """
+        if isinstance(label, RawLabel):
+            self._send_raw_label(label, flush)
+            return
+        self.begin_label(label.width, label.height, label.profile)
+        for kind, op in label.ops:
+            if kind == "cmd":
+                self.send_command(op)
+            elif kind == "bitmap":
+                self.put_bitmap(*op)
+            else:
+                self.print_text_windows_font(**op)
+        self.end_label(label.qty)
+
+    def _send_raw_label(self, label: RawLabel, flush: bool = True):
+        """发送预编译的标签：会话当前的设置不是片段开始时的设置时，先下发片段的设置"""
+        if self._settings != ("raw", label.settings):
+            for command in label.settings:
+                self.send_command(command)
+        for name, command in label.downloads.items():
+            if name not in self._downloaded:
+                self.send_binary(command)
+                self._downloaded.add(name)
+        for kind, op in label.ops:
+            if kind == "cmd":
+                self.send_command(op)
+            elif kind == "binary":
+                self.send_binary(op)
+            else:
+                self.print_text_windows_font(**op)
+        if flush:
+            self.flush()
+        self._settings = ("raw", label.end_settings)
+
+    def send_command(self, command: str):
+        """写入一条TSPL命令（缓冲，见 flush）"""
+        self._buffer.append(command)
+
+    def flush(self):
+        """把缓冲区中的命令合并为一次写入发送给打印机"""
+        if self._buffer:
+            data = "\r\n".join(self._buffer)
+            self.printer.send_command(data)
+            self.bytes_sent += len(data) + 2
+            self._buffer.clear()
+
+    def print_text_windows_font(self, **kwargs):
+        """使用Windows字体打印文本（参数同 TSCPrinter.print_text_windows_font）"""
+        # 字体文本由驱动直接写入，必须先发送之前的命令以保持顺序
+        self.flush()
+        self.printer.print_text_windows_font(**kwargs)
+
+    def send_binary(self, data: bytes):
+        """写入含二进制数据的命令（先写入缓冲区中的命令以保持顺序）"""
+        self.flush()
+        self.printer.send_command_binary(data)
+        self.bytes_sent += len(data)
+
+    def put_bitmap(self, image, x: int, y: int, store: bool = False):
+        """
+        打印点阵图片
+
+        Args:
+            image: bitmap.Bitmap
+            x: X坐标 (dots)
+            y: Y坐标 (dots)
+            store: 是否下载到打印机内存：本次会话第一次使用时 DOWNLOAD，之后只发送 PUTBMP
+        """
+        if not store:
+            self.send_binary(image.bitmap_command(x, y))
+            return
+        if image.name not in self._downloaded:
+            self.send_binary(image.download_command())
+            self._downloaded.add(image.name)
+        self.send_command(image.putbmp_command(x, y))
 
 
 def print_label(
@@ -106,7 +407,7 @@ def print_label(
     if height is None:
         height = DEFAULT_HEIGHT
     
-    p = TSCPrinter()
+    p = tsc_printer()
     try:
         # 打开USB端口（参数0表示第一个USB打印机）
         logging.info("使用 USB 连接打印机...")
@@ -174,7 +475,7 @@ def print_type1(
     if height is None:
         height = DEFAULT_HEIGHT
     
-    p = TSCPrinter()
+    p = tsc_printer()
     try:
         # 打开USB端口（参数0表示第一个USB打印机）
         logging.info("使用 USB 连接打印机...")
@@ -199,7 +500,7 @@ def print_type1(
             
             # 打印第一行（上半部分居中）
             first_text = text_list[i]
-            text1_width = _estimate_text_width(first_text, font_height)
+            text1_width = _estimate_text_width(first_text, font_height, TYPE1_FONT_NAME)
             
             # 上半部分水平垂直居中
             x1 = margin + (effective_width - text1_width) // 2
@@ -219,7 +520,7 @@ def print_type1(
             # 打印第二行（下半部分居中，如果存在）
             if i + 1 < len(text_list):
                 second_text = text_list[i + 1]
-                text2_width = _estimate_text_width(second_text, font_height)
+                text2_width = _estimate_text_width(second_text, font_height, TYPE1_FONT_NAME)
                 
                 # 下半部分水平垂直居中
                 x2 = margin + (effective_width - text2_width) // 2
@@ -244,6 +545,102 @@ def print_type1(
         p.close_port()
 
 
+def _type2_layout(width: str, height: str, qr_size: int) -> dict:
+    """
+    计算二维码+文本标签的固定布局
+
+    同一批次中纸张尺寸、二维码单元宽度和字体都相同，这部分只需计算一次；
+    二维码尺寸随内容变化，由 _type2_positions 按内容计算每张标签的位置。
+
+    Args:
+        width: 标签宽度(mm)
+        height: 标签高度(mm)
+        qr_size: 二维码单元宽度
+
+    Returns:
+        布局参数字典
+    """
+    # 计算打印区域尺寸（与 print_calibration_border 保持一致）
+    width_dots = int(float(width) * DPI_RATIO)
+    height_dots = int(float(height) * DPI_RATIO)
+
+    # 有效打印区域（使用统一的边距配置）
+    margin = PRINT_MARGIN
+    effective_width = width_dots - 2 * margin
+    effective_height = height_dots - 2 * margin
+
+    return {
+        "qr_size": qr_size,
+        "left": margin,
+        "top": margin,
+        "effective_width": effective_width,
+        "effective_height": effective_height,
+        # 纸张中心线
+        "center_x": margin + effective_width // 2,
+        # 二维码和文本之间的间距、字体大小（使用统一的配置）
+        "spacing": TYPE2_QR_SPACING,
+        "font_height": TYPE2_FONT_HEIGHT,
+    }
+
+
+def _type2_positions(layout: dict, qr_content: str) -> tuple[int, int, int]:
+    """
+    按二维码内容计算一张标签的元素位置
+
+    二维码实际宽度 = 模块数（由内容决定的版本号） × 单元宽度，
+    二维码 + 间距 + 文本 整体垂直居中，二维码水平居中。
+    超出有效打印区域时靠左上边距放置（不产生负坐标），接口在提交前已拒绝放不下的内容。
+
+    Returns:
+        (qr_x, qr_y, text_y)
+    """
+    qr_pixel_size = geometry.qr_width(qr_content, layout["qr_size"])
+
+    # 计算整体高度（二维码 + 间距 + 文本）
+    total_height = qr_pixel_size + layout["spacing"] + layout["font_height"]
+
+    # 计算垂直起始位置（整体垂直居中）
+    qr_y = layout["top"] + max(0, (layout["effective_height"] - total_height) // 2)
+
+    # 二维码水平居中（相对于纸张中心线）
+    qr_x = max(layout["left"], layout["center_x"] - qr_pixel_size // 2)
+    return qr_x, qr_y, qr_y + qr_pixel_size + layout["spacing"]
+
+
+def _draw_type2_label(p, layout: dict, qr_content: str, text: str, text_width: int = None):
+    """
+    按预先计算的布局绘制一张二维码+文本标签（不初始化、不执行打印）
+
+    Args:
+        p: Label、PrinterSession 或已打开端口的 TSCPrinter
+        layout: _type2_layout 的结果
+        qr_content: 二维码内容
+        text: 下方显示的文本
+        text_width: 文本宽度（dots），批量打印时可预先批量估算，默认现场估算
+    """
+    qr_x, qr_y, text_y = _type2_positions(layout, qr_content)
+
+    # 打印二维码
+    p.send_command(f'QRCODE {qr_x},{qr_y},H,{layout["qr_size"]},A,0,M2,"{qr_content}"')
+
+    # 文本水平居中（相对于纸张中心线），位于二维码下方
+    if text_width is None:
+        text_width = _estimate_text_width(text, layout["font_height"], TYPE2_FONT_NAME)
+    text_x = max(layout["left"], layout["center_x"] - text_width // 2)
+
+    # 打印文本
+    p.print_text_windows_font(
+        x=text_x,
+        y=text_y,
+        font_height=layout["font_height"],
+        rotation=0,
+        font_style=0,
+        font_underline=0,
+        font_face_name=TYPE2_FONT_NAME,
+        text=text
+    )
+
+
 def print_type2(
     qr_content: str = "",
     text: str = "",
@@ -291,7 +688,7 @@ def print_type2(
     if qr_size is None:
         qr_size = TYPE2_QR_SIZE
     
-    p = TSCPrinter()
+    p = tsc_printer()
     try:
         # 打开USB端口（参数0表示第一个USB打印机）
         logging.info("使用 USB 连接打印机...")
@@ -300,59 +697,8 @@ def print_type2(
         # 初始化打印机设置
         _init_printer_settings(p, width, height)
         
-        # 计算打印区域尺寸（与 print_calibration_border 保持一致）
-        width_dots = int(float(width) * DPI_RATIO)
-        height_dots = int(float(height) * DPI_RATIO)
-        
-        # 有效打印区域（使用统一的边距配置）
-        margin = PRINT_MARGIN
-        effective_width = width_dots - 2 * margin
-        effective_height = height_dots - 2 * margin
-        
-        # 字体大小（使用统一的配置）
-        font_height = TYPE2_FONT_HEIGHT
-        
-        # 估算二维码尺寸（二维码通常是30-35个模块）
-        qr_modules = 33  # 中等复杂度二维码的模块数
-        qr_pixel_size = qr_size * qr_modules
-        
-        # 估算文本宽度
-        text_width = _estimate_text_width(text, font_height)
-        
-        # 二维码和文本之间的间距（使用统一的配置）
-        spacing = TYPE2_QR_SPACING
-        
-        # 计算整体高度（二维码 + 间距 + 文本）
-        total_height = qr_pixel_size + spacing + font_height
-        
-        # 计算垂直起始位置（整体垂直居中）
-        start_y = margin + (effective_height - total_height) // 2
-        
-        # 计算纸张中心线
-        center_x = margin + effective_width // 2
-        
-        # 二维码水平居中（相对于纸张中心线）
-        qr_x = center_x - qr_pixel_size // 2
-        qr_y = start_y
-        
-        # 打印二维码
-        p.send_command(f'QRCODE {qr_x},{qr_y},H,{qr_size},A,0,M2,"{qr_content}"')
-
-        # 文本水平居中（相对于纸张中心线），位于二维码下方
-        text_x = center_x - text_width // 2
-        text_y = qr_y + qr_pixel_size + spacing
-        
-        # 打印文本
-        p.print_text_windows_font(
-            x=text_x,
-            y=text_y,
-            font_height=font_height,
-            rotation=0,
-            font_style=0,
-            font_underline=0,
-            font_face_name=TYPE2_FONT_NAME,
-            text=text
-        )
+        layout = _type2_layout(width, height, qr_size)
+        _draw_type2_label(p, layout, qr_content, text)
         
         # 执行打印
         p.send_command(f"PRINT {qty},1")
@@ -368,7 +714,7 @@ def test_connection() -> bool:
     Returns:
         bool: 连接成功返回True
     """
-    p = TSCPrinter()
+    p = tsc_printer()
     try:
         logging.info("测试 USB 连接...")
         p.open_port(0)
@@ -385,7 +731,7 @@ def calibrate_paper():
     注意：适用于有间隙的标签纸
     使用 EOP 命令让打印机自动检测标签间隙
     """
-    p = TSCPrinter()
+    p = tsc_printer()
     try:
         logging.info("开始纸张校准（间隙检测模式）...")
         p.open_port(0)
@@ -433,7 +779,7 @@ def print_calibration_border(
     if height is None:
         height = DEFAULT_HEIGHT
     
-    p = TSCPrinter()
+    p = tsc_printer()
     try:
         # 打开USB端口
         logging.info("使用 USB 连接打印机...")
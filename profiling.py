@@ -0,0 +1,127 @@
+"""
+性能剖析模块
+按需对接下来的 N 个打印任务做确定性剖析（cProfile），结果写入 PROFILE_DIR，用于排查某个布局慢在哪里
+
+- arm(n) 之后提交的打印任务依次被选中（计数只保存在内存中，服务重启后清零）
+- 被选中的任务不使用预渲染线程，在打印线程中逐张渲染和发送，
+  渲染（布局计算、print_text_windows_font 等）和发送在同一份剖析中；
+  剖析本身使函数调用变慢，总耗时只用于比较各函数的占比
+- 任务结束时写入 <时间>-<任务ID>.prof（pstats 格式，可用 snakeviz、flameprof 等工具查看火焰图）
+  和同名 .json（任务信息、流水线统计和累计耗时最多的 PROFILE_TOP 个函数）
+- 未启用时每个提交的任务只多一次计数判断
+"""
+import cProfile
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from config import PROFILE_DIR, PROFILE_MAX_JOBS, PROFILE_TOP
+
+_lock = threading.Lock()
+_remaining = 0  # 还要剖析的任务数
+_captures: deque = deque(maxlen=PROFILE_MAX_JOBS)  # 最近写入的剖析结果
+
+
+def arm(jobs: int):
+    """
+    剖析接下来提交的 jobs 个打印任务（替换尚未用完的计数）
+
+    Args:
+        jobs: 任务数（0 表示停止）
+    """
+    global _remaining
+    with _lock:
+        _remaining = jobs
+    if jobs:
+        logging.info("将剖析接下来的%d个打印任务，结果写入 %s", jobs, os.path.abspath(PROFILE_DIR))
+
+
+def claim() -> Optional[cProfile.Profile]:
+    """
+    新任务提交时调用：需要剖析时返回该任务的剖析器，否则返回 None
+
+    剖析器作为上下文管理器使用（with profile: 期间的调用被记录），可以多次进入。
+    """
+    global _remaining
+    if not _remaining:
+        return None
+    with _lock:
+        if not _remaining:
+            return None
+        _remaining -= 1
+    return cProfile.Profile()
+
+
+def save(profile: cProfile.Profile, meta: dict) -> Optional[str]:
+    """
+    写入剖析结果
+
+    Args:
+        profile: claim() 返回的剖析器
+        meta: 任务信息（写入 .json，至少包含 job_id）
+
+    Returns:
+        .prof 文件路径；写入失败时返回 None（记录错误，不影响任务）
+    """
+    base = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{meta['job_id']}")
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profile.dump_stats(base + ".prof")
+        stats = pstats.Stats(profile)
+        entry = {
+            **meta,
+            "profile": base + ".prof",
+            "profiled_seconds": round(stats.total_tt, 4),
+            "calls": stats.total_calls,
+            "top": _top(stats),
+        }
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False, indent=2)
+    except Exception as e:
+        logging.error("剖析结果写入失败: %s: %s", base, e)
+        return None
+
+    with _lock:
+        _captures.append({
+            "job_id": meta["job_id"],
+            "profile": entry["profile"],
+            "metadata": base + ".json",
+            "profiled_seconds": entry["profiled_seconds"],
+            "created": time.time(),
+        })
+    logging.info("剖析结果已写入: %s", base + ".prof")
+    return base + ".prof"
+
+
+def _top(stats: pstats.Stats) -> list:
+    """累计耗时最多的 PROFILE_TOP 个函数"""
+    rows = []
+    for (filename, line, name), (_, calls, tottime, cumtime, _) in stats.stats.items():
+        rows.append({
+            "function": f"{os.path.basename(filename)}:{line}({name})",
+            "calls": calls,
+            "tottime": round(tottime, 4),
+            "cumtime": round(cumtime, 4),
+        })
+    rows.sort(key=lambda row: row["cumtime"], reverse=True)
+    return rows[:PROFILE_TOP]
+
+
+def snapshot() -> dict:
+    """
+    剖析状态
+
+    Returns:
+        {"remaining", "dir", "captures"}；captures 为最近写入的剖析结果（最多 PROFILE_MAX_JOBS 个）
+    """
+    with _lock:
+        return {
+            "remaining": _remaining,
+            "dir": os.path.abspath(PROFILE_DIR),
+            "captures": list(_captures),
+        }
@@ -0,0 +1,282 @@
+"""
+TSPL 程序模块
+把预渲染的标签编译为文本程序（与 PrinterSession 实际发送给打印机的命令流一致），
+用于离线队列保存和回放
+
+程序格式：每行一条
+- TSPL 命令：原样发送
+- `@WINDOWSFONT {json}`：Windows 字体文本（由 tsclib 在本机光栅化后发送，不是 TSPL 命令），
+  json 为 print_text_windows_font 的参数
+- `@BINARY {base64}`：含二进制数据的命令（BITMAP、DOWNLOAD 等），原样写入
+- 以 `#` 开头的行为注释，回放时忽略
+
+程序自带完整的打印机设置（第一张标签前下发 SIZE / GAP 等），可以单独回放，
+也可以按 PRINT 命令拆分为预编译的标签（split_labels），作为普通任务逐张打印。
+"""
+import base64
+import json
+import re
+from collections import OrderedDict
+from typing import IO, Callable, Iterable, Iterator, Tuple
+
+from config import DPI_RATIO, PRINT_SPEED
+from printer import Label, PrinterSession, RawLabel
+
+FONT_DIRECTIVE = "@WINDOWSFONT "
+BINARY_DIRECTIVE = "@BINARY "
+
+# 打印机设置命令（不绘制内容，影响之后的所有标签）；SET 按第二个词区分（SET TEAR、SET PEEL 等）
+SETTINGS_COMMANDS = (
+    "SIZE", "GAP", "BLINE", "DIRECTION", "REFERENCE", "OFFSET", "SPEED", "DENSITY", "SET", "SHIFT",
+    "CODEPAGE", "LIMITFEED"
+)
+
+# DOWNLOAD / PUTBMP 命令中的文件名
+_DOWNLOAD_NAME = re.compile(rb'^DOWNLOAD "([^"]+)"')
+_PUTBMP_NAME = re.compile(r'^PUTBMP\s+[^"]*"([^"]+)"', re.IGNORECASE)
+
+# 程序中没有 SPEED 命令时按此速度估算（英寸/秒，与 _init_printer_settings 一致）
+DEFAULT_SPEED = PRINT_SPEED
+
+
+class ProgramRecorder:
+    """
+    记录命令流的打印机替身（接口同 TSCPrinter），传给 PrinterSession 使用
+
+    提供 out 时程序逐行写入该文件，不在内存中累积（命令行工具的 --dry-run）。
+    """
+
+    def __init__(self, out: IO[str] = None):
+        self.lines = []
+        self.out = out
+
+    def open_port(self, port: int = 0):
+        pass
+
+    def close_port(self):
+        pass
+
+    def send_command(self, command: str):
+        self._write(command.split("\r\n"))
+
+    def print_text_windows_font(self, **kwargs):
+        self._write([FONT_DIRECTIVE + json.dumps(kwargs, ensure_ascii=False)])
+
+    def send_command_binary(self, command: bytes):
+        self._write([BINARY_DIRECTIVE + base64.b64encode(command).decode("ascii")])
+
+    def _write(self, lines: list):
+        if self.out is None:
+            self.lines.extend(lines)
+        else:
+            self.out.write("".join(line + "\n" for line in lines))
+
+
+def compile_labels(labels: Iterable[Label]) -> Tuple[str, int]:
+    """
+    把标签编译为程序
+
+    Args:
+        labels: 标签可迭代对象
+
+    Returns:
+        (程序文本, 标签数)
+    """
+    recorder = ProgramRecorder()
+    session = PrinterSession(printer=recorder)
+    count = 0
+    for label in labels:
+        session.send_label(label)
+        count += 1
+    return "\n".join(recorder.lines) + "\n", count
+
+
+def replay(
+    session: PrinterSession,
+    program: str,
+    write_bytes: int,
+    skip: int = 0,
+    progress: Callable[[int], None] = None
+) -> int:
+    """
+    在已打开的会话中回放程序
+
+    程序按 PRINT 命令拆分为标签（split_labels），连续的标签合并为一次写入（每次不超过约 write_bytes 字节），
+    遇到 Windows 字体文本和二进制命令时先写入之前的命令。
+    每次写入后通过 progress 报告已写入打印机的 PRINT 命令数；回放中断后以 skip 跳过这些标签，
+    从第一张未确认的标签继续（先下发该标签开始时生效的打印机设置和用到的点阵文件）。
+
+    Args:
+        session: 已打开的打印会话
+        program: 程序文本
+        write_bytes: 单次写入的目标大小（字节）
+        skip: 跳过的 PRINT 命令数（上次回放已确认写入的标签）
+        progress: progress(已确认写入的 PRINT 命令数，包括跳过的)
+
+    Returns:
+        本次回放的 PRINT 命令数
+    """
+    prints = 0
+    unconfirmed = 0
+    pending = 0
+    for index, label in enumerate(split_labels(program)):
+        if index < skip:
+            continue
+        session.send_label(label, flush=False)
+        for kind, op in label.ops:
+            if kind == "cmd":
+                pending += len(op.encode("utf-8")) + 2
+                if op.upper().startswith("PRINT "):
+                    unconfirmed += 1
+        if pending >= write_bytes:
+            session.flush()
+            prints, unconfirmed, pending = prints + unconfirmed, 0, 0
+            if progress is not None:
+                progress(skip + prints)
+
+    session.flush()
+    prints += unconfirmed
+    if progress is not None and unconfirmed:
+        progress(skip + prints)
+    # 程序自带打印机设置，下一张普通标签重新下发完整设置
+    session.reset_settings()
+    return prints
+
+
+def _lines(program: str) -> Iterator[str]:
+    """程序中的有效行（去掉空行和注释）"""
+    for line in program.split("\n"):
+        line = line.rstrip("\r")
+        if line and not line.startswith("#"):
+            yield line
+
+
+def _settings_key(line: str):
+    """设置命令的键（同一个键的新命令覆盖旧命令），不是设置命令时返回 None"""
+    words = line.split()
+    if words[0].upper() not in SETTINGS_COMMANDS:
+        return None
+    if words[0].upper() == "SET" and len(words) > 1:
+        return "SET " + words[1].upper()
+    return words[0].upper()
+
+
+def split_labels(program: str) -> Iterator[RawLabel]:
+    """
+    按 PRINT 命令把程序拆分为预编译的标签（最后一个 PRINT 之后的命令单独成为一段）
+
+    Args:
+        program: 程序文本
+
+    程序中的文件只在第一次使用时 DOWNLOAD，拆分后每段通过 RawLabel.downloads 带上自己下载和 PUTBMP 用到的文件，
+    由会话在尚未下载时发送（见 PrinterSession._send_raw_label）。
+
+    Yields:
+        RawLabel: 每段的操作、用到的点阵文件，以及该段开始、结束时生效的打印机设置
+    """
+    settings = OrderedDict()
+    stored = {}  # 文件名 -> DOWNLOAD 命令
+    start = ()
+    ops = []
+    downloads = {}
+    for line in _lines(program):
+        if line.startswith(FONT_DIRECTIVE):
+            ops.append(("font", json.loads(line[len(FONT_DIRECTIVE):])))
+            continue
+        if line.startswith(BINARY_DIRECTIVE):
+            data = base64.b64decode(line[len(BINARY_DIRECTIVE):])
+            download = _DOWNLOAD_NAME.match(data)
+            if download is None:
+                ops.append(("binary", data))
+                continue
+            name = download.group(1).decode("ascii", "replace")
+            if stored.get(name, data) != data:
+                # 同名文件被替换为不同内容：原样发送
+                ops.append(("binary", data))
+            stored[name] = downloads[name] = data
+            continue
+
+        putbmp = _PUTBMP_NAME.match(line)
+        if putbmp and putbmp.group(1) in stored:
+            downloads[putbmp.group(1)] = stored[putbmp.group(1)]
+        ops.append(("cmd", line))
+        key = _settings_key(line)
+        if key is not None:
+            settings.pop(key, None)
+            settings[key] = line
+        if line.upper().startswith("PRINT "):
+            end = tuple(settings.values())
+            yield RawLabel(start, end, ops, downloads)
+            start, ops, downloads = end, [], {}
+    if ops:
+        yield RawLabel(start, tuple(settings.values()), ops, downloads)
+
+
+def measure(program: str) -> dict:
+    """
+    统计程序的标签数、发送字节数和走纸时间
+
+    每张标签走纸 SIZE 高度 + GAP 间隙，速度按 SPEED（英寸/秒）计算，不含传输和打印机处理时间
+    （包含这些开销的估算见 throughput）。
+
+    Args:
+        program: 程序文本
+
+    Returns:
+        {"labels", "prints", "bytes", "font_texts", "feed_mm", "feed_seconds"}；
+        labels 为打印的张数，prints 为 PRINT 命令数（预编译打印时逐张发送的单位）；bytes 为写入打印机的 TSPL 和二进制命令字节数（Windows 字体文本由 tsclib 光栅化，只统计个数）
+    """
+    labels = 0
+    prints = 0
+    size = 0
+    font_texts = 0
+    feed_mm = 0.0
+    seconds = 0.0
+    height = gap = 0.0
+    speed = DEFAULT_SPEED
+    for line in _lines(program):
+        if line.startswith(FONT_DIRECTIVE):
+            font_texts += 1
+            continue
+        if line.startswith(BINARY_DIRECTIVE):
+            size += len(base64.b64decode(line[len(BINARY_DIRECTIVE):])) + 2
+            continue
+
+        size += len(line.encode("utf-8")) + 2
+        command, _, args = line.partition(" ")
+        command = command.upper()
+        values = [value.strip() for value in args.split(",")]
+        try:
+            if command == "SIZE" and len(values) > 1:
+                height = _to_mm(values[1])
+            elif command == "GAP":
+                gap = _to_mm(values[0])
+            elif command == "SPEED":
+                speed = float(values[0]) or DEFAULT_SPEED
+            elif command == "PRINT":
+                count = int(values[0]) * (int(values[1]) if len(values) > 1 and values[1] else 1)
+                labels += count
+                prints += 1
+                feed_mm += count * (height + gap)
+                seconds += count * (height + gap) / (speed * 25.4)
+        except ValueError:
+            continue
+
+    return {
+        "labels": labels,
+        "prints": prints,
+        "bytes": size,
+        "font_texts": font_texts,
+        "feed_mm": round(feed_mm, 1),
+        "feed_seconds": round(seconds, 2),
+    }
+
+
+def _to_mm(value: str) -> float:
+    """TSPL 长度参数换算为毫米（"80 mm"、"3 dot"，不带单位时为英寸）"""
+    value = value.strip().lower()
+    if value.endswith("mm"):
+        return float(value[:-2])
+    if value.endswith("dot"):
+        return float(value[:-3]) / DPI_RATIO
+    return float(value) * 25.4
@@ -0,0 +1,162 @@
+"""
+离线队列模块
+打印机未连接时，把已编译的标签程序（见 program）暂存到磁盘，
+状态轮询发现打印机重新连接后由打印线程按提交顺序回放。
+
+- 每个请求一个文件，文件名以提交时间开头（按文件名排序即提交顺序），
+  第一行为 `#SPOOL {json}` 元信息；先写临时文件再改名，不会留下半个文件
+- 总大小不超过 SPOOL_MAX_BYTES，超过时拒绝新的离线打印（SpoolFull）
+- 超过 SPOOL_MAX_AGE 仍未打印的文件丢弃（过期标签通常已无意义）
+- 文件在整个程序写入打印机后才删除；回放进度（已写入打印机的 PRINT 命令数）记录在同名的 .sent 文件中，
+  回放中断时下次跳过已写入的标签，从第一张未确认的标签继续
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import List, Tuple
+
+import metrics
+from config import SPOOL_DIR, SPOOL_MAX_AGE, SPOOL_MAX_BYTES
+
+_HEADER = "#SPOOL "
+_SUFFIX = ".tspl"
+_SENT_SUFFIX = ".sent"
+
+_lock = threading.Lock()
+
+
+class SpoolFull(Exception):
+    """离线队列已满"""
+
+
+def add(program: str, labels: int, kind: str) -> str:
+    """
+    把编译好的程序加入离线队列
+
+    Args:
+        program: 程序文本（program.compile_labels 的结果）
+        labels: 标签数
+        kind: 请求类型（print / batch）
+
+    Returns:
+        离线队列ID
+
+    Raises:
+        SpoolFull: 加入后超过 SPOOL_MAX_BYTES
+    """
+    spool_id = uuid.uuid4().hex[:16]
+    meta = {"id": spool_id, "kind": kind, "labels": labels, "created": time.time()}
+    data = (_HEADER + json.dumps(meta) + "\n" + program).encode("utf-8")
+
+    with _lock:
+        os.makedirs(SPOOL_DIR, exist_ok=True)
+        used = sum(size for _, size in _files())
+        if used + len(data) > SPOOL_MAX_BYTES:
+            raise SpoolFull(f"离线队列已满（{used}/{SPOOL_MAX_BYTES} 字节）")
+
+        path = os.path.join(SPOOL_DIR, f"{time.time_ns():020d}-{spool_id}{_SUFFIX}")
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    metrics.inc("spool.added")
+    logging.info(f"打印机未连接，已加入离线队列: {spool_id}（{labels}张标签）")
+    return spool_id
+
+
+def pending() -> List[str]:
+    """
+    待回放的文件（按提交顺序），同时丢弃过期的文件
+
+    Returns:
+        文件路径列表
+    """
+    now = time.time()
+    paths = []
+    with _lock:
+        for path, _ in _files():
+            if now - os.path.getmtime(path) > SPOOL_MAX_AGE:
+                logging.warning(f"离线标签超过保留时间，已丢弃: {os.path.basename(path)}")
+                _remove(path)
+                metrics.inc("spool.expired")
+                continue
+            paths.append(path)
+    return paths
+
+
+def load(path: str) -> Tuple[dict, str]:
+    """
+    读取离线队列文件
+
+    Returns:
+        (元信息, 程序文本)；元信息的 sent 为上次回放已写入打印机的 PRINT 命令数
+    """
+    with open(path, encoding="utf-8") as f:
+        header = f.readline()
+        program = f.read()
+    meta = json.loads(header[len(_HEADER):]) if header.startswith(_HEADER) else {}
+    try:
+        with open(path + _SENT_SUFFIX, encoding="ascii") as f:
+            meta["sent"] = int(f.read() or 0)
+    except (FileNotFoundError, ValueError):
+        meta["sent"] = 0
+    return meta, program
+
+
+def mark_sent(path: str, sent: int):
+    """
+    记录回放进度（每次写入打印机后调用）
+
+    Args:
+        path: 离线队列文件
+        sent: 已写入打印机的 PRINT 命令数
+    """
+    tmp = path + _SENT_SUFFIX + ".tmp"
+    with open(tmp, "w", encoding="ascii") as f:
+        f.write(str(sent))
+    os.replace(tmp, path + _SENT_SUFFIX)
+
+
+def remove(path: str):
+    """删除已回放的文件"""
+    with _lock:
+        _remove(path)
+
+
+def stats() -> dict:
+    """离线队列统计（文件数、总字节数、最早文件的等待时间）"""
+    with _lock:
+        files = _files()
+        oldest = min((os.path.getmtime(path) for path, _ in files), default=None)
+    return {
+        "files": len(files),
+        "bytes": sum(size for _, size in files),
+        "max_bytes": SPOOL_MAX_BYTES,
+        "oldest_age": round(time.time() - oldest, 1) if oldest is not None else None
+    }
+
+
+def _files() -> List[Tuple[str, int]]:
+    """离线队列中的文件及大小，按文件名（提交顺序）排序（调用方持有 _lock）"""
+    if not os.path.isdir(SPOOL_DIR):
+        return []
+    files = []
+    for name in sorted(os.listdir(SPOOL_DIR)):
+        if name.endswith(_SUFFIX):
+            path = os.path.join(SPOOL_DIR, name)
+            files.append((path, os.path.getsize(path)))
+    return files
+
+
+def _remove(path: str):
+    for name in (path, path + _SENT_SUFFIX):
+        try:
+            os.remove(name)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,204 @@
+"""
+打印机状态模块
+后台线程（printer-status）定期通过 TSPL 实时状态查询（<ESC>!?）读取打印机状态并缓存，
+/health、/test 和打印线程读取缓存，不直接访问设备。
+
+- 打印线程持有会话时复用它的端口查询（只在两张标签之间查询，不打断标签的命令流）；
+  空闲时由轮询线程短暂打开端口查询
+- 缺纸、开盖、暂停等状态下打印线程暂停发送，恢复后自动继续
+- 状态变化时通知监听者（如打印线程在打印机重新连接后立即重试中断的任务）
+"""
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, List, Optional
+
+import metrics
+from config import STATUS_POLL_INTERVAL, STATUS_QUERY_DELAY_MS
+from printer import tsc_printer
+
+if TYPE_CHECKING:
+    from tsclib import TSCPrinter
+
+# 状态字节各位的含义（TSPL <ESC>!? 返回值），按优先级排列
+_STATUS_BITS = (
+    (0x01, "head-open"),
+    (0x02, "paper-jam"),
+    (0x04, "paper-out"),
+    (0x08, "ribbon-out"),
+    (0x80, "error"),
+    (0x10, "paused"),
+    (0x20, "printing"),
+)
+
+# 可以继续发送标签的状态（打印中的打印机仍可接收后续标签）
+READY_STATES = ("ready", "printing")
+
+# 打印机已连接但不能打印的状态：暂停发送，等待恢复
+# （offline 不在其中：连接失败由打印线程按中断处理）
+HOLD_STATES = ("head-open", "paper-jam", "paper-out", "ribbon-out", "error", "paused")
+
+# 设备访问锁：打印线程发送一张标签、轮询线程查询状态时持有
+device_lock = threading.RLock()
+
+_cond = threading.Condition()
+_state = {
+    "state": "unknown",
+    "ready": False,
+    "flags": [],
+    "code": None,
+    "error": None,
+    "updated": None,
+}
+_attached: Optional["TSCPrinter"] = None
+_listeners: List[Callable[[dict], None]] = []
+_poller: Optional[threading.Thread] = None
+_stopping = False
+
+
+def decode(code: str) -> List[str]:
+    """
+    解析状态码
+
+    Args:
+        code: get_status 返回的十六进制状态码（如 "00"、"04"）
+
+    Returns:
+        状态标记列表，就绪时为 ["ready"]
+    """
+    value = int(code, 16)
+    flags = [name for bit, name in _STATUS_BITS if value & bit]
+    return flags or ["ready"]
+
+
+def snapshot() -> dict:
+    """当前缓存的打印机状态"""
+    with _cond:
+        return dict(_state, flags=list(_state["flags"]))
+
+
+def held() -> Optional[str]:
+    """
+    打印机是否处于需要暂停发送的状态
+
+    Returns:
+        暂停发送的原因（如 "paper-out"），可以发送时返回 None
+    """
+    with _cond:
+        state = _state["state"]
+    return state if state in HOLD_STATES else None
+
+
+def wait_ready(timeout: float) -> bool:
+    """
+    等待打印机离开暂停发送的状态
+
+    Args:
+        timeout: 最长等待时间（秒）
+
+    Returns:
+        是否可以继续发送
+    """
+    with _cond:
+        _cond.wait_for(lambda: _state["state"] not in HOLD_STATES or _stopping, timeout=timeout)
+        return _state["state"] not in HOLD_STATES
+
+
+def add_listener(listener: Callable[[dict], None]):
+    """注册状态变化监听者（在轮询线程中调用，参数为新状态）"""
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def attach(printer: Optional["TSCPrinter"]):
+    """
+    登记（或取消登记）打印线程当前打开的端口，轮询时复用该端口
+
+    调用方需持有 device_lock。
+    """
+    global _attached
+    _attached = printer
+
+
+def attached() -> bool:
+    """打印线程是否持有打开的端口（调用方需持有 device_lock）"""
+    return _attached is not None
+
+
+def refresh() -> dict:
+    """
+    立即查询一次打印机状态并更新缓存
+
+    Returns:
+        最新状态
+    """
+    with device_lock:
+        printer = _attached
+        try:
+            if printer is not None:
+                code = printer.get_status(STATUS_QUERY_DELAY_MS)
+            else:
+                printer = tsc_printer()
+                printer.open_port(0)
+                try:
+                    code = printer.get_status(STATUS_QUERY_DELAY_MS)
+                finally:
+                    printer.close_port()
+            flags = decode(code)
+            _update(flags[0], flags, code=code)
+        except Exception as e:
+            _update("offline", ["offline"], error=str(e))
+    return snapshot()
+
+
+def _update(state: str, flags: List[str], code: str = None, error: str = None):
+    """更新缓存，状态变化时记录日志并通知监听者"""
+    with _cond:
+        changed = state != _state["state"]
+        _state.update(
+            state=state,
+            ready=state in READY_STATES,
+            flags=flags,
+            code=code,
+            error=error,
+            updated=time.time(),
+        )
+        current = dict(_state)
+        _cond.notify_all()
+
+    metrics.inc("status.polls")
+    if not changed:
+        return
+    logging.info("打印机状态: %s%s", state, f" ({error})" if error else "")
+    for listener in _listeners:
+        try:
+            listener(current)
+        except Exception as e:
+            logging.error("打印机状态监听失败: %s", e)
+
+
+def start():
+    """启动状态轮询线程"""
+    global _poller, _stopping
+    _stopping = False
+    _poller = threading.Thread(target=_run, name="printer-status", daemon=True)
+    _poller.start()
+
+
+def stop():
+    """停止状态轮询线程"""
+    global _stopping
+    with _cond:
+        _stopping = True
+        _cond.notify_all()
+    if _poller is not None:
+        _poller.join(STATUS_POLL_INTERVAL + 1)
+
+
+def _run():
+    """轮询线程：每隔 STATUS_POLL_INTERVAL 秒查询一次"""
+    while True:
+        refresh()
+        with _cond:
+            if _cond.wait_for(lambda: _stopping, timeout=STATUS_POLL_INTERVAL):
+                return
@@ -0,0 +1,8 @@
+"""
+测试配置
+测试不访问打印机：打印机驱动库（tsclib）延迟加载，需要打印会话的测试使用 program.ProgramRecorder 等替身
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
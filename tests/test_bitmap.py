@@ -0,0 +1,113 @@
+"""图片转换：黑白化（阈值、有序抖动、误差扩散）和图片来源的路径限制"""
+import base64
+import io
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import bitmap
+
+
+def _gradient(rows: int = 16, columns: int = 256) -> np.ndarray:
+    return np.tile(np.arange(columns, dtype=np.float32) * 255 / (columns - 1), (rows, 1))
+
+
+def _png(size=(8, 8), color=0) -> bytes:
+    out = io.BytesIO()
+    Image.new("L", size, color).save(out, "PNG")
+    return out.getvalue()
+
+
+def test_threshold_marks_pixels_below_threshold_black():
+    gray = _gradient()
+    black = bitmap._to_black(gray, "threshold", 100)
+    assert np.array_equal(black, gray < 100)
+
+
+def test_ordered_dither_tiles_bayer_matrix():
+    black = bitmap._to_black(np.full((16, 16), 128, dtype=np.float32), "ordered", 128)
+    # 8×8 周期重复，中灰约一半的点为黑色
+    assert np.array_equal(black[:8, :8], black[8:, 8:])
+    assert black.mean() == pytest.approx(0.5, abs=0.02)
+    assert bitmap._to_black(np.zeros((8, 8), dtype=np.float32), "ordered", 128).all()
+    assert not bitmap._to_black(np.full((8, 8), 255, dtype=np.float32), "ordered", 128).any()
+
+
+@pytest.mark.parametrize("level", [0, 64, 128, 192, 255])
+def test_floyd_steinberg_preserves_average_gray(level):
+    black = bitmap._to_black(np.full((64, 64), level, dtype=np.float32), "diffusion", 128)
+    assert black.dtype == bool and black.shape == (64, 64)
+    assert black.mean() == pytest.approx(1 - level / 255, abs=0.02)
+
+
+def test_floyd_steinberg_follows_gradient():
+    black = bitmap._to_black(_gradient(32, 256), "diffusion", 128)
+    assert black[:, :32].mean() > 0.8
+    assert black[:, -32:].mean() < 0.2
+
+
+def test_pack_rows_pads_to_whole_bytes_with_white():
+    black = np.array([[True, False, True]])
+    assert bitmap._pack_rows(black) == bytes([0b01011111])
+
+
+def test_load_gray_rejects_too_many_pixels(monkeypatch):
+    monkeypatch.setattr(bitmap, "IMAGE_MAX_PIXELS", 100)
+    with pytest.raises(bitmap.ImageError):
+        bitmap._load_gray(_png((20, 20)), 10, 10)
+
+
+@pytest.fixture
+def image_dir(tmp_path, monkeypatch):
+    root = tmp_path / "images"
+    root.mkdir()
+    (root / "logo.png").write_bytes(_png())
+    monkeypatch.setattr(bitmap, "IMAGE_DIR", str(root))
+    return root
+
+
+def test_read_source_reads_file_under_image_dir(image_dir):
+    assert bitmap.read_source(path="logo.png") == _png()
+
+
+@pytest.mark.parametrize("path", ["../secret.png", "sub/../../secret.png"])
+def test_read_source_rejects_relative_escape(image_dir, path):
+    (image_dir.parent / "secret.png").write_bytes(_png())
+    with pytest.raises(bitmap.ImageError, match="图片目录"):
+        bitmap.read_source(path=path)
+
+
+def test_read_source_rejects_absolute_path_outside(image_dir):
+    outside = image_dir.parent / "secret.png"
+    outside.write_bytes(_png())
+    with pytest.raises(bitmap.ImageError, match="图片目录"):
+        bitmap.read_source(path=str(outside))
+
+
+@pytest.mark.skipif(not hasattr(os, "symlink"), reason="不支持符号链接")
+def test_read_source_rejects_symlink_escape(image_dir):
+    outside = image_dir.parent / "secret.png"
+    outside.write_bytes(_png())
+    try:
+        os.symlink(outside, image_dir / "link.png")
+    except OSError:
+        pytest.skip("无法创建符号链接")
+    with pytest.raises(bitmap.ImageError, match="图片目录"):
+        bitmap.read_source(path="link.png")
+
+
+def test_read_source_missing_and_oversized(image_dir, monkeypatch):
+    with pytest.raises(bitmap.ImageError, match="不存在"):
+        bitmap.read_source(path="missing.png")
+    monkeypatch.setattr(bitmap, "IMAGE_MAX_BYTES", 10)
+    with pytest.raises(bitmap.ImageError, match="超过"):
+        bitmap.read_source(path="logo.png")
+
+
+def test_read_source_base64():
+    data = base64.b64encode(_png()).decode("ascii")
+    assert bitmap.read_source(data="data:image/png;base64," + data) == _png()
+    with pytest.raises(bitmap.ImageError):
+        bitmap.read_source(data="not base64!")
@@ -0,0 +1,60 @@
+"""custom 模板邮件合并（rows）：提交前逐行校验占位符和内容"""
+import pytest
+from fastapi import HTTPException
+
+import main
+from printer import Label
+
+
+def _job(elements, rows=None) -> main.PrintJob:
+    return main.PrintJob(template="custom", layout={"elements": elements, "rows": rows})
+
+
+def _validate(job: main.PrintJob) -> HTTPException:
+    with pytest.raises(HTTPException) as info:
+        main._validate_job(job)
+    assert info.value.status_code == 400
+    return info.value
+
+
+QR = {"type": "qrcode", "x": 10, "y": 10, "content": "https://example.com/{sn}"}
+TEXT = {"type": "text", "x": 10, "y": 200, "text": "编号 {sn}"}
+
+
+def test_rows_render_each_placeholder():
+    compiled = main._prepare_custom_layout(_job([QR, TEXT], rows=[{"sn": "A1"}]))
+    label = Label("100", "80")
+    main._render_compiled_layout(label, compiled, {"sn": "A1"})
+    (kind, command), (_, font) = label.ops
+    assert kind == "cmd" and command.startswith("QRCODE 10,10,") and command.endswith(',"https://example.com/A1"')
+    assert font["text"] == "编号 A1"
+
+
+@pytest.mark.parametrize("value", ['A1"\r\nPRINT 100,1\r\n"', 'A1"', "A1\nCLS", "A1\x00"])
+def test_rows_reject_command_injection(value):
+    error = _validate(_job([QR], rows=[{"sn": "ok"}, {"sn": value}]))
+    assert error.detail.startswith("rows[1]")
+
+
+def test_text_allows_quotes_but_not_control_characters():
+    main._validate_job(_job([TEXT], rows=[{"sn": '12" 尺'}]))
+    error = _validate(_job([TEXT], rows=[{"sn": "a\r\nb"}]))
+    assert error.detail.startswith("rows[0]")
+
+
+def test_rows_format_spec_mismatch_rejected_before_printing():
+    element = {"type": "text", "x": 0, "y": 0, "text": "数量 {qty:d}"}
+    main._validate_job(_job([element], rows=[{"qty": 3}]))
+    error = _validate(_job([element], rows=[{"qty": 3}, {"qty": "三"}]))
+    assert error.detail.startswith("rows[1] 字段格式错误")
+
+
+def test_static_barcode_content_checked_without_rows():
+    barcode = {"type": "barcode", "x": 0, "y": 0, "content": 'AB"C'}
+    error = _validate(_job([barcode]))
+    assert error.detail.startswith("layout.elements[0]")
+
+
+def test_missing_field_names_row():
+    error = _validate(_job([QR], rows=[{"sn": "A"}, {"other": "B"}]))
+    assert "rows[1] 缺少占位符字段: sn" == error.detail
@@ -0,0 +1,109 @@
+"""文本宽度：按字体文件的步进宽度（hmtx）计算，以及找不到字体文件时的估算规则"""
+import struct
+
+import pytest
+
+import fontmetrics
+
+# 测试字体：unitsPerEm 1000，字符单元高度 1000（ascender 800 - descender -200）
+# 字形 0 .notdef，1 "A"（600），2 "W"（900），3 "中"（1000）
+_ADVANCES = [500, 600, 900, 1000]
+_CMAP = {ord("A"): 1, ord("W"): 2, ord("中"): 3}
+
+
+def _cmap_format4(mapping: dict) -> bytes:
+    """每个码位一段（idRangeOffset = 0），最后是 0xFFFF 结束段"""
+    segments = [(code, (glyph - code) & 0xFFFF) for code, glyph in sorted(mapping.items())]
+    segments.append((0xFFFF, 1))
+    seg_count = len(segments)
+    ends = b"".join(struct.pack(">H", code) for code, _ in segments)
+    starts = ends
+    deltas = b"".join(struct.pack(">H", delta) for _, delta in segments)
+    range_offsets = b"\0\0" * seg_count
+    body = ends + b"\0\0" + starts + deltas + range_offsets
+    subtable = struct.pack(">HHHHHHH", 4, 14 + len(body), 0, seg_count * 2, 0, 0, 0) + body
+    # cmap 头 + 一个 (3, 1) 子表记录
+    return struct.pack(">HHHHI", 0, 1, 3, 1, 12) + subtable
+
+
+def _build_font() -> bytes:
+    head = bytearray(54)
+    struct.pack_into(">H", head, 18, 1000)
+    hhea = bytearray(36)
+    struct.pack_into(">hh", hhea, 4, 800, -200)
+    struct.pack_into(">H", hhea, 34, len(_ADVANCES))
+    hmtx = b"".join(struct.pack(">Hh", advance, 0) for advance in _ADVANCES)
+    tables = {"cmap": _cmap_format4(_CMAP), "head": bytes(head), "hhea": bytes(hhea), "hmtx": hmtx}
+
+    offset = 12 + 16 * len(tables)
+    directory, data = b"", b""
+    for tag, table in tables.items():
+        directory += struct.pack(">4sIII", tag.encode("latin-1"), 0, offset + len(data), len(table))
+        data += table + b"\0" * (-len(table) % 4)
+    return struct.pack(">IHHHH", 0x00010000, len(tables), 0, 0, 0) + directory + data
+
+
+@pytest.fixture(autouse=True)
+def _fresh_caches():
+    fontmetrics._fonts.clear()
+    fontmetrics._dot_widths.cache_clear()
+    fontmetrics.text_width.cache_clear()
+    yield
+    fontmetrics._fonts.clear()
+    fontmetrics._dot_widths.cache_clear()
+    fontmetrics.text_width.cache_clear()
+
+
+@pytest.fixture
+def test_font(tmp_path, monkeypatch):
+    path = tmp_path / "test.ttf"
+    path.write_bytes(_build_font())
+    monkeypatch.setitem(fontmetrics.FONT_FILES, "测试字体", [str(path)])
+    return "测试字体"
+
+
+def test_parsed_font_uses_hmtx_advances(test_font):
+    metrics = fontmetrics.get_font_metrics(test_font)
+    assert metrics is not None and metrics.cell_height == 1000
+    # 高度 20 dots：1000 字体单位 = 20 dots
+    assert fontmetrics.text_width("A", 20, test_font) == 12
+    assert fontmetrics.text_width("W", 20, test_font) == 18
+    assert fontmetrics.text_width("中", 20, test_font) == 20
+    assert fontmetrics.text_width("AWW中", 20, test_font) == 12 + 18 + 18 + 20
+
+
+def test_parsed_font_falls_back_to_heuristic_for_unmapped_characters(test_font):
+    # 字体中没有 "x"、"文"、全角 "Ａ"：按估算规则填充
+    assert fontmetrics.text_width("x", 20, test_font) == 12
+    assert fontmetrics.text_width("文", 20, test_font) == 20
+    assert fontmetrics.text_width("Ａ", 20, test_font) == 20
+
+
+def test_missing_font_file_uses_heuristic(tmp_path, monkeypatch):
+    monkeypatch.setitem(fontmetrics.FONT_FILES, "不存在的字体", [str(tmp_path / "missing.ttf")])
+    assert fontmetrics.get_font_metrics("不存在的字体") is None
+    assert fontmetrics.text_width("AB中文", 20, "不存在的字体") == 12 * 2 + 20 * 2
+
+
+@pytest.mark.parametrize("text, wide", [
+    ("abc123", 0),
+    ("中文", 2),
+    ("，。「」", 4),          # 中文标点 U+3000-U+303F
+    ("　", 1),                # 全角空格 U+3000
+    ("ＡＢＣ１２３！", 7),    # 全角字母、数字、标点 U+FF01-U+FF60
+    ("￥￡", 2),              # 全角货币符号 U+FFE0-U+FFE6
+    ("ｱｲｳ", 0),              # 半角片假名 U+FF61-U+FF9F 仍为窄字符
+    ("😀", 0),                # BMP 以外
+])
+def test_heuristic_width_classes(text, wide):
+    expected = wide * 20 + (len(text) - wide) * 12
+    assert fontmetrics.text_width(text, 20) == expected
+    assert fontmetrics.text_widths([text], 20) == [expected]
+
+
+def test_text_widths_matches_text_width(test_font):
+    texts = ["", "A", "AW中", "ＡＢ，x", "中文Ａ😀", "ｱW"]
+    for font_name in (None, test_font):
+        assert fontmetrics.text_widths(texts, 24, font_name) == [
+            fontmetrics.text_width(text, 24, font_name) for text in texts
+        ]
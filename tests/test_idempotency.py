@@ -0,0 +1,143 @@
+"""Idempotency-Key：重放成功和失败的结果、可重试的失败重新执行、按过期时间和容量清理"""
+import threading
+import types
+
+import pytest
+from fastapi import HTTPException, Response
+
+import idempotency
+import main
+
+
+@pytest.fixture(autouse=True)
+def _empty_cache():
+    idempotency._entries.clear()
+    yield
+    idempotency._entries.clear()
+
+
+class Printer:
+    """记录执行次数的打印函数：依次返回结果或抛出 outcomes 中的异常"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        outcome = self.outcomes.pop(0) if self.outcomes else {"status": "ok", "printed": self.calls}
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def _submit(func, key="key-1", body=None):
+    """按 /print 接口的方式执行一次请求，返回 (结果, 响应)"""
+    response = Response()
+    body = body or main.PrintJob(template="single-text", print_list=[{"text": "A1"}])
+    return main._idempotent("/print", body, key, response, func), response
+
+
+def test_success_is_replayed_without_printing_again():
+    printer = Printer()
+    first, response = _submit(printer)
+    assert "Idempotency-Replayed" not in response.headers
+
+    second, response = _submit(printer)
+    assert second == first
+    assert response.headers["Idempotency-Replayed"] == "true"
+    assert printer.calls == 1
+
+
+def test_client_error_is_replayed_with_header():
+    printer = Printer(HTTPException(status_code=400, detail="print_list不能为空"))
+    with pytest.raises(HTTPException) as first:
+        _submit(printer)
+    assert "Idempotency-Replayed" not in (first.value.headers or {})
+
+    with pytest.raises(HTTPException) as second:
+        _submit(printer)
+    assert second.value.status_code == 400
+    assert second.value.detail == "print_list不能为空"
+    assert second.value.headers["Idempotency-Replayed"] == "true"
+    assert printer.calls == 1
+
+
+def test_server_error_is_not_cached_and_retry_prints():
+    offline = HTTPException(status_code=503, detail={"error": "打印机连接失败", "state": "offline", "printed": 0})
+    printer = Printer(offline)
+    with pytest.raises(HTTPException) as first:
+        _submit(printer)
+    assert first.value.status_code == 503
+
+    result, response = _submit(printer)
+    assert result == {"status": "ok", "printed": 2}
+    assert "Idempotency-Replayed" not in response.headers
+    assert printer.calls == 2
+
+
+def test_interrupted_job_is_replayed_not_resubmitted():
+    interrupted = HTTPException(status_code=503, detail={"error": "打印中断", "state": "interrupted", "printed": 3})
+    printer = Printer(interrupted)
+    with pytest.raises(HTTPException):
+        _submit(printer)
+    with pytest.raises(HTTPException) as second:
+        _submit(printer)
+    assert second.value.detail["state"] == "interrupted"
+    assert second.value.headers["Idempotency-Replayed"] == "true"
+    assert printer.calls == 1
+
+
+def test_same_key_with_different_body_conflicts():
+    _submit(Printer())
+    other = main.PrintJob(template="single-text", print_list=[{"text": "B2"}])
+    with pytest.raises(HTTPException) as error:
+        _submit(Printer(), body=other)
+    assert error.value.status_code == 409
+
+
+def test_retry_waits_for_request_in_progress():
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return "done"
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(idempotency.execute("k", "f", slow)))
+    first.start()
+    assert started.wait(5)
+    second = threading.Thread(target=lambda: results.append(idempotency.execute("k", "f", slow)))
+    second.start()
+    release.set()
+    first.join(5)
+    second.join(5)
+    assert sorted(results, key=lambda r: r[1]) == [("done", False), ("done", True)]
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(idempotency, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_TTL", 60)
+    printer = Printer()
+
+    idempotency.execute("k", "f", printer)
+    now[0] += 59
+    assert idempotency.execute("k", "f", printer)[1] is True
+    now[0] += 2
+    assert idempotency.execute("k", "f", printer)[1] is False
+    assert printer.calls == 2
+
+
+def test_oldest_entries_are_evicted_beyond_capacity(monkeypatch):
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_MAX_ENTRIES", 2)
+    printer = Printer()
+    for key in ("a", "b", "c"):
+        idempotency.execute(key, "f", printer)
+    assert idempotency.size() == 2
+    assert list(idempotency._entries) == ["b", "c"]
+
+    # "a" 已被淘汰，重新执行
+    assert idempotency.execute("a", "f", printer)[1] is False
+    assert printer.calls == 4
@@ -0,0 +1,112 @@
+"""任务日志：服务重启后恢复未完成的任务、跳过已确认的标签，以及旧版本数据库的迁移"""
+import json
+import sqlite3
+
+import pytest
+
+import jobs
+import journal
+import main
+from printer import PrinterSession
+from program import FONT_DIRECTIVE, ProgramRecorder
+
+TEXTS = ["A1", "A2", "A3", "A4", "A5"]
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    journal.close_journal()
+    monkeypatch.setattr(journal, "JOURNAL_COMMIT_LABELS", 1)
+    path = str(tmp_path / "jobs.db")
+    journal.open_journal(path)
+    yield path
+    journal.close_journal()
+
+
+def _crash():
+    """模拟进程异常退出：未提交的进度丢失，不调用 close_journal"""
+    journal._conn.close()
+    journal._conn = None
+    journal._pending.clear()
+
+
+def _payload() -> str:
+    return main.PrintJob(template="single-text", print_list=[{"text": text} for text in TEXTS]).model_dump_json()
+
+
+def _printed_texts(recorder: ProgramRecorder) -> list:
+    return [json.loads(line[len(FONT_DIRECTIVE):])["text"] for line in recorder.lines if line.startswith(FONT_DIRECTIVE)]
+
+
+def test_half_sent_job_is_recovered_after_crash(db, monkeypatch):
+    journal.record("job-1", "print", _payload(), "key:abcd1234")
+    journal.update("job-1", "printing", 0)
+    for sent in (1, 2, 3):
+        journal.progress("job-1", sent)
+    _crash()
+
+    journal.open_journal(db)
+    (entry,) = journal.unfinished()
+    assert (entry["id"], entry["state"], entry["sent"]) == ("job-1", "printing", 3)
+
+    submitted = []
+    monkeypatch.setattr(jobs, "submit", submitted.append)
+    main._recover_tasks()
+    (task,) = submitted
+    assert (task.id, task.sent, task.client, task.priority) == ("job-1", 3, "key:abcd1234", "normal")
+    assert task.recovered and task.state == "queued"
+    assert [part.name for part in task.parts] == ["single-text"]
+
+
+def test_recovered_job_skips_journaled_labels(db):
+    journal.record("job-2", "print", _payload())
+    job = main.PrintJob.model_validate_json(_payload())
+    task = jobs.PrintTask("print", _payload(), [main._task_part(job)], task_id="job-2", sent=3)
+
+    recorder = ProgramRecorder()
+    session = PrinterSession(printer=recorder)
+    while task.state not in journal.FINISHED_STATES:
+        jobs._step(session, task)
+
+    assert _printed_texts(recorder) == ["A4", "A5"]
+    assert task.state == "done" and task.sent == 5
+    assert journal.get("job-2")["state"] == "done"
+    assert journal.get("job-2")["sent"] == 5
+
+
+def test_unrecoverable_payload_is_marked_failed(db, monkeypatch):
+    journal.record("job-3", "print", "{not json")
+    monkeypatch.setattr(jobs, "submit", lambda task: pytest.fail("不应提交"))
+    main._recover_tasks()
+    assert journal.get("job-3")["state"] == "failed"
+    assert journal.unfinished() == []
+
+
+def test_pre_series_database_gains_client_column(tmp_path, monkeypatch):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE jobs (id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL, state TEXT NOT NULL, "
+        "sent INTEGER NOT NULL DEFAULT 0, error TEXT, created REAL NOT NULL, updated REAL NOT NULL)"
+    )
+    conn.execute(
+        "INSERT INTO jobs VALUES ('old-1', 'print', ?, 'interrupted', 2, 'USB', 1.0, 1.0)", (_payload(),)
+    )
+    conn.commit()
+    conn.close()
+
+    journal.close_journal()
+    journal.open_journal(path)
+    try:
+        (entry,) = journal.unfinished()
+        assert entry["client"] is None and entry["sent"] == 2
+
+        submitted = []
+        monkeypatch.setattr(jobs, "submit", submitted.append)
+        main._recover_tasks()
+        assert submitted[0].client == "local"
+
+        journal.record("new-1", "print", _payload(), "10.0.0.5")
+        assert journal.get("new-1")["client"] == "10.0.0.5"
+    finally:
+        journal.close_journal()
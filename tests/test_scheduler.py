@@ -0,0 +1,177 @@
+"""打印线程调度：优先级插队、客户端加权轮询（DRR）、在标签边界取消和暂停"""
+import re
+import threading
+import time
+
+import pytest
+
+import fairqueue
+import jobs
+import journal
+from printer import Label, PrinterSession
+from program import ProgramRecorder
+
+_MARKER = re.compile(r'^TEXT 10,10,"3",0,1,1,"(.+)"$')
+
+
+class LabelRecorder(ProgramRecorder):
+    """记录每张标签的标记；发送完某张标签后调用 on_label（在打印线程中，标签边界之前）"""
+
+    def __init__(self):
+        super().__init__()
+        self.labels = []
+        self.on_label = None
+
+    def _write(self, lines: list):
+        super()._write(lines)
+        for line in lines:
+            match = _MARKER.match(line)
+            if match:
+                self.labels.append(match.group(1))
+            elif line.startswith("PRINT") and self.on_label is not None:
+                self.on_label(self.labels[-1])
+
+
+def _task(name: str, count: int, priority: str = "normal", client: str = "local") -> jobs.PrintTask:
+    """count 张标签的任务，每张标签带标记 name-序号"""
+    def render():
+        for i in range(1, count + 1):
+            label = Label("50", "30")
+            label.send_command(f'TEXT 10,10,"3",0,1,1,"{name}-{i}"')
+            yield label
+
+    part = jobs.TaskPart(name, render, lambda stats: f"{stats.labels}张")
+    return jobs.PrintTask("print", "{}", [part], priority=priority, client=client)
+
+
+@pytest.fixture
+def worker(tmp_path, monkeypatch):
+    """独立的调度状态和任务日志；start() 启动打印线程，测试结束时停止"""
+    journal.close_journal()
+    journal.open_journal(str(tmp_path / "jobs.db"))
+    monkeypatch.setattr(jobs, "_lanes", {lane: fairqueue.FairQueue() for lane in jobs.JOB_LANES})
+    monkeypatch.setattr(jobs, "_tasks", jobs.OrderedDict())
+    monkeypatch.setattr(jobs, "_interrupted", [])
+    monkeypatch.setattr(jobs, "_drain", False)
+    monkeypatch.setattr(jobs, "_stopping", False)
+    recorder = LabelRecorder()
+    monkeypatch.setattr(jobs, "PrinterSession", lambda: PrinterSession(printer=recorder))
+
+    thread = threading.Thread(target=jobs._run, name="print-worker", daemon=True)
+    recorder.start = thread.start
+    yield recorder
+
+    with jobs._cond:
+        jobs._stopping = True
+        jobs._cond.notify_all()
+    if thread.is_alive():
+        thread.join(5)
+    journal.close_journal()
+
+
+def _wait(*tasks):
+    for task in tasks:
+        assert task.done.wait(5), f"任务 {task.id} 未结束（{task.state}）"
+
+
+def _wait_for(predicate):
+    deadline = time.monotonic() + 5
+    while not predicate():
+        assert time.monotonic() < deadline, "等待超时"
+        time.sleep(0.005)
+
+
+def test_urgent_task_preempts_bulk_at_label_boundary(worker):
+    bulk = jobs.submit(_task("bulk", 4, priority="bulk"))
+    urgent = _task("urgent", 2, priority="urgent")
+
+    def on_label(marker):
+        if marker == "bulk-2":
+            jobs.submit(urgent)
+
+    worker.on_label = on_label
+    worker.start()
+    _wait(bulk, urgent)
+    assert worker.labels == ["bulk-1", "bulk-2", "urgent-1", "urgent-2", "bulk-3", "bulk-4"]
+    assert bulk.state == urgent.state == "done"
+
+
+def test_lanes_run_in_priority_order(worker):
+    tasks = [
+        jobs.submit(_task("bulk", 1, priority="bulk")),
+        jobs.submit(_task("normal", 1)),
+        jobs.submit(_task("urgent", 1, priority="urgent")),
+    ]
+    worker.start()
+    _wait(*tasks)
+    assert worker.labels == ["urgent-1", "normal-1", "bulk-1"]
+
+
+def test_clients_share_lane_by_weight(worker, monkeypatch):
+    monkeypatch.setattr(fairqueue, "FAIR_QUANTUM", 2)
+    monkeypatch.setattr(fairqueue, "CLIENT_WEIGHTS", {"a": 2})
+    a = jobs.submit(_task("a", 8, client="a"))
+    b = jobs.submit(_task("b", 8, client="b"))
+    worker.start()
+    _wait(a, b)
+    # a 每轮 2 × 2 = 4 张，b 每轮 1 × 2 = 2 张；a 完成后 b 连续打印
+    assert [marker[0] for marker in worker.labels] == list("aaaabbaaaabbbbbb")
+    assert [marker for marker in worker.labels if marker[0] == "a"] == [f"a-{i}" for i in range(1, 9)]
+
+
+def _control_after(worker, marker, action, task):
+    """打印线程发送完 marker 后，在标签边界之前由另一个线程发起 action（cancel / pause）"""
+    reached, release = threading.Event(), threading.Event()
+
+    def on_label(sent):
+        if sent == marker:
+            reached.set()
+            release.wait(5)
+
+    worker.on_label = on_label
+    worker.start()
+    assert reached.wait(5)
+    caller = threading.Thread(target=getattr(jobs, action), args=(task.id,))
+    caller.start()
+    _wait_for(lambda: task._control == action)
+    release.set()
+    caller.join(5)
+
+
+def test_cancel_stops_at_label_boundary_and_clears_buffer(worker):
+    task = jobs.submit(_task("a", 5))
+    _control_after(worker, "a-2", "cancel", task)
+    _wait(task)
+    assert task.state == "cancelled" and task.sent == 2
+    assert worker.labels == ["a-1", "a-2"]
+    # 最后发送的标签属于该任务：清除打印机缓冲区
+    assert task.buffer_cleared
+    assert "\x1b!." in worker.lines
+    assert journal.get(task.id)["state"] == "cancelled"
+
+
+def test_cancel_keeps_buffer_when_other_task_sent_last(worker, monkeypatch):
+    monkeypatch.setattr(fairqueue, "FAIR_QUANTUM", 1)
+    a = jobs.submit(_task("a", 4, client="a"))
+    b = jobs.submit(_task("b", 4, client="b"))
+    _control_after(worker, "b-1", "cancel", a)
+    _wait(a, b)
+    assert a.state == "cancelled" and a.sent == 1
+    assert not a.buffer_cleared
+    assert "\x1b!." not in worker.lines
+    assert worker.labels == ["a-1", "b-1", "b-2", "b-3", "b-4"]
+    assert b.state == "done"
+
+
+def test_pause_and_resume_continue_from_next_label(worker):
+    a = jobs.submit(_task("a", 4))
+    b = jobs.submit(_task("b", 2, client="other"))
+    _control_after(worker, "a-2", "pause", a)
+    _wait(b)
+    assert a.state == "paused" and a.sent == 2
+    assert journal.get(a.id)["state"] == "paused"
+
+    jobs.resume(a.id)
+    _wait_for(lambda: a.state == "done")
+    assert [marker for marker in worker.labels if marker[0] == "a"] == ["a-1", "a-2", "a-3", "a-4"]
+    assert worker.labels.index("b-2") < worker.labels.index("a-3")
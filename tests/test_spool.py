@@ -0,0 +1,91 @@
+"""离线队列：回放中断后从第一张未确认的标签继续，不重复打印"""
+import pytest
+
+import jobs
+import program
+import spool
+from printer import Label, PrinterSession
+
+
+class FlakyPrinter(program.ProgramRecorder):
+    """记录命令流的打印机替身，第 fail_at 次写入时抛出异常（模拟 USB 断开）"""
+
+    def __init__(self, fail_at: int = None):
+        super().__init__()
+        self.writes = 0
+        self.fail_at = fail_at
+
+    def send_command(self, command: str):
+        self.writes += 1
+        if self.fail_at is not None and self.writes >= self.fail_at:
+            raise OSError("USB 断开")
+        super().send_command(command)
+
+
+def _program(count: int = 10) -> str:
+    labels = []
+    for i in range(count):
+        label = Label("60", "40")
+        label.send_command(f'TEXT 10,10,"3",0,1,1,"L{i}"')
+        labels.append(label)
+    return program.compile_labels(labels)[0]
+
+
+def _printed(printer: program.ProgramRecorder) -> list:
+    return [line for line in printer.lines if line.startswith("TEXT ")]
+
+
+def test_replay_reports_progress_and_resumes_after_failure():
+    text = _program(10)
+    confirmed = []
+    flaky = FlakyPrinter(fail_at=5)
+    with pytest.raises(OSError):
+        program.replay(PrinterSession(printer=flaky), text, write_bytes=1, progress=confirmed.append)
+    sent = confirmed[-1]
+    assert sent == len(_printed(flaky)) == 4
+
+    retry = FlakyPrinter()
+    prints = program.replay(PrinterSession(printer=retry), text, write_bytes=1, skip=sent)
+    assert prints == 6
+    assert _printed(flaky) + _printed(retry) == [f'TEXT 10,10,"3",0,1,1,"L{i}"' for i in range(10)]
+    # 继续回放时先下发标签开始时生效的打印机设置
+    assert any(line.startswith("SIZE ") for line in retry.lines[:20])
+
+
+def test_replay_without_skip_matches_program():
+    text = _program(3)
+    printer = FlakyPrinter()
+    assert program.replay(PrinterSession(printer=printer), text, write_bytes=64 * 1024) == 3
+    assert [line for line in printer.lines if line] == [line for line in text.split("\n") if line]
+
+
+@pytest.fixture
+def spool_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(spool, "SPOOL_DIR", str(tmp_path / "spool"))
+    return tmp_path / "spool"
+
+
+def test_mark_sent_is_loaded_and_removed_with_file(spool_dir):
+    spool.add(_program(2), 2, "print")
+    path = spool.pending()[0]
+    assert spool.load(path)[0]["sent"] == 0
+    spool.mark_sent(path, 1)
+    assert spool.load(path)[0]["sent"] == 1
+    spool.remove(path)
+    assert list(spool_dir.iterdir()) == []
+
+
+def test_drain_spool_does_not_reprint_confirmed_labels(spool_dir, monkeypatch):
+    monkeypatch.setattr(jobs, "SPOOL_WRITE_BYTES", 1)
+    spool.add(_program(10), 10, "print")
+
+    flaky = FlakyPrinter(fail_at=7)
+    with pytest.raises(jobs._DeviceError):
+        jobs._drain_spool(PrinterSession(printer=flaky))
+    path = spool.pending()[0]
+    assert spool.load(path)[0]["sent"] == len(_printed(flaky))
+
+    retry = FlakyPrinter()
+    jobs._drain_spool(PrinterSession(printer=retry))
+    assert len(_printed(flaky)) + len(_printed(retry)) == 10
+    assert spool.pending() == []
@@ -0,0 +1,194 @@
+"""
+打印时间估算模块
+按物理模型估算每张标签的打印时间，并用打印线程实测的标签间隔校准，用于任务的剩余时间和完成时间（ETA）
+
+- 物理模型：每张纸取 走纸时间（(SIZE 高度 + GAP 间隙) ÷ SPEED）与 传输时间（字节数 ÷ USB 带宽）中较大的一个
+- USB 带宽按实测的写入字节数和写入时间更新（指数加权平均）
+- 同一种标签（模板 × 走纸时间 × 浓度）实测 THROUGHPUT_MIN_SAMPLES 张后直接使用实测耗时；
+  之前使用物理模型 × 全局校准系数（所有标签实测耗时与物理模型之比），
+  校准系数包含了浓度、Windows 字体光栅化等物理模型没有考虑的开销
+- 标签间隔只在连续发送时测量（会话刚打开、打印机暂停或执行取消后的第一张不计），
+  打印机缓冲区未满时写入很快，刚开始的几张会偏短，加权平均后收敛到实际速度
+
+校准结果只保存在内存中，服务重启后重新学习。
+"""
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from config import (
+    THROUGHPUT_ALPHA, THROUGHPUT_BANDWIDTH, THROUGHPUT_MIN_SAMPLES, THROUGHPUT_OUTLIER, THROUGHPUT_PROFILES
+)
+from printer import print_profile
+
+# 只用较大的写入测量带宽（小写入的耗时主要是 USB 往返延迟）
+_MIN_BANDWIDTH_BYTES = 4096
+
+
+class Shape:
+    """
+    任务段中标签的打印形状（估算的输入）
+
+    Args:
+        template: 模板名（按模板学习每张标签的字节数）
+        labels: 标签数（任务进度的单位，即 PRINT 命令数）
+        feed_seconds: 每张纸按 SPEED 走纸的时间（秒）
+        copies: 每张标签打印的份数（PRINT 数量）
+        density: 打印浓度
+        label_bytes: 每张标签发送的字节数，未知时使用该模板的实测平均值
+    """
+
+    def __init__(
+        self,
+        template: str,
+        labels: int,
+        feed_seconds: float,
+        copies: float = 1,
+        density: Optional[int] = None,
+        label_bytes: Optional[float] = None
+    ):
+        self.template = template
+        self.labels = labels
+        self.feed_seconds = feed_seconds
+        self.copies = copies
+        self.label_bytes = label_bytes
+        self.key = (template, round(feed_seconds, 3), density)
+
+
+def label_shape(template: str, labels: int, height, copies: int = 1, profile: str = "default") -> Shape:
+    """
+    按打印配置（GAP、SPEED、DENSITY）生成模板任务的打印形状
+
+    Args:
+        template: 模板名
+        labels: 标签数
+        height: 标签高度(mm)
+        copies: 每张标签打印的份数
+        profile: 打印配置名称（PRINT_PROFILES）
+    """
+    settings = print_profile(profile)
+    feed = (float(height) + float(settings["gap"])) / (settings["speed"] * 25.4)
+    return Shape(template, labels, feed, copies, settings["density"])
+
+
+def program_shape(info: dict, copies: int = 1) -> Shape:
+    """
+    预编译程序的打印形状（按 program.measure 的统计取每张标签的平均值）
+
+    Args:
+        info: program.measure 的结果
+        copies: 整个程序重复打印的次数
+    """
+    prints = max(info["prints"], 1)
+    sheets = max(info["labels"], 1)
+    return Shape(
+        "compiled",
+        info["prints"] * copies,
+        info["feed_seconds"] / sheets,
+        copies=sheets / prints,
+        density=None,
+        label_bytes=info["bytes"] / prints
+    )
+
+
+_lock = threading.Lock()
+_bandwidth = float(THROUGHPUT_BANDWIDTH)
+_bandwidth_samples = 0
+_factor = 1.0  # 实测耗时 ÷ 物理模型
+_samples = 0
+_template_bytes: dict[str, float] = {}  # 模板 -> 每张标签的平均字节数
+# 标签种类 -> {"seconds": 每张纸的平均耗时, "samples": 实测张数}
+_profiles: "OrderedDict[tuple, dict]" = OrderedDict()
+
+
+def _prior(shape: Shape) -> float:
+    """物理模型：每张纸的走纸时间与传输时间中较大的一个（调用方持有 _lock）"""
+    label_bytes = shape.label_bytes
+    if label_bytes is None:
+        label_bytes = _template_bytes.get(shape.template, 0.0)
+    return max(shape.feed_seconds, label_bytes / shape.copies / _bandwidth)
+
+
+def _sheet_seconds(shape: Shape) -> float:
+    """每张纸的估算耗时（调用方持有 _lock）"""
+    profile = _profiles.get(shape.key)
+    if profile is not None and profile["samples"] >= THROUGHPUT_MIN_SAMPLES:
+        return profile["seconds"]
+    return _prior(shape) * _factor
+
+
+def label_seconds(shape: Shape) -> float:
+    """每张标签（含 PRINT 的全部份数）的估算打印时间（秒）"""
+    with _lock:
+        return _sheet_seconds(shape) * shape.copies
+
+
+def observe(shape: Shape, label_bytes: int, send_seconds: float, interval: Optional[float]):
+    """
+    记录一张标签的发送情况（打印线程每发送一张标签调用一次）
+
+    Args:
+        shape: 标签所属任务段的打印形状
+        label_bytes: 写入打印机的字节数
+        send_seconds: 写入耗时（秒）
+        interval: 与上一张标签发送完成的间隔（秒）；不是连续发送时为 None
+    """
+    global _bandwidth, _bandwidth_samples, _factor, _samples
+    with _lock:
+        if label_bytes >= _MIN_BANDWIDTH_BYTES and send_seconds > 0:
+            _bandwidth += THROUGHPUT_ALPHA * (label_bytes / send_seconds - _bandwidth)
+            _bandwidth_samples += 1
+        average = _template_bytes.get(shape.template)
+        _template_bytes[shape.template] = (
+            label_bytes if average is None else average + THROUGHPUT_ALPHA * (label_bytes - average)
+        )
+        if interval is None:
+            return
+
+        seconds = interval / shape.copies
+        profile = _profiles.get(shape.key)
+        if profile is not None and profile["samples"] >= THROUGHPUT_MIN_SAMPLES \
+                and seconds > THROUGHPUT_OUTLIER * profile["seconds"]:
+            return
+        if profile is None:
+            profile = _profiles[shape.key] = {"seconds": seconds, "samples": 0}
+            while len(_profiles) > THROUGHPUT_PROFILES:
+                _profiles.popitem(last=False)
+        else:
+            profile["seconds"] += THROUGHPUT_ALPHA * (seconds - profile["seconds"])
+            _profiles.move_to_end(shape.key)
+        profile["samples"] += 1
+
+        prior = _prior(shape)
+        if prior > 0:
+            _factor += THROUGHPUT_ALPHA * (seconds / prior - _factor)
+            _samples += 1
+
+
+def stats() -> dict:
+    """
+    校准状态
+
+    Returns:
+        {"bandwidth_bytes_per_second", "bandwidth_samples", "correction", "samples", "profiles"}；
+        profiles 为各种标签的实测耗时：template、feed_seconds（物理模型的走纸时间）、density、
+        seconds_per_label（每张纸）、labels_per_minute、samples
+    """
+    with _lock:
+        return {
+            "bandwidth_bytes_per_second": round(_bandwidth),
+            "bandwidth_samples": _bandwidth_samples,
+            "correction": round(_factor, 3),
+            "samples": _samples,
+            "profiles": [
+                {
+                    "template": template,
+                    "feed_seconds": feed,
+                    "density": density,
+                    "seconds_per_label": round(profile["seconds"], 3),
+                    "labels_per_minute": round(60 / profile["seconds"], 1) if profile["seconds"] > 0 else None,
+                    "samples": profile["samples"],
+                }
+                for (template, feed, density), profile in _profiles.items()
+            ],
+        }
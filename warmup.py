@@ -0,0 +1,112 @@
+"""
+启动预热模块
+服务启动后由后台线程（warmup）依次执行预热步骤，报告就绪状态（readiness），与存活状态（/health）分开
+
+- 存活：进程在运行、能够响应请求；/health 不等待驱动加载，启动后立即可用
+- 就绪：必需的预热步骤（如加载打印机驱动库）已完成，第一个打印请求不再承担驱动加载、
+  打开端口和字体光栅化等冷启动开销
+- 步骤按顺序执行，某个步骤失败时记录错误并继续执行后续步骤；必需步骤失败时保持未就绪
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+
+import metrics
+
+# (名称, 执行函数, 是否必需)；执行函数可以返回一段说明（如"打印机未连接，已跳过"）
+Step = Tuple[str, Callable[[], Optional[str]], bool]
+
+_lock = threading.Lock()
+_steps: "OrderedDict[str, dict]" = OrderedDict()
+_state = "starting"  # starting / warming / ready / failed
+_started: Optional[float] = None
+_finished: Optional[float] = None
+_ready = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+def start(steps: List[Step]):
+    """
+    在后台线程中执行预热步骤
+
+    Args:
+        steps: 预热步骤（按顺序执行）
+    """
+    global _state, _started, _finished, _thread
+    with _lock:
+        _steps.clear()
+        for name, _, required in steps:
+            _steps[name] = {"state": "pending", "required": required, "seconds": None, "note": None, "error": None}
+        _state = "warming"
+        _started = time.time()
+        _finished = None
+    _ready.clear()
+    metrics.set_gauge("warmup.ready", 0)
+    _thread = threading.Thread(target=_run, args=(steps,), name="warmup", daemon=True)
+    _thread.start()
+
+
+def _run(steps: List[Step]):
+    """预热线程：依次执行各步骤"""
+    global _state, _finished
+    for name, func, _ in steps:
+        with _lock:
+            _steps[name]["state"] = "running"
+        t0 = time.perf_counter()
+        try:
+            note = func()
+            outcome = {"state": "done", "note": note}
+        except Exception as e:
+            logging.error(f"预热失败: {name}: {e}")
+            outcome = {"state": "failed", "error": str(e)}
+        seconds = time.perf_counter() - t0
+        metrics.observe(f"warmup.{name}_seconds", seconds)
+        with _lock:
+            _steps[name].update(outcome, seconds=round(seconds, 3))
+
+    with _lock:
+        failed = [name for name, step in _steps.items() if step["required"] and step["state"] == "failed"]
+        _state = "failed" if failed else "ready"
+        _finished = time.time()
+        elapsed = _finished - _started
+    if failed:
+        logging.error(f"预热未完成，服务保持未就绪: {', '.join(failed)}")
+        return
+    metrics.set_gauge("warmup.ready", 1)
+    _ready.set()
+    logging.info(f"预热完成，服务已就绪（{elapsed:.2f}秒）")
+
+
+def is_ready() -> bool:
+    """必需的预热步骤是否已全部完成"""
+    return _ready.is_set()
+
+
+def wait_ready(timeout: float = None) -> bool:
+    """
+    等待预热完成
+
+    Returns:
+        是否已就绪（超时或必需步骤失败时为 False）
+    """
+    return _ready.wait(timeout)
+
+
+def snapshot() -> dict:
+    """
+    就绪状态
+
+    Returns:
+        {"ready", "state", "started", "finished", "steps"}；
+        steps 为各步骤的 state（pending / running / done / failed）、required、seconds、note、error
+    """
+    with _lock:
+        return {
+            "ready": _ready.is_set(),
+            "state": _state,
+            "started": _started,
+            "finished": _finished,
+            "steps": {name: dict(step) for name, step in _steps.items()},
+        }